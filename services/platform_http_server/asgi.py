@@ -0,0 +1,171 @@
+"""Async serving mode: HTTP and gRPC on one asyncio event loop.
+
+Connections are handled by uvicorn on the event loop, so idle keep-alive
+connections cost a socket and a few objects, not a thread. Only requests in
+flight borrow a thread from a bounded pool to run the Flask app.
+"""
+
+import asyncio
+from concurrent import futures
+import io
+import sys
+from typing import List
+from typing import Tuple
+
+from absl import logging
+import uvicorn
+
+# How long idle keep-alive connections are kept open. Browsers keep their
+# connections to an HMI open for a long time, so this is much longer than the
+# uvicorn default of 5 seconds.
+KEEP_ALIVE_TIMEOUT_SECONDS = 120
+
+
+class WsgiBridge:
+  """ASGI app running a WSGI app in a bounded thread pool.
+
+  The WSGI app is called, and its response bodies are iterated, in the pool,
+  which is where they may block, e.g. on page faults of memory-mapped content.
+  Body chunks are sent as they are, memoryviews included, without copies.
+  """
+
+  def __init__(self, wsgi_app, executor: futures.Executor):
+    self._wsgi_app = wsgi_app
+    self._executor = executor
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http":
+      raise ValueError(f"Unsupported ASGI scope type '{scope['type']}'.")
+    environ = _build_environ(scope, await _read_body(receive))
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+      del exc_info  # Unused, nothing is sent before the app returns.
+      started[:] = [status, headers]
+      return _unsupported_write
+
+    def call_app():
+      iterable = self._wsgi_app(environ, start_response)
+      # WSGI apps may defer start_response until the first chunk of the body
+      # is produced, so that has to happen in the pool too.
+      iterator = iter(iterable)
+      first_chunk = next(iterator, b"")
+      return iterable, iterator, first_chunk
+
+    loop = asyncio.get_running_loop()
+    iterable, iterator, first_chunk = await loop.run_in_executor(
+        self._executor, call_app
+    )
+    try:
+      status, headers = started
+      await send({
+          "type": "http.response.start",
+          "status": int(status.split(" ", 1)[0]),
+          "headers": _encode_headers(headers),
+      })
+      chunk = first_chunk
+      while chunk is not None:
+        if chunk:
+          await send({
+              "type": "http.response.body",
+              "body": chunk,
+              "more_body": True,
+          })
+        chunk = await loop.run_in_executor(self._executor, next, iterator, None)
+      await send({"type": "http.response.body", "body": b""})
+    finally:
+      if hasattr(iterable, "close"):
+        # Runs the app's teardown, which may block like the app itself.
+        await loop.run_in_executor(self._executor, iterable.close)
+
+
+def _unsupported_write(data):
+  raise NotImplementedError("The WSGI write() callable is not supported.")
+
+
+async def _read_body(receive) -> bytes:
+  chunks = []
+  while True:
+    message = await receive()
+    if message["type"] == "http.disconnect":
+      break
+    chunks.append(message.get("body", b""))
+    if not message.get("more_body", False):
+      break
+  return b"".join(chunks)
+
+
+def _encode_headers(headers: List[Tuple[str, str]]):
+  return [
+      (name.lower().encode("latin-1"), value.encode("latin-1"))
+      for name, value in headers
+  ]
+
+
+def _build_environ(scope, body: bytes):
+  """Returns the WSGI environ for the request in the ASGI 'scope'."""
+  server_host, server_port = scope.get("server") or ("localhost", 80)
+  environ = {
+      "REQUEST_METHOD": scope["method"],
+      "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+      "PATH_INFO": scope["path"].encode().decode("latin-1"),
+      "QUERY_STRING": scope["query_string"].decode("latin-1"),
+      "SERVER_NAME": server_host,
+      "SERVER_PORT": str(server_port),
+      "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+      "wsgi.version": (1, 0),
+      "wsgi.url_scheme": scope.get("scheme", "http"),
+      "wsgi.input": io.BytesIO(body),
+      "wsgi.errors": sys.stderr,
+      "wsgi.multithread": True,
+      "wsgi.multiprocess": False,
+      "wsgi.run_once": False,
+  }
+  if scope.get("client"):
+    environ["REMOTE_ADDR"], environ["REMOTE_PORT"] = (
+        scope["client"][0],
+        str(scope["client"][1]),
+    )
+  for raw_name, raw_value in scope["headers"]:
+    name = raw_name.decode("latin-1").upper().replace("-", "_")
+    value = raw_value.decode("latin-1")
+    if name == "CONTENT_TYPE" or name == "CONTENT_LENGTH":
+      key = name
+    else:
+      key = f"HTTP_{name}"
+    if key in environ:
+      # Repeated headers are combined, as in any WSGI server.
+      value = f"{environ[key]},{value}"
+    environ[key] = value
+  # The whole body has been read already, so its length is known even for
+  # chunked requests.
+  environ["CONTENT_LENGTH"] = str(len(body))
+  environ["wsgi.input_terminated"] = True
+  return environ
+
+
+async def serve(asgi_app, grpc_server, host: str, port: int):
+  """Runs 'asgi_app' and the grpc.aio 'grpc_server' until shut down.
+
+  Args:
+    asgi_app: The ASGI app serving HTTP.
+    grpc_server: A grpc.aio server with its servicers and ports added.
+    host: The interface to serve HTTP on.
+    port: The port to serve HTTP on.
+  """
+  await grpc_server.start()
+  config = uvicorn.Config(
+      asgi_app,
+      host=host,
+      port=port,
+      lifespan="off",
+      timeout_keep_alive=KEEP_ALIVE_TIMEOUT_SECONDS,
+      # absl logging is configured by the server already.
+      log_config=None,
+      access_log=False,
+  )
+  try:
+    logging.info(f"Serving HTTP and gRPC on one event loop, HTTP port {port}.")
+    await uvicorn.Server(config).serve()
+  finally:
+    await grpc_server.stop(grace=None)
@@ -0,0 +1,262 @@
+"""In-memory representation of the files served from a data asset.
+
+Every file is prepared once, when its data asset is loaded, so that the
+request path only has to pick the right pre-built representation and its
+pre-built headers instead of doing any work on the bytes or the metadata.
+"""
+
+import dataclasses
+import gzip
+import hashlib
+import mimetypes
+import threading
+from typing import Dict
+from typing import Mapping
+from typing import Optional
+from typing import Tuple
+import weakref
+
+from absl import logging
+import brotli
+from services.platform_http_server import preload_links
+from werkzeug.utils import get_content_type
+
+# Content codings in the order of preference when a client accepts several of
+# them with the same quality.
+SUPPORTED_ENCODINGS = ("br", "gzip")
+
+# Served on '/', the first one a data asset contains wins.
+INDEX_FILES = ("index.html", "hello_world.html")
+
+DEFAULT_MIME_TYPE = "application/octet-stream"
+
+# Security-enhancing headers sent with every response. They mitigate common
+# web vulnerabilities.
+SECURITY_HEADERS = (
+    # Prevents clickjacking attacks.
+    ("X-Frame-Options", "SAMEORIGIN"),
+    # Prevents browsers from MIME-sniffing the content type.
+    ("X-Content-Type-Options", "nosniff"),
+    # A robust Content Security Policy to prevent XSS.
+    ("Content-Security-Policy", "default-src 'self'"),
+    # Controls how much referrer information is sent.
+    ("Referrer-Policy", "strict-origin-when-cross-origin"),
+)
+
+# A list of (name, value) header pairs.
+Headers = Tuple[Tuple[str, str], ...]
+
+# Files smaller than this are not worth compressing: the saved bytes do not
+# make up for the extra header and the decompression on the client.
+_MIN_COMPRESSIBLE_SIZE = 256
+
+_COMPRESSIBLE_MIME_TYPES = frozenset({
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/wasm",
+    "application/xml",
+    "image/svg+xml",
+})
+
+
+@dataclasses.dataclass(frozen=True)
+class AssetFile:
+  """A single file of a data asset, ready to be served.
+
+  Attributes:
+    content: The raw bytes of the file.
+    digest: Hex-encoded hash of 'content', the base of the file's entity tags.
+    encodings: Maps a content coding (e.g. 'br' or 'gzip') to the file content
+      compressed with it. Only holds codings that make the file smaller.
+    mime_type: The validated MIME type of the file.
+    preload_links: For HTML pages, the Link header values preloading the
+      page's scripts and stylesheets. Derived from 'content'.
+    headers: Maps each content coding in 'encodings', and None for the raw
+      bytes, to the full set of static response headers of that
+      representation. Derived from the other attributes.
+  """
+
+  content: bytes
+  digest: str
+  encodings: Mapping[str, bytes] = dataclasses.field(default_factory=dict)
+  mime_type: str = DEFAULT_MIME_TYPE
+  preload_links: Tuple[str, ...] = dataclasses.field(
+      init=False, repr=False, compare=False
+  )
+  headers: Mapping[Optional[str], Headers] = dataclasses.field(
+      init=False, repr=False, compare=False
+  )
+
+  def __post_init__(self):
+    # Frozen dataclasses can only set derived fields through object.
+    object.__setattr__(
+        self,
+        "preload_links",
+        preload_links.find_preload_links(self.content)
+        if self.mime_type == "text/html"
+        else (),
+    )
+    object.__setattr__(
+        self,
+        "headers",
+        {
+            encoding: self._build_headers(encoding)
+            for encoding in (None, *self.encodings)
+        },
+    )
+
+  def _build_headers(self, encoding: Optional[str]) -> Headers:
+    headers = [
+        ("Content-Type", get_content_type(self.mime_type, "utf-8")),
+        ("ETag", f'"{self.etag(encoding)}"'),
+    ]
+    if encoding:
+      headers.append(("Content-Encoding", encoding))
+    else:
+      headers.append(("Accept-Ranges", "bytes"))
+    if self.encodings:
+      # Caches must not hand a compressed body to a client that cannot
+      # decode it, even when this particular response is uncompressed.
+      headers.append(("Vary", "Accept-Encoding"))
+    if self.preload_links:
+      headers.append(("Link", ", ".join(self.preload_links)))
+    return tuple(headers) + SECURITY_HEADERS
+
+  @property
+  def resident_bytes(self) -> int:
+    """The number of bytes held in memory for the file and its variants."""
+    return len(self.content) + sum(
+        len(body) for body in self.encodings.values()
+    )
+
+  def etag(self, encoding: Optional[str] = None) -> str:
+    """Returns the strong entity tag of the representation using 'encoding'.
+
+    Each content coding is a different representation of the file, so each one
+    gets its own tag.
+    """
+    if encoding:
+      return f"{self.digest}-{encoding}"
+    return self.digest
+
+
+class ContentMap(Dict[str, AssetFile]):
+  """Maps the paths of a data asset's files to the prepared files.
+
+  Attributes:
+    index_path: The path of the file served on '/', or None if there is none.
+  """
+
+  __slots__ = ("index_path",)
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.index_path = next((path for path in INDEX_FILES if path in self), None)
+
+
+def guess_mime_type(path: str) -> str:
+  """Returns the MIME type of the file at 'path', safe to send in a header."""
+  mime_type, _ = mimetypes.guess_type(path)
+  if not mime_type:
+    return DEFAULT_MIME_TYPE
+  if "\r" in mime_type or "\n" in mime_type:
+    logging.error(f"Invalid characters detected in mime type for path: {path}")
+    return DEFAULT_MIME_TYPE
+  return mime_type
+
+
+def is_compressible(mime_type: str) -> bool:
+  """Returns whether 'mime_type' is a text-like format worth compressing."""
+  return mime_type.startswith("text/") or mime_type in _COMPRESSIBLE_MIME_TYPES
+
+
+def compress(content: bytes) -> Dict[str, bytes]:
+  """Compresses 'content' with every supported coding that makes it smaller."""
+  candidates = {
+      "br": brotli.compress(content, quality=11),
+      "gzip": gzip.compress(content, compresslevel=9, mtime=0),
+  }
+  return {
+      encoding: candidates[encoding]
+      for encoding in SUPPORTED_ENCODINGS
+      if len(candidates[encoding]) < len(content)
+  }
+
+
+def content_digest(content: bytes) -> str:
+  """Returns the hex-encoded hash identifying 'content'."""
+  return hashlib.sha256(content).hexdigest()[:32]
+
+
+def build_asset_file(
+    path: str, content: bytes, digest: Optional[str] = None
+) -> AssetFile:
+  """Prepares the file at 'path' for serving, precompressing it if useful."""
+  digest = digest or content_digest(content)
+  mime_type = guess_mime_type(path)
+  encodings = {}
+  if len(content) >= _MIN_COMPRESSIBLE_SIZE and is_compressible(mime_type):
+    encodings = compress(content)
+  return AssetFile(
+      content=content, digest=digest, encodings=encodings, mime_type=mime_type
+  )
+
+
+class BlobStore:
+  """Content-addressed store sharing prepared files across data assets.
+
+  Files with the same content and MIME type map to a single AssetFile, so their
+  bytes, digest and compressed variants are held and computed only once, no
+  matter how many data assets contain them. Entries are weakly referenced and
+  disappear with the last content map that uses them.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    # Maps (digest, MIME type) to the shared AssetFile.
+    self._files = weakref.WeakValueDictionary()
+
+  def __len__(self) -> int:
+    return len(self._files)
+
+  @property
+  def resident_bytes(self) -> int:
+    """The number of bytes held in memory for all distinct files."""
+    with self._lock:
+      return sum(
+          asset_file.resident_bytes for asset_file in self._files.values()
+      )
+
+  def intern(self, path: str, content: bytes) -> AssetFile:
+    """Returns the shared AssetFile for the file at 'path' with 'content'."""
+    digest = content_digest(content)
+    key = (digest, guess_mime_type(path))
+    with self._lock:
+      asset_file = self._files.get(key)
+    if asset_file is None:
+      # Compression happens outside of the lock. If two threads race on the
+      # same content, the first one to finish wins.
+      asset_file = build_asset_file(path, content, digest)
+      with self._lock:
+        asset_file = self._files.setdefault(key, asset_file)
+    return asset_file
+
+
+def build_content_map(
+    files: Mapping[str, bytes], blob_store: Optional[BlobStore] = None
+) -> ContentMap:
+  """Prepares every file of a data asset, keyed by its path inside the asset.
+
+  If 'blob_store' is given, files are shared with all other content maps built
+  with the same store.
+  """
+  if blob_store is None:
+    return ContentMap(
+        (path, build_asset_file(path, content))
+        for path, content in files.items()
+    )
+  return ContentMap(
+      (path, blob_store.intern(path, content))
+      for path, content in files.items()
+  )
@@ -0,0 +1,114 @@
+"""Polls the installed data assets and reacts to new, updated and removed ones.
+
+Each poll fetches only a fingerprint of what is installed: the version of every
+data asset, by ID. That is one small metadata call, so it can run every few
+seconds. The expensive part, fetching and unpacking data, only happens once the
+fingerprint differs from what is loaded.
+"""
+
+import threading
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Mapping
+from typing import Optional
+
+from absl import logging
+
+# Maps data asset IDs to their versions.
+Fingerprint = Mapping[str, str]
+
+
+class AssetWatcher:
+  """Background thread comparing installed and loaded data asset versions.
+
+  When the installed versions differ from the loaded ones, 'on_change' is
+  called once for that fingerprint. It is not called again until the installed
+  versions change once more, so an asset that fails to load is not retried in
+  every poll.
+  """
+
+  def __init__(
+      self,
+      list_installed: Callable[[], Fingerprint],
+      list_loaded: Callable[[], Fingerprint],
+      on_change: Callable[[], Any],
+      interval_seconds: float,
+  ):
+    """Initializes the watcher.
+
+    Args:
+      list_installed: Returns the versions of the installed data assets.
+      list_loaded: Returns the versions of the loaded data assets.
+      on_change: Applies the changes, e.g. by scheduling a reload.
+      interval_seconds: The time between the end of a poll and the next one.
+    """
+    self._list_installed = list_installed
+    self._list_loaded = list_loaded
+    self._on_change = on_change
+    self._interval_seconds = interval_seconds
+    self._stop = threading.Event()
+    self._thread: Optional[threading.Thread] = None
+    self._lock = threading.Lock()
+    self._last_fingerprint: Optional[Dict[str, str]] = None
+    self._polls = 0
+    self._changes_detected = 0
+    self._last_poll_at: Optional[float] = None
+    self._last_error: Optional[str] = None
+
+  def start(self):
+    """Starts polling in a daemon thread."""
+    self._thread = threading.Thread(
+        target=self._run, name="asset-watcher", daemon=True
+    )
+    self._thread.start()
+    logging.info(
+        f"Watching installed data assets every {self._interval_seconds}s."
+    )
+
+  def stop(self):
+    """Stops polling and waits for a poll in progress to finish."""
+    self._stop.set()
+    if self._thread is not None:
+      self._thread.join()
+
+  def status(self) -> Dict[str, Any]:
+    """Returns counters describing the polls so far."""
+    with self._lock:
+      return {
+          "interval_seconds": self._interval_seconds,
+          "polls": self._polls,
+          "changes_detected": self._changes_detected,
+          "last_poll_at": self._last_poll_at,
+          "last_error": self._last_error,
+      }
+
+  def poll(self) -> bool:
+    """Polls once and returns whether a change was detected."""
+    installed = dict(self._list_installed())
+    with self._lock:
+      self._polls += 1
+      self._last_poll_at = time.time()
+      self._last_error = None
+      if installed == self._last_fingerprint:
+        return False
+      self._last_fingerprint = installed
+    if installed == dict(self._list_loaded()):
+      return False
+
+    with self._lock:
+      self._changes_detected += 1
+    logging.info("Installed data assets changed, applying the changes.")
+    self._on_change()
+    return True
+
+  def _run(self):
+    while not self._stop.wait(self._interval_seconds):
+      try:
+        self.poll()
+      except Exception as e:
+        # The next poll tries again, e.g. once the ingress is reachable.
+        logging.warning(f"Polling the installed data assets failed: {e}")
+        with self._lock:
+          self._last_error = str(e)
@@ -0,0 +1,504 @@
+"""Load test and benchmark of the platform HTTP server.
+
+Starts the server in-process against a fake data assets service that serves
+synthetic data assets of configurable size and count, loads them through the
+regular reload path and drives the server with concurrent keep-alive clients.
+For every scenario it reports throughput, p50/p99 latency and the resident
+memory of the process, and optionally stores the results as JSON so that runs
+can be compared.
+
+The clients share the interpreter with the server, so the numbers are meant for
+comparing two versions of the server on the same machine, not as absolute
+capacity figures.
+
+Usage:
+  bazel run //services/platform_http_server:benchmark -- \
+      --duration_seconds=5 --output=/tmp/after.json --baseline=/tmp/before.json
+"""
+
+from concurrent import futures
+import http.client
+import json
+import logging
+import math
+import os
+import platform
+import resource
+import socket
+import sys
+import threading
+import time
+
+from absl import app
+from absl import flags
+from absl import logging as absl_logging
+from intrinsic.assets.data.proto.v1 import data_asset_pb2
+from intrinsic.assets.data.proto.v1 import referenced_data_struct_pb2
+from services.platform_http_server import asgi
+from services.platform_http_server import server
+import uvicorn
+from waitress import create_server
+
+_PACKAGE = "ai.intrinsic"
+_VERSION = "1.0.0"
+_LARGE_FILE_PATH = "media/large.bin"
+
+FLAGS = flags.FLAGS
+flags.DEFINE_float(
+    "duration_seconds", 3.0, "How long to send requests for each scenario."
+)
+flags.DEFINE_integer(
+    "concurrency", 8, "The number of concurrent client connections."
+)
+flags.DEFINE_integer(
+    "threads", 8, "The number of worker threads of the server."
+)
+flags.DEFINE_bool(
+    "async_serving",
+    False,
+    "Serve with uvicorn and the ASGI bridge instead of waitress.",
+)
+flags.DEFINE_integer(
+    "asset_count", 2, "The number of synthetic data assets, at least 2."
+)
+flags.DEFINE_integer(
+    "files_per_asset", 100, "The number of small files per data asset."
+)
+flags.DEFINE_integer(
+    "small_file_bytes", 2048, "The size of each small file, in bytes."
+)
+flags.DEFINE_integer(
+    "large_file_bytes",
+    4 * 1024 * 1024,
+    "The size of the one large file of each data asset, in bytes.",
+)
+flags.DEFINE_float(
+    "reconfigure_interval_seconds",
+    0.05,
+    "The time between two /reconfigure calls in the reconfigure scenario.",
+)
+flags.DEFINE_list("scenarios", [], "The scenarios to run, all if empty.")
+flags.DEFINE_string(
+    "output", "", "If set, the results are written to this JSON file."
+)
+flags.DEFINE_string(
+    "baseline",
+    "",
+    "If set, a JSON file of an earlier run to compare the results with.",
+)
+
+# Name, path and request headers of each scenario. A header value of None is
+# replaced by the ETag of the file.
+_SCENARIOS = (
+    ("index", "/", {}),
+    ("small_file", "/static/file_0.css", {}),
+    ("small_file_gzip", "/static/file_0.css", {"Accept-Encoding": "gzip, br"}),
+    ("not_modified", "/static/file_0.css", {"If-None-Match": None}),
+    ("large_file", f"/{_LARGE_FILE_PATH}", {}),
+    # Serves '/' while the active data asset is switched continuously.
+    ("reconfigure_under_load", "/", {}),
+)
+
+
+def _asset_id(index):
+  return f"{_PACKAGE}.benchmark_{index}"
+
+
+def _make_files(asset_index):
+  """Returns the files of one synthetic data asset.
+
+  The content differs between data assets, so that they do not share memory
+  through the server's blob store.
+  """
+  marker = f"/* asset {asset_index} */\n".encode()
+  line = b"body { color: #333; margin: 0; padding: 0; }\n"
+  small = marker + line * (FLAGS.small_file_bytes // len(line) + 1)
+  files = {
+      "index.html": b"<html><body>Benchmark %d</body></html>" % asset_index,
+      _LARGE_FILE_PATH: os.urandom(FLAGS.large_file_bytes),
+  }
+  for file_index in range(FLAGS.files_per_asset):
+    prefix = f"/* file {file_index} */\n".encode()
+    files[f"static/file_{file_index}.css"] = (prefix + small)[
+        : FLAGS.small_file_bytes
+    ]
+  return files
+
+
+def _make_data_asset(asset_index):
+  """Returns a ReferencedDataStruct data asset holding synthetic files."""
+  rds = referenced_data_struct_pb2.ReferencedDataStruct()
+  for path, content in _make_files(asset_index).items():
+    rds.fields[path].referenced_data_value.inlined = content
+  asset = data_asset_pb2.DataAsset()
+  asset.metadata.id_version.id.package = _PACKAGE
+  asset.metadata.id_version.id.name = f"benchmark_{asset_index}"
+  asset.metadata.id_version.version = _VERSION
+  asset.data.Pack(rds)
+  return asset
+
+
+class FakeDataAssetsService:
+  """Serves synthetic data assets in place of data_asset_utils.DataAssetsService.
+
+  Implements the methods the server calls, without any RPCs.
+  """
+
+  def __init__(self, asset_count):
+    self._assets = [_make_data_asset(i) for i in range(asset_count)]
+
+  def list_data_assets(self, proto_name=None):
+    del proto_name  # Unused, all assets hold ReferencedDataStructs.
+    return list(self._assets)
+
+  def list_data_asset_metadata(self, proto_name=None):
+    del proto_name  # Unused, all assets hold ReferencedDataStructs.
+    return [asset.metadata for asset in self._assets]
+
+  def get_data_asset(self, package, name):
+    for asset in self._assets:
+      asset_id = asset.metadata.id_version.id
+      if asset_id.package == package and asset_id.name == name:
+        return asset
+    raise KeyError(f"Unknown data asset '{package}.{name}'.")
+
+
+def _rss_bytes():
+  """Returns the resident set size of the process, or None if unknown."""
+  try:
+    with open("/proc/self/statm") as statm:
+      return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+  except (OSError, ValueError):
+    return None
+
+
+def _peak_rss_bytes():
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Linux reports kilobytes, macOS bytes.
+  return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _format_mib(num_bytes):
+  return f"{num_bytes / 2**20:.0f}" if num_bytes is not None else "n/a"
+
+
+def _load_assets():
+  """Loads the synthetic data assets through the server's reload path.
+
+  Returns:
+    The seconds the reload took.
+  """
+  fake_service = FakeDataAssetsService(FLAGS.asset_count)
+  server.data_asset_utils.DataAssetsService = lambda: fake_service
+  with server.update_lock:
+    server.update_snapshot(active_asset_id=_asset_id(0))
+  start = time.perf_counter()
+  server._reload_assets_and_enable_service()
+  return time.perf_counter() - start
+
+
+def _encode_request(method, path, headers, body=b""):
+  lines = [f"{method} {path} HTTP/1.1", "Host: 127.0.0.1"]
+  lines.extend(f"{name}: {value}" for name, value in headers.items())
+  if body:
+    lines.append(f"Content-Length: {len(body)}")
+  return ("\r\n".join(lines) + "\r\n\r\n").encode() + body
+
+
+def _receive_response(sock, buffer):
+  """Reads one response from 'sock'.
+
+  Returns:
+    A tuple of the status code and whether the server keeps the connection
+    open.
+
+  Parses no more of the response than needed to find its end, so that the
+  clients take as little CPU time as possible away from the server.
+  """
+  while True:
+    header_end = buffer.find(b"\r\n\r\n")
+    if header_end >= 0:
+      break
+    buffer.extend(_receive(sock))
+  header = bytes(buffer[:header_end]).lower()
+  length_start = header.find(b"content-length:")
+  body_length = 0
+  if length_start >= 0:
+    length_end = header.find(b"\r\n", length_start)
+    body_length = int(header[length_start + 15 : length_end])
+  response_end = header_end + 4 + body_length
+  while len(buffer) < response_end:
+    buffer.extend(_receive(sock))
+  del buffer[:response_end]
+  return int(header[9:12]), b"\r\nconnection: close" not in header
+
+
+def _receive(sock):
+  data = sock.recv(256 * 1024)
+  if not data:
+    raise RuntimeError("The server closed the connection.")
+  return data
+
+
+class _Client:
+  """Sends requests over keep-alive connections, reconnecting when needed."""
+
+  def __init__(self, port):
+    self._port = port
+    self._sock = None
+    self._buffer = bytearray()
+
+  def send(self, request_bytes):
+    """Sends one request and returns the status code of its response."""
+    if self._sock is None:
+      # Waitress closes the connection after some responses, e.g. 304s.
+      self._sock = socket.create_connection(("127.0.0.1", self._port))
+      self._buffer = bytearray()
+    self._sock.sendall(request_bytes)
+    status, keep_alive = _receive_response(self._sock, self._buffer)
+    if not keep_alive:
+      self.close()
+    return status
+
+  def close(self):
+    if self._sock is not None:
+      self._sock.close()
+      self._sock = None
+
+
+def _run_client(port, request_bytes, deadline, latencies, errors):
+  """Sends requests until 'deadline', recording the latency of each."""
+  client = _Client(port)
+  try:
+    while time.monotonic() < deadline:
+      start = time.perf_counter()
+      status = client.send(request_bytes)
+      latencies.append(time.perf_counter() - start)
+      if status not in (200, 304):
+        errors.append(status)
+  finally:
+    client.close()
+
+
+def _reconfigure_continuously(port, stop):
+  """Switches the active data asset back and forth until 'stop' is set.
+
+  Returns:
+    The number of /reconfigure calls that failed.
+  """
+  client = _Client(port)
+  failures = 0
+  index = 0
+  try:
+    while not stop.wait(FLAGS.reconfigure_interval_seconds):
+      index = (index + 1) % FLAGS.asset_count
+      body = json.dumps({"data_asset_id": _asset_id(index)}).encode()
+      request_bytes = _encode_request(
+          "POST",
+          "/reconfigure",
+          {"Content-Type": "application/json"},
+          body,
+      )
+      if client.send(request_bytes) != 200:
+        failures += 1
+  finally:
+    client.close()
+  return failures
+
+
+def _percentile(sorted_values, fraction):
+  """Returns the nearest-rank percentile of a sorted, non-empty list."""
+  rank = max(1, math.ceil(fraction * len(sorted_values)))
+  return sorted_values[rank - 1]
+
+
+def _run_scenario(port, name, path, headers):
+  """Runs one scenario and returns its results."""
+  request_bytes = _encode_request("GET", path, headers)
+  latencies = [[] for _ in range(FLAGS.concurrency)]
+  errors = []
+  start = time.monotonic()
+  deadline = start + FLAGS.duration_seconds
+  clients = [
+      threading.Thread(
+          target=_run_client,
+          args=(port, request_bytes, deadline, latencies[i], errors),
+      )
+      for i in range(FLAGS.concurrency)
+  ]
+  stop_reconfiguring = threading.Event()
+  reconfigure_executor = futures.ThreadPoolExecutor(max_workers=1)
+  reconfigure_failures = None
+  if name == "reconfigure_under_load":
+    reconfigure_failures = reconfigure_executor.submit(
+        _reconfigure_continuously, port, stop_reconfiguring
+    )
+  for client in clients:
+    client.start()
+  for client in clients:
+    client.join()
+  elapsed = time.monotonic() - start
+  stop_reconfiguring.set()
+  reconfigure_executor.shutdown()
+
+  all_latencies = sorted(l for client in latencies for l in client)
+  result = {
+      "scenario": name,
+      "path": path,
+      "requests": len(all_latencies),
+      "errors": len(errors),
+      "requests_per_second": len(all_latencies) / elapsed,
+      "latency_ms": {
+          "p50": _percentile(all_latencies, 0.5) * 1000,
+          "p99": _percentile(all_latencies, 0.99) * 1000,
+          "max": all_latencies[-1] * 1000,
+      },
+      "rss_bytes": _rss_bytes(),
+  }
+  if reconfigure_failures is not None:
+    result["reconfigure_failures"] = reconfigure_failures.result()
+  return result
+
+
+def _etag(port, path):
+  connection = http.client.HTTPConnection("127.0.0.1", port)
+  connection.request("GET", path)
+  response = connection.getresponse()
+  response.read()
+  connection.close()
+  return response.getheader("ETag")
+
+
+def _start_waitress():
+  """Starts waitress in a thread and returns its port and a stop function."""
+  http_server = create_server(
+      server.app, host="127.0.0.1", port=0, threads=FLAGS.threads
+  )
+  threading.Thread(target=http_server.run, daemon=True).start()
+  return http_server.effective_port, http_server.close
+
+
+def _start_uvicorn():
+  """Starts uvicorn in a thread and returns its port and a stop function."""
+  executor = futures.ThreadPoolExecutor(max_workers=FLAGS.threads)
+  config = uvicorn.Config(
+      asgi.WsgiBridge(server.app, executor),
+      host="127.0.0.1",
+      port=0,
+      lifespan="off",
+      timeout_keep_alive=asgi.KEEP_ALIVE_TIMEOUT_SECONDS,
+      log_config=None,
+      access_log=False,
+  )
+  http_server = uvicorn.Server(config)
+  thread = threading.Thread(target=http_server.run, daemon=True)
+  thread.start()
+  while not http_server.started:
+    time.sleep(0.01)
+
+  def stop():
+    http_server.should_exit = True
+    thread.join()
+    executor.shutdown()
+
+  port = http_server.servers[0].sockets[0].getsockname()[1]
+  return port, stop
+
+
+def _print_comparison(results, baseline_path):
+  """Prints the change of every scenario relative to an earlier run."""
+  with open(baseline_path) as baseline_file:
+    baseline = {
+        result["scenario"]: result
+        for result in json.load(baseline_file)["results"]
+    }
+  print(f"\nCompared to {baseline_path}:")
+  for result in results:
+    before = baseline.get(result["scenario"])
+    if before is None:
+      continue
+    throughput = (
+        result["requests_per_second"] / before["requests_per_second"] - 1
+    )
+    p99 = result["latency_ms"]["p99"] / before["latency_ms"]["p99"] - 1
+    print(
+        f"{result['scenario']:<24} {throughput:>+8.1%} req/s {p99:>+8.1%} p99"
+    )
+
+
+def main(argv):
+  del argv  # Unused.
+  if FLAGS.asset_count < 2:
+    raise app.UsageError("--asset_count must be at least 2.")
+  if not FLAGS["verbosity"].present:
+    # The server logs every loaded file and every reconfiguration.
+    absl_logging.set_verbosity(absl_logging.WARNING)
+  scenarios = [
+      scenario
+      for scenario in _SCENARIOS
+      if not FLAGS.scenarios or scenario[0] in FLAGS.scenarios
+  ]
+
+  rss_before_load = _rss_bytes()
+  load_seconds = _load_assets()
+  report = {
+      "started_at": time.time(),
+      "python": platform.python_version(),
+      "flags": {
+          name: FLAGS[name].value
+          for name in (
+              "duration_seconds",
+              "concurrency",
+              "threads",
+              "async_serving",
+              "asset_count",
+              "files_per_asset",
+              "small_file_bytes",
+              "large_file_bytes",
+              "reconfigure_interval_seconds",
+          )
+      },
+      "load": {
+          "seconds": load_seconds,
+          "rss_bytes_before": rss_before_load,
+          "rss_bytes_after": _rss_bytes(),
+      },
+      "results": [],
+  }
+  print(
+      f"Loaded {FLAGS.asset_count} data assets in {load_seconds:.2f}s,"
+      f" RSS {_format_mib(report['load']['rss_bytes_after'])} MiB."
+  )
+
+  port, stop = _start_uvicorn() if FLAGS.async_serving else _start_waitress()
+  try:
+    print(f"{'scenario':<24} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} RSS MiB")
+    for name, path, headers in scenarios:
+      headers = {
+          key: value if value is not None else _etag(port, path)
+          for key, value in headers.items()
+      }
+      result = _run_scenario(port, name, path, headers)
+      report["results"].append(result)
+      print(
+          f"{name:<24} {result['requests_per_second']:>8.0f}"
+          f" {result['latency_ms']['p50']:>8.2f}"
+          f" {result['latency_ms']['p99']:>8.2f}"
+          f" {_format_mib(result['rss_bytes']):>7}"
+      )
+  finally:
+    stop()
+  report["peak_rss_bytes"] = _peak_rss_bytes()
+
+  if FLAGS.output:
+    with open(FLAGS.output, "w") as output_file:
+      json.dump(report, output_file, indent=2)
+    print(f"\nResults written to {FLAGS.output}.")
+  if FLAGS.baseline:
+    _print_comparison(report["results"], FLAGS.baseline)
+
+
+if __name__ == "__main__":
+  # Waitress warns about every queued request, which is the point here.
+  logging.getLogger("waitress.queue").setLevel(logging.ERROR)
+  app.run(main)
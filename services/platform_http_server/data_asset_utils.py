@@ -10,6 +10,7 @@ from intrinsic.assets.data.proto.v1 import data_asset_pb2
 from intrinsic.assets.data.proto.v1 import data_assets_pb2
 from intrinsic.assets.data.proto.v1 import data_assets_pb2_grpc
 from intrinsic.assets.proto import id_pb2
+from intrinsic.assets.proto import metadata_pb2
 
 
 def create_insecure_channel(
@@ -59,10 +60,24 @@ class DataAssetsService:
     response = self._stub.ListDataAssets(list_data_assets_request)
     return response.data_assets
 
-
-def get_data_asset(self, package: str, name: str) -> data_asset_pb2.DataAsset:
-  return self._stub.GetDataAsset(
-      data_assets_pb2.GetDataAssetRequest(
-          id=id_pb2.Id(package=package, name=name)
+  def list_data_asset_metadata(
+      self, proto_name: str | None = None
+  ) -> List[metadata_pb2.Metadata]:
+    """Lists the metadata of the installed data assets, without their data."""
+    if proto_name is None:
+      request = data_assets_pb2.ListDataAssetMetadataRequest()
+    else:
+      request = data_assets_pb2.ListDataAssetMetadataRequest(
+          strict_filter=data_assets_pb2.DataAssetFilter(
+              proto_name=proto_name,
+          )
       )
-  )
+    response = self._stub.ListDataAssetMetadata(request)
+    return response.metadata
+
+  def get_data_asset(self, package: str, name: str) -> data_asset_pb2.DataAsset:
+    return self._stub.GetDataAsset(
+        data_assets_pb2.GetDataAssetRequest(
+            id=id_pb2.Id(package=package, name=name)
+        )
+    )
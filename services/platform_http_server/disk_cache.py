@@ -0,0 +1,204 @@
+"""Persistent, content-addressed on-disk copy of the loaded data assets.
+
+The cache directory holds one blob file per distinct file content, named by
+its digest, plus one file per precompressed variant. A JSON manifest maps each
+data asset and version to the blobs of its files. Blobs are memory-mapped when
+the snapshot is loaded, so a restarted server can serve right away without
+reading every file into memory or compressing anything again.
+
+Every file is synced to disk before it is renamed into place, and the manifest
+is written last, so that a power loss never leaves a manifest pointing at
+blobs that are incomplete. The manifest also records the size of every blob,
+and a snapshot whose blobs don't match is not loaded.
+"""
+
+import json
+import mmap
+import os
+import threading
+from typing import Dict
+from typing import Mapping
+from typing import Optional
+from typing import Tuple
+
+from absl import logging
+from services.platform_http_server import asset_files
+
+_MANIFEST_NAME = "manifest.json"
+_BLOBS_DIR_NAME = "blobs"
+_FORMAT_VERSION = 2
+
+AllAssetsContent = Dict[str, asset_files.ContentMap]
+
+
+def _sync_directory(directory: str) -> None:
+  """Syncs the entries of 'directory', e.g. files renamed into it, to disk."""
+  fd = os.open(directory, os.O_RDONLY)
+  try:
+    os.fsync(fd)
+  finally:
+    os.close(fd)
+
+
+def _write_atomically(path: str, data, sync_directory: bool = True) -> None:
+  """Writes 'data' to 'path' so that readers never see a partial file.
+
+  The content is on disk before the file appears under 'path'. The rename
+  itself is only durable once the directory is synced, which callers writing
+  many files may do once for all of them by passing sync_directory=False.
+  """
+  tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+  with open(tmp_path, "wb") as fout:
+    fout.write(data)
+    fout.flush()
+    os.fsync(fout.fileno())
+  os.replace(tmp_path, path)
+  if sync_directory:
+    _sync_directory(os.path.dirname(path))
+
+
+def _file_size(path: str) -> Optional[int]:
+  """Returns the size of the file at 'path', or None if it doesn't exist."""
+  try:
+    return os.path.getsize(path)
+  except FileNotFoundError:
+    return None
+
+
+def _map_file(path: str):
+  """Memory-maps the file at 'path' read-only."""
+  with open(path, "rb") as fin:
+    if os.fstat(fin.fileno()).st_size == 0:
+      # Empty files cannot be mapped.
+      return b""
+    return mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class SnapshotDiskCache:
+  """Stores and restores the content of the loaded data assets on disk."""
+
+  def __init__(self, directory: str):
+    self._directory = directory
+    self._blobs_dir = os.path.join(directory, _BLOBS_DIR_NAME)
+    self._manifest_path = os.path.join(directory, _MANIFEST_NAME)
+    self._lock = threading.Lock()
+
+  def _blob_path(self, digest: str, encoding: Optional[str] = None) -> str:
+    name = f"{digest}.{encoding}" if encoding else digest
+    return os.path.join(self._blobs_dir, name)
+
+  def load(self) -> Optional[Tuple[AllAssetsContent, Dict[str, str]]]:
+    """Restores the last saved snapshot with memory-mapped file contents.
+
+    Returns:
+      A tuple of the content maps by asset ID and the versions by asset ID, or
+      None if there is no usable snapshot.
+    """
+    try:
+      with open(self._manifest_path, "r") as fin:
+        manifest = json.load(fin)
+      if manifest.get("format") != _FORMAT_VERSION:
+        logging.warning("Ignoring snapshot cache with an unknown format.")
+        return None
+
+      # Files with the same content share one mapping.
+      mapped = {}
+
+      def map_blob(digest, size, encoding=None):
+        path = self._blob_path(digest, encoding)
+        if path not in mapped:
+          mapped[path] = _map_file(path)
+        if len(mapped[path]) != size:
+          raise ValueError(
+              f"blob {os.path.basename(path)} has {len(mapped[path])} bytes,"
+              f" expected {size}"
+          )
+        return mapped[path]
+
+      all_assets_content = {}
+      asset_versions = {}
+      for asset_id, asset in manifest["assets"].items():
+        all_assets_content[asset_id] = asset_files.ContentMap(
+            (
+                path,
+                asset_files.AssetFile(
+                    content=map_blob(entry["digest"], entry["size"]),
+                    digest=entry["digest"],
+                    encodings={
+                        encoding: map_blob(entry["digest"], size, encoding)
+                        for encoding, size in entry["encodings"].items()
+                    },
+                    mime_type=asset_files.guess_mime_type(path),
+                ),
+            )
+            for path, entry in asset["files"].items()
+        )
+        asset_versions[asset_id] = asset["version"]
+    except FileNotFoundError:
+      logging.info(f"No snapshot cache found in '{self._directory}'.")
+      return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+      logging.warning(f"Ignoring unreadable snapshot cache: {e}")
+      return None
+
+    logging.info(
+        f"Restored {len(all_assets_content)} data assets from the snapshot"
+        f" cache in '{self._directory}'."
+    )
+    return all_assets_content, asset_versions
+
+  def save(
+      self,
+      all_assets_content: Mapping[str, asset_files.ContentMap],
+      asset_versions: Mapping[str, str],
+  ) -> None:
+    """Persists the given content maps, writing only blobs not on disk yet.
+
+    Blobs on disk whose size doesn't match, e.g. left incomplete by a crash,
+    are written again. Blobs that are no longer referenced by any data asset
+    are deleted.
+    """
+    with self._lock:
+      os.makedirs(self._blobs_dir, exist_ok=True)
+      manifest_assets = {}
+      referenced = set()
+      for asset_id, content_map in all_assets_content.items():
+        files = {}
+        for path, asset_file in content_map.items():
+          representations = {None: asset_file.content, **asset_file.encodings}
+          for encoding, body in representations.items():
+            blob_path = self._blob_path(asset_file.digest, encoding)
+            referenced.add(os.path.basename(blob_path))
+            if _file_size(blob_path) != len(body):
+              _write_atomically(blob_path, body, sync_directory=False)
+          files[path] = {
+              "digest": asset_file.digest,
+              "size": len(asset_file.content),
+              "encodings": {
+                  encoding: len(body)
+                  for encoding, body in asset_file.encodings.items()
+              },
+          }
+        manifest_assets[asset_id] = {
+            "version": asset_versions.get(asset_id, ""),
+            "files": files,
+        }
+
+      # The blobs must be durable before the manifest that refers to them.
+      _sync_directory(self._blobs_dir)
+      _write_atomically(
+          self._manifest_path,
+          json.dumps(
+              {"format": _FORMAT_VERSION, "assets": manifest_assets}
+          ).encode(),
+      )
+
+      for name in os.listdir(self._blobs_dir):
+        if name not in referenced:
+          # Files still mapped by a running server stay readable until they
+          # are unmapped.
+          os.remove(os.path.join(self._blobs_dir, name))
+    logging.info(
+        f"Saved {len(manifest_assets)} data assets to the snapshot cache in"
+        f" '{self._directory}'."
+    )
@@ -0,0 +1,178 @@
+"""Lazy, memory-budgeted access to the content of data assets.
+
+In lazy mode the server only lists which data assets are installed. The files
+of a data asset are fetched on the first request for it and kept in an LRU
+cache whose total size is bounded by a byte budget.
+"""
+
+import collections
+import threading
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import Mapping
+from typing import Optional
+from typing import Tuple
+
+from absl import logging
+from services.platform_http_server import asset_files
+
+ContentMap = asset_files.ContentMap
+# Identifies one version of a data asset: (data asset ID, version).
+AssetKey = Tuple[str, str]
+
+
+def content_map_size(content_map: ContentMap) -> int:
+  """Returns the number of bytes held in memory for 'content_map'."""
+  return sum(asset_file.resident_bytes for asset_file in content_map.values())
+
+
+class ContentCache:
+  """Thread-safe LRU cache of content maps, bounded by a byte budget.
+
+  Content maps are fetched with 'fetch' on a miss. Concurrent misses for the
+  same data asset share a single fetch. A content map larger than the whole
+  budget is pinned outside of it instead, so that it is fetched only once,
+  until retain() drops it with its version.
+  """
+
+  def __init__(
+      self,
+      budget_bytes: int,
+      fetch: Callable[[str], Optional[ContentMap]],
+  ):
+    """Initializes the cache.
+
+    Args:
+      budget_bytes: Upper bound of the total size of the cached content maps.
+      fetch: Returns the content map of the data asset with the given ID, or
+        None if the data asset cannot be served.
+    """
+    self._budget_bytes = budget_bytes
+    self._fetch = fetch
+    self._lock = threading.Lock()
+    # Maps AssetKeys to (content map, size in bytes), least recent first.
+    self._entries = collections.OrderedDict()
+    self._fetch_locks: Dict[AssetKey, threading.Lock] = {}
+    self._resident_bytes = 0
+    # Maps AssetKeys to (content map, size in bytes) of the content maps
+    # larger than the budget, which are never evicted.
+    self._pinned: Dict[AssetKey, Tuple[ContentMap, int]] = {}
+
+  @property
+  def resident_bytes(self) -> int:
+    """The total size of the cached content maps within the budget."""
+    return self._resident_bytes
+
+  def cached_keys(self) -> Tuple[AssetKey, ...]:
+    """Returns the keys of the cached content maps, least recent first."""
+    with self._lock:
+      return tuple(self._entries)
+
+  def cached_sizes(self) -> Dict[AssetKey, int]:
+    """Returns the sizes in bytes of the cached content maps, by key."""
+    with self._lock:
+      return {key: size for key, (_, size) in self._entries.items()}
+
+  def pinned_sizes(self) -> Dict[AssetKey, int]:
+    """Returns the sizes in bytes of the pinned oversized content maps."""
+    with self._lock:
+      return {key: size for key, (_, size) in self._pinned.items()}
+
+  def _lookup(self, key: AssetKey) -> Optional[ContentMap]:
+    with self._lock:
+      pinned = self._pinned.get(key)
+      if pinned is not None:
+        return pinned[0]
+      entry = self._entries.get(key)
+      if entry is None:
+        return None
+      self._entries.move_to_end(key)
+      return entry[0]
+
+  def get(self, key: AssetKey) -> Optional[ContentMap]:
+    """Returns the content map for 'key', fetching it on a miss."""
+    content_map = self._lookup(key)
+    if content_map is not None:
+      return content_map
+
+    with self._lock:
+      fetch_lock = self._fetch_locks.setdefault(key, threading.Lock())
+    with fetch_lock:
+      # Another thread may have fetched it while this one was waiting.
+      content_map = self._lookup(key)
+      if content_map is None:
+        logging.info(f"Fetching content of data asset '{key[0]}'...")
+        content_map = self._fetch(key[0])
+        if content_map is not None:
+          self._insert(key, content_map)
+    with self._lock:
+      self._fetch_locks.pop(key, None)
+    return content_map
+
+  def _insert(self, key: AssetKey, content_map: ContentMap):
+    size = content_map_size(content_map)
+    if size > self._budget_bytes:
+      logging.warning(
+          f"Data asset '{key[0]}' ({size} bytes) exceeds the content cache"
+          f" budget of {self._budget_bytes} bytes. It is pinned in memory"
+          " outside of the budget until it is uninstalled or updated."
+      )
+      with self._lock:
+        self._pinned[key] = (content_map, size)
+      return
+    with self._lock:
+      if key in self._entries:
+        return
+      self._entries[key] = (content_map, size)
+      self._resident_bytes += size
+      # The new entry is the most recent one and fits the budget on its own,
+      # so it is never evicted here.
+      while self._resident_bytes > self._budget_bytes:
+        evicted_key, (_, evicted_size) = self._entries.popitem(last=False)
+        self._resident_bytes -= evicted_size
+        logging.info(
+            f"Evicted data asset '{evicted_key[0]}' ({evicted_size} bytes)"
+            " from the content cache."
+        )
+
+  def retain(self, keys: Iterable[AssetKey]):
+    """Drops every cached content map whose key is not in 'keys'."""
+    keys = set(keys)
+    with self._lock:
+      for key in [key for key in self._entries if key not in keys]:
+        _, size = self._entries.pop(key)
+        self._resident_bytes -= size
+      for key in [key for key in self._pinned if key not in keys]:
+        del self._pinned[key]
+
+
+class LazyAssetsContent(Mapping[str, ContentMap]):
+  """Maps data asset IDs to content maps that are fetched on first access.
+
+  The set of data assets and their versions are fixed at construction, so an
+  instance can be part of an immutable serving snapshot while the content
+  itself comes and goes in the shared ContentCache.
+  """
+
+  def __init__(self, cache: ContentCache, asset_versions: Mapping[str, str]):
+    self._cache = cache
+    self._asset_versions = dict(asset_versions)
+
+  def __getitem__(self, asset_id: str) -> ContentMap:
+    version = self._asset_versions[asset_id]
+    content_map = self._cache.get((asset_id, version))
+    if content_map is None:
+      raise KeyError(asset_id)
+    return content_map
+
+  def __contains__(self, asset_id: object) -> bool:
+    # Checking for an asset must not fetch its content.
+    return asset_id in self._asset_versions
+
+  def __iter__(self) -> Iterator[str]:
+    return iter(self._asset_versions)
+
+  def __len__(self) -> int:
+    return len(self._asset_versions)
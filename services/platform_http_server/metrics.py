@@ -0,0 +1,288 @@
+"""Low-overhead metrics in the Prometheus text exposition format.
+
+Recording a value on the request path takes no lock: every thread writes to
+its own shard of counters, and the shards are only merged when the metrics are
+scraped. Reading another thread's shard while it is being written is safe
+because copying a dict or a list is atomic under the GIL. Once a thread ends,
+its shard is folded into a shared total, so short-lived threads don't pile up.
+"""
+
+import bisect
+import itertools
+import threading
+import time
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import Sequence
+from typing import Tuple
+import weakref
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Label values, in the order of the metric's label names.
+Labels = Tuple[str, ...]
+
+# Bucket upper bounds for request latencies, in seconds.
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+
+class _Metric:
+  """Base class of the metric types."""
+
+  type_name = ""
+
+  def __init__(
+      self, registry: "Registry", name: str, help_text: str, label_names
+  ):
+    self._registry = registry
+    self.name = name
+    self.help_text = help_text
+    self.label_names = tuple(label_names)
+
+  def _format_labels(self, labels: Labels, extra: str = "") -> str:
+    pairs = [
+        f'{name}="{_escape(value)}"'
+        for name, value in zip(self.label_names, labels)
+    ]
+    if extra:
+      pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(_Metric):
+  """A value that only goes up, summed over all threads."""
+
+  type_name = "counter"
+
+  def inc(self, labels: Labels = (), value: float = 1) -> None:
+    values = self._registry._thread_values()
+    key = (self, labels)
+    values[key] = values.get(key, 0) + value
+
+  def _render(self, merged: Mapping[Labels, float]) -> List[str]:
+    return [
+        f"{self.name}{self._format_labels(labels)} {str(value)}"
+        for labels, value in sorted(merged.items())
+    ]
+
+
+class Gauge(Counter):
+  """A value that goes up and down, summed over all threads.
+
+  A thread may decrement what another thread incremented; only the sum over
+  all threads is meaningful.
+  """
+
+  type_name = "gauge"
+
+  def dec(self, labels: Labels = (), value: float = 1) -> None:
+    self.inc(labels, -value)
+
+
+class Histogram(_Metric):
+  """Counts observed values in buckets, per thread."""
+
+  type_name = "histogram"
+
+  def __init__(self, registry, name, help_text, label_names, buckets):
+    super().__init__(registry, name, help_text, label_names)
+    self.buckets = tuple(sorted(buckets))
+
+  def observe(self, value: float, labels: Labels = ()) -> None:
+    values = self._registry._thread_values()
+    key = (self, labels)
+    counts = values.get(key)
+    if counts is None:
+      # One count per bucket, one for +Inf, then the sum of all values.
+      counts = values[key] = [0] * (len(self.buckets) + 2)
+    counts[bisect.bisect_left(self.buckets, value)] += 1
+    counts[-1] += value
+
+  def _render(self, merged: Mapping[Labels, List[float]]) -> List[str]:
+    lines = []
+    for labels, counts in sorted(merged.items()):
+      cumulative = 0
+      for bound, count in zip(self.buckets + ("+Inf",), counts):
+        cumulative += count
+        le = f'le="{bound}"'
+        lines.append(
+            f"{self.name}_bucket{self._format_labels(labels, le)} {cumulative}"
+        )
+      formatted_labels = self._format_labels(labels)
+      lines.append(f"{self.name}_sum{formatted_labels} {counts[-1]}")
+      lines.append(f"{self.name}_count{formatted_labels} {cumulative}")
+    return lines
+
+
+class CallbackGauge(_Metric):
+  """A gauge whose values are computed by a callable on every scrape."""
+
+  type_name = "gauge"
+
+  def __init__(self, registry, name, help_text, label_names, callback):
+    super().__init__(registry, name, help_text, label_names)
+    self._callback = callback
+
+  def _render(self, merged) -> List[str]:
+    del merged  # Unused, nothing is recorded per thread.
+    return [
+        f"{self.name}{self._format_labels(labels)} {str(value)}"
+        for labels, value in sorted(self._callback().items())
+    ]
+
+
+class _ThreadToken:
+  """Lives in a thread's local storage, which drops it when the thread ends."""
+
+
+class Registry:
+  """Holds the metrics and the per-thread shards of their values."""
+
+  def __init__(self):
+    self._metrics: List[_Metric] = []
+    self._local = threading.local()
+    # Reentrant, since a shard may be retired by the garbage collector while
+    # the same thread holds the lock.
+    self._lock = threading.RLock()
+    self._shard_ids = itertools.count()
+    # The value shards of the running threads that recorded a value, by ID.
+    self._shards: Dict[int, Dict] = {}
+    # The values of the threads that ended, so that counters never go down.
+    self._retired: Dict = {}
+
+  def _thread_values(self) -> Dict:
+    try:
+      return self._local.values
+    except AttributeError:
+      values = self._local.values = {}
+      token = self._local.token = _ThreadToken()
+      with self._lock:
+        shard_id = next(self._shard_ids)
+        self._shards[shard_id] = values
+      weakref.finalize(token, self._retire, shard_id)
+      return values
+
+  def _retire(self, shard_id: int) -> None:
+    """Folds the shard of a thread that ended into the retired values."""
+    with self._lock:
+      values = self._shards.pop(shard_id, None)
+      if values is not None:
+        _add_values(self._retired, values)
+
+  def _add(self, metric):
+    with self._lock:
+      self._metrics.append(metric)
+    return metric
+
+  def counter(self, name: str, help_text: str, label_names=()) -> Counter:
+    return self._add(Counter(self, name, help_text, label_names))
+
+  def gauge(self, name: str, help_text: str, label_names=()) -> Gauge:
+    return self._add(Gauge(self, name, help_text, label_names))
+
+  def histogram(
+      self,
+      name: str,
+      help_text: str,
+      label_names=(),
+      buckets: Sequence[float] = LATENCY_BUCKETS,
+  ) -> Histogram:
+    return self._add(Histogram(self, name, help_text, label_names, buckets))
+
+  def callback_gauge(
+      self,
+      name: str,
+      help_text: str,
+      label_names,
+      callback: Callable[[], Mapping[Labels, float]],
+  ) -> CallbackGauge:
+    """Adds a gauge whose values by labels 'callback' returns on scrape."""
+    return self._add(
+        CallbackGauge(self, name, help_text, label_names, callback)
+    )
+
+  def _merge(self) -> Dict[_Metric, Dict[Labels, object]]:
+    with self._lock:
+      totals = {}
+      _add_values(totals, self._retired)
+      shards = list(self._shards.values())
+    for shard in shards:
+      _add_values(totals, shard)
+    merged = {}
+    for (metric, labels), value in totals.items():
+      merged.setdefault(metric, {})[labels] = value
+    return merged
+
+  def render(self) -> str:
+    """Returns all metrics in the Prometheus text exposition format."""
+    merged = self._merge()
+    with self._lock:
+      metrics = list(self._metrics)
+    lines = []
+    for metric in metrics:
+      lines.append(f"# HELP {metric.name} {metric.help_text}")
+      lines.append(f"# TYPE {metric.name} {metric.type_name}")
+      lines.extend(metric._render(merged.get(metric, {})))
+    return "\n".join(lines) + "\n"
+
+
+class TimedLock:
+  """A lock recording how long every acquisition waited in a histogram."""
+
+  def __init__(self, histogram: Histogram, labels: Labels = ()):
+    self._lock = threading.Lock()
+    self._histogram = histogram
+    self._labels = labels
+
+  def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+    start = time.perf_counter()
+    acquired = self._lock.acquire(blocking, timeout)
+    self._histogram.observe(time.perf_counter() - start, self._labels)
+    return acquired
+
+  def release(self) -> None:
+    self._lock.release()
+
+  def locked(self) -> bool:
+    return self._lock.locked()
+
+  def __enter__(self):
+    self.acquire()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.release()
+
+
+def _add_values(totals: Dict, values: Dict) -> None:
+  """Adds the (metric, labels) -> value entries of 'values' to 'totals'."""
+  for key, value in dict(values).items():
+    if isinstance(value, list):
+      value = list(value)
+      total = totals.get(key)
+      if total is not None:
+        value = [a + b for a, b in zip(total, value)]
+    else:
+      value += totals.get(key, 0)
+    totals[key] = value
+
+
+def _escape(value: str) -> str:
+  return (
+      str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+  )
@@ -0,0 +1,114 @@
+"""Finds the scripts and stylesheets an HTML page needs, for Link preloads.
+
+Browsers discover the CSS and JavaScript of a page only while parsing its HTML,
+which costs an extra round trip before rendering can start. Announcing them in
+'Link: rel=preload' headers of the HTML response lets the browser, or a proxy
+turning the header into 103 Early Hints, fetch them right away. Pages are
+parsed once, when their data asset is loaded.
+"""
+
+import html.parser
+from typing import List
+from typing import Optional
+from typing import Tuple
+from urllib import parse
+
+# Keeps the Link header small; a page rarely needs more than a few bundles.
+MAX_PRELOAD_LINKS = 16
+
+# Characters kept as they are when quoting a URL for the Link header. Everything
+# else, including '<', '>', line breaks and non-ASCII, is percent-encoded.
+_URL_SAFE_CHARACTERS = "/:?#[]@!$&'()*+;=%-._~"
+
+
+class _ResourceParser(html.parser.HTMLParser):
+  """Collects the Link header values for the scripts and stylesheets."""
+
+  def __init__(self):
+    super().__init__(convert_charrefs=True)
+    self.links: List[str] = []
+    self.has_base = False
+
+  def handle_starttag(self, tag, attrs):
+    attributes = {name: value or "" for name, value in attrs}
+    if tag == "base" and "href" in attributes:
+      self.has_base = True
+    elif tag == "script":
+      self._add_script(attributes)
+    elif tag == "link":
+      self._add_stylesheet(attributes)
+
+  def _add_script(self, attributes):
+    if "nomodule" in attributes or "src" not in attributes:
+      return
+    if attributes.get("type", "").lower() == "module":
+      self._add(attributes["src"], "rel=modulepreload", attributes)
+    elif attributes.get("type", "").lower() in (
+        "",
+        "text/javascript",
+        "application/javascript",
+    ):
+      self._add(attributes["src"], "rel=preload; as=script", attributes)
+
+  def _add_stylesheet(self, attributes):
+    rels = attributes.get("rel", "").lower().split()
+    if "stylesheet" not in rels or "alternate" in rels:
+      return
+    if "disabled" in attributes:
+      return
+    self._add(attributes.get("href", ""), "rel=preload; as=style", attributes)
+
+  def _add(self, url, params, attributes):
+    url = _same_origin_url(url)
+    if url is None:
+      return
+    link = f"<{url}>; {params}"
+    if "crossorigin" in attributes:
+      # The preload has to use the same CORS mode as the actual request, or
+      # the browser fetches the resource twice.
+      link += "; crossorigin"
+    if link not in self.links:
+      self.links.append(link)
+
+
+def _same_origin_url(url: str) -> Optional[str]:
+  """Returns 'url' quoted for a Link header, or None if it is not same-origin."""
+  url = url.strip()
+  if not url or url.startswith("#"):
+    return None
+  parts = parse.urlsplit(url)
+  if parts.scheme or parts.netloc:
+    # Other origins, protocol-relative URLs and data: URLs.
+    return None
+  return parse.quote(url, safe=_URL_SAFE_CHARACTERS)
+
+
+def find_preload_links(html_content: bytes) -> Tuple[str, ...]:
+  """Returns the Link header values preloading the page's scripts and styles.
+
+  Only same-origin resources are preloaded. URLs are kept relative, as the
+  browser resolves them against the URL of the page just like the references
+  in the HTML. Pages with a <base> element are skipped, since their references
+  resolve against a different URL.
+
+  Args:
+    html_content: The bytes of an HTML page, expected to be UTF-8.
+
+  Returns:
+    Up to MAX_PRELOAD_LINKS values in document order, each for one resource.
+  """
+  lowered = bytes(html_content).lower()
+  if b"<script" not in lowered and b"stylesheet" not in lowered:
+    # Most pages of an asset reference nothing, and parsing is the slow part.
+    return ()
+  parser = _ResourceParser()
+  try:
+    parser.feed(bytes(html_content).decode("utf-8", errors="replace"))
+    parser.close()
+  except AssertionError:
+    # html.parser gives up on some malformed markup. Preloads are only an
+    # optimization, so the page is served without them.
+    return ()
+  if parser.has_base:
+    return ()
+  return tuple(parser.links[:MAX_PRELOAD_LINKS])
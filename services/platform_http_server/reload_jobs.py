@@ -0,0 +1,210 @@
+"""Background reload jobs that coalesce duplicate reload requests.
+
+Reloading the data assets is a round trip to the data assets service plus
+unpacking and precompressing every new file. Callers only request a reload and
+get a job back, which runs in a background thread and can be polled.
+
+Requests join the pending job if there is one. Otherwise they create a new
+pending job, which starts once the running job has finished. So there is at
+most one running and one pending job, a burst of requests costs at most two
+reloads, and every request is served by a job that started after it was made.
+"""
+
+import dataclasses
+import itertools
+import threading
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from absl import logging
+
+PENDING = "PENDING"
+RUNNING = "RUNNING"
+SUCCEEDED = "SUCCEEDED"
+FAILED = "FAILED"
+
+# Reports the progress of a running job: (phase, items done, items in total).
+ReportProgress = Callable[[str, int, int], None]
+
+
+@dataclasses.dataclass
+class ReloadJob:
+  """One reload, serving every request coalesced into it.
+
+  Attributes:
+    job_id: Identifies the job, increasing with every new job.
+    state: One of PENDING, RUNNING, SUCCEEDED and FAILED.
+    requests: The number of reload requests the job serves.
+    phase: What the running job currently does, e.g. 'loading'.
+    done: How many items of the current phase are done.
+    total: How many items the current phase has, 0 if unknown.
+    requested_at: When the job was created, in seconds since the epoch.
+    started_at: When the job started running, if it has.
+    finished_at: When the job finished, if it has.
+    phase_seconds: How long each finished phase took.
+    result: What the job returned, if it succeeded.
+    error: Why the job failed, if it did.
+  """
+
+  job_id: int
+  state: str = PENDING
+  requests: int = 1
+  phase: str = ""
+  done: int = 0
+  total: int = 0
+  requested_at: float = dataclasses.field(default_factory=time.time)
+  started_at: Optional[float] = None
+  finished_at: Optional[float] = None
+  phase_seconds: Dict[str, float] = dataclasses.field(default_factory=dict)
+  result: Any = None
+  error: Optional[str] = None
+  _phase_started: float = dataclasses.field(default=0.0, repr=False)
+
+  @property
+  def finished(self) -> bool:
+    return self.state in (SUCCEEDED, FAILED)
+
+  def to_dict(self) -> Dict[str, Any]:
+    """Returns the job as a JSON-serializable dict, with its timings."""
+    status = {
+        field.name: getattr(self, field.name)
+        for field in dataclasses.fields(self)
+        if not field.name.startswith("_")
+    }
+    status["phase_seconds"] = dict(self.phase_seconds)
+    if self.started_at is not None:
+      status["queued_seconds"] = self.started_at - self.requested_at
+    if self.finished_at is not None:
+      status["run_seconds"] = self.finished_at - self.started_at
+    return status
+
+
+class ReloadScheduler:
+  """Runs reload jobs one at a time in a background thread."""
+
+  def __init__(
+      self, run: Callable[[ReportProgress], Any], history_size: int = 20
+  ):
+    """Initializes the scheduler.
+
+    Args:
+      run: Performs a reload, reporting its progress through the given
+        callable. Its return value is kept as the job's result and has to be
+        JSON-serializable.
+      history_size: The number of finished jobs kept for status queries.
+    """
+    self._run = run
+    self._history_size = history_size
+    self._condition = threading.Condition()
+    self._job_ids = itertools.count(1)
+    # All known jobs, oldest first.
+    self._jobs: List[ReloadJob] = []
+    self._pending: Optional[ReloadJob] = None
+    self._worker: Optional[threading.Thread] = None
+
+  def request(self) -> Dict[str, Any]:
+    """Requests a reload and returns the status of the job serving it."""
+    with self._condition:
+      if self._pending is not None:
+        self._pending.requests += 1
+        return self._pending.to_dict()
+      job = ReloadJob(job_id=next(self._job_ids))
+      self._pending = job
+      self._jobs.append(job)
+      if self._worker is None:
+        self._worker = threading.Thread(
+            target=self._work, name="reload-worker", daemon=True
+        )
+        self._worker.start()
+      logging.info(f"Reload job {job.job_id} scheduled.")
+      return job.to_dict()
+
+  def jobs(self) -> List[Dict[str, Any]]:
+    """Returns the status of the known jobs, newest first."""
+    with self._condition:
+      return [job.to_dict() for job in reversed(self._jobs)]
+
+  def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+    """Returns the status of the job with 'job_id', or None if unknown."""
+    with self._condition:
+      job = self._find(job_id)
+      return job.to_dict() if job else None
+
+  def wait(
+      self, job_id: int, timeout: Optional[float] = None
+  ) -> Optional[Dict[str, Any]]:
+    """Waits for the job with 'job_id' to finish and returns its status.
+
+    Returns None if the job is unknown, and the status of the unfinished job if
+    'timeout' seconds passed first.
+    """
+    with self._condition:
+      job = self._find(job_id)
+      if job is None:
+        return None
+      self._condition.wait_for(lambda: job.finished, timeout)
+      return job.to_dict()
+
+  def _find(self, job_id: int) -> Optional[ReloadJob]:
+    for job in self._jobs:
+      if job.job_id == job_id:
+        return job
+    return None
+
+  def _work(self):
+    while True:
+      with self._condition:
+        job = self._pending
+        if job is None:
+          # Exits when idle. The next request starts a new worker.
+          self._worker = None
+          return
+        self._pending = None
+        job.state = RUNNING
+        job.started_at = time.time()
+        job._phase_started = job.started_at
+
+      try:
+        result = self._run(lambda *args: self._report(job, *args))
+      except (Exception, SystemExit) as e:
+        # SystemExit included: the loaders exit the process when nothing is
+        # installed, which must not end the worker thread silently.
+        logging.error(f"Reload job {job.job_id} failed: {e!r}", exc_info=True)
+        self._finish(job, FAILED, error=repr(e))
+      else:
+        self._finish(job, SUCCEEDED, result=result)
+
+  def _report(self, job: ReloadJob, phase: str, done: int = 0, total: int = 0):
+    with self._condition:
+      if phase != job.phase:
+        self._close_phase(job)
+        job.phase = phase
+      job.done = done
+      job.total = total
+
+  def _close_phase(self, job: ReloadJob):
+    now = time.time()
+    if job.phase:
+      job.phase_seconds[job.phase] = now - job._phase_started
+    job._phase_started = now
+
+  def _finish(self, job: ReloadJob, state: str, result=None, error=None):
+    with self._condition:
+      self._close_phase(job)
+      job.phase = ""
+      job.state = state
+      job.result = result
+      job.error = error
+      job.finished_at = time.time()
+      finished = [j for j in self._jobs if j.finished]
+      for old_job in finished[: -self._history_size]:
+        self._jobs.remove(old_job)
+      self._condition.notify_all()
+    logging.info(
+        f"Reload job {job.job_id} {state.lower()} after"
+        f" {job.finished_at - job.started_at:.2f}s."
+    )
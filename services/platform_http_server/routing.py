@@ -0,0 +1,108 @@
+"""Maps requests to the data assets serving them, by Host header and path.
+
+A routing table lets one server process serve several data assets at the same
+time, e.g. a different HMI for every station of a cell. Requests no route
+matches are served from the active data asset.
+"""
+
+import dataclasses
+from typing import Dict
+from typing import Iterable
+from typing import Optional
+from typing import Tuple
+
+
+@dataclasses.dataclass(frozen=True)
+class Route:
+  """Serves the requests matching 'host' and 'path_prefix' from one data asset.
+
+  Attributes:
+    data_asset_id: The ID of the data asset to serve.
+    path_prefix: Matches request paths equal to it or below it, on path segment
+      boundaries. Stored without leading and trailing slashes. Empty to match
+      every path.
+    host: Matches the Host header, compared without the port and case. Empty to
+      match every host.
+  """
+
+  data_asset_id: str
+  path_prefix: str = ""
+  host: str = ""
+
+
+def make_route(
+    data_asset_id: str, path_prefix: str = "", host: str = ""
+) -> Route:
+  """Returns a normalized Route.
+
+  Raises:
+    ValueError: If the route is incomplete or malformed.
+  """
+  if not data_asset_id:
+    raise ValueError("A route needs a 'data_asset_id'.")
+  path_prefix = path_prefix.strip("/")
+  segments = path_prefix.split("/")
+  if path_prefix and any(s in ("", ".", "..") for s in segments):
+    raise ValueError(f"Invalid path prefix '{path_prefix}'.")
+  return Route(
+      data_asset_id=data_asset_id,
+      path_prefix=path_prefix,
+      host=_normalize_host(host),
+  )
+
+
+def _normalize_host(host: str) -> str:
+  host = host.strip().lower()
+  if host.startswith("["):
+    # An IPv6 literal, e.g. '[::1]:8080'.
+    return host[: host.find("]") + 1]
+  return host.partition(":")[0]
+
+
+class RoutingTable:
+  """Immutable, precompiled lookup structure for a list of routes.
+
+  Routes for a specific host take precedence over routes for every host, and
+  longer path prefixes take precedence over shorter ones.
+  """
+
+  def __init__(self, routes: Iterable[Route] = ()):
+    self.routes = tuple(routes)
+    by_host: Dict[str, list] = {}
+    for route in self.routes:
+      by_host.setdefault(route.host, []).append(route)
+    # Maps a host ('' for every host) to its routes, longest prefix first.
+    self._by_host = {
+        host: tuple(
+            sorted(host_routes, key=lambda r: len(r.path_prefix), reverse=True)
+        )
+        for host, host_routes in by_host.items()
+    }
+
+  def __bool__(self) -> bool:
+    return bool(self.routes)
+
+  def resolve(self, host: str, path: str) -> Optional[Tuple[Route, str]]:
+    """Finds the route for a request.
+
+    Args:
+      host: The Host header of the request.
+      path: The request path without its leading slash.
+
+    Returns:
+      A tuple of the matching route and the path relative to its prefix, or
+      None if no route matches.
+    """
+    if not self._by_host:
+      return None
+    candidates = self._by_host.get(_normalize_host(host), ())
+    for routes in (candidates, self._by_host.get("", ())):
+      for route in routes:
+        prefix = route.path_prefix
+        if not prefix:
+          return route, path
+        if path == prefix:
+          return route, ""
+        if path.startswith(prefix) and path[len(prefix)] == "/":
+          return route, path[len(prefix) + 1 :]
+    return None
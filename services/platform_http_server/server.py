@@ -10,17 +10,24 @@ This server also implements the gRPC ServiceState servicer, allowing its lifecyc
 (enable/disable) to be managed by Flowstate, in addition to HTTP endpoints.
 """
 
+import asyncio
 from concurrent import futures
+import dataclasses
+import functools
 import json
-import mimetypes
 import os
 import pathlib
 import sys
 import threading
+import time
+from typing import List
+from typing import Mapping
+from typing import Optional
 
 from absl import logging
 from flask import Flask
 from flask import jsonify
+from flask import redirect
 from flask import request
 from flask import Response
 import grpc
@@ -29,13 +36,167 @@ from intrinsic.assets.data.proto.v1 import referenced_data_struct_pb2
 from intrinsic.assets.services.proto.v1 import service_state_pb2 as state_proto
 from intrinsic.assets.services.proto.v1 import service_state_pb2_grpc as state_grpc
 from intrinsic.resources.proto import runtime_context_pb2
+from services.platform_http_server import asgi
+from services.platform_http_server import asset_files
+from services.platform_http_server import asset_watcher
 from services.platform_http_server import data_asset_utils
+from services.platform_http_server import disk_cache
+from services.platform_http_server import lazy_assets
+from services.platform_http_server import metrics
 from services.platform_http_server import platform_http_server_pb2
+from services.platform_http_server import reload_jobs
+from services.platform_http_server import routing
 from waitress import serve
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.http import parse_accept_header
+from werkzeug.wsgi import ClosingIterator
 
 app = Flask(__name__)
-update_lock = threading.Lock()
-_SERVICE_STATE = {}
+# Served on /metrics. Recording a value takes no lock, see metrics.Registry.
+_metrics = metrics.Registry()
+_request_seconds = _metrics.histogram(
+    "platform_http_server_request_duration_seconds",
+    "Time until the response to a request was ready, by route.",
+    ("route",),
+)
+_responses = _metrics.counter(
+    "platform_http_server_responses_total",
+    "Responses sent, by route and status code.",
+    ("route", "code"),
+)
+_served_bytes = _metrics.counter(
+    "platform_http_server_served_bytes_total",
+    "Body bytes of file responses, by data asset.",
+    ("data_asset_id",),
+)
+_in_flight_requests = _metrics.gauge(
+    "platform_http_server_in_flight_requests",
+    "Requests being handled right now.",
+)
+_reload_seconds = _metrics.histogram(
+    "platform_http_server_reload_duration_seconds",
+    "Duration of the reload jobs, by result.",
+    ("result",),
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+_lock_wait_seconds = _metrics.histogram(
+    "platform_http_server_lock_wait_seconds",
+    "Time spent waiting to acquire a lock, by lock.",
+    ("lock",),
+    buckets=(1e-6, 1e-5, 1e-4, 0.001, 0.01, 0.1, 1, 10),
+)
+# Serializes writers of the serving snapshot. Readers never take it.
+update_lock = metrics.TimedLock(_lock_wait_seconds, ("update",))
+# Shares the files of all loaded data assets by content, see BlobStore.
+_blob_store = asset_files.BlobStore()
+# Set by main() in lazy mode, where data asset content is fetched on demand.
+_content_cache = None
+# Set by main() if loaded assets are persisted for fast restarts.
+_snapshot_disk_cache = None
+# Set by main() if the installed data assets are watched for changes.
+_asset_watcher = None
+# Whether an Enable request waits for a reload job to enable the service, and
+# the number of Disable requests so far. Both change under 'update_lock', see
+# _reload_assets_and_enable_service().
+_enable_requested = False
+_disable_count = 0
+
+# Content only changes on /enable or /reconfigure, so clients may keep it but
+# have to revalidate it, which is cheap thanks to the ETag.
+DEFAULT_CACHE_CONTROL = "no-cache"
+
+# Bodies of at least this many bytes are streamed in chunks rather than handed
+# to waitress in one piece, which would buffer the whole body per request.
+DEFAULT_STREAMING_THRESHOLD = 1024 * 1024
+_STREAM_CHUNK_SIZE = 256 * 1024
+
+# Only data assets holding this proto are served, so the others are filtered
+# out by the data assets service already.
+_REFERENCED_DATA_STRUCT_PROTO_NAME = (
+    referenced_data_struct_pb2.ReferencedDataStruct.DESCRIPTOR.full_name
+)
+
+# Default upper bound of the memory used for data asset content in lazy mode.
+DEFAULT_CONTENT_CACHE_BUDGET = 64 * 1024 * 1024
+
+# In async mode, the number of threads running requests and RPCs that may
+# block. Idle connections do not use one.
+_ASYNC_WORKER_THREADS = 16
+
+
+@dataclasses.dataclass
+class AssetChanges:
+  """What a data asset reload changed, as lists of data asset IDs."""
+
+  added: List[str] = dataclasses.field(default_factory=list)
+  updated: List[str] = dataclasses.field(default_factory=list)
+  removed: List[str] = dataclasses.field(default_factory=list)
+  unchanged: List[str] = dataclasses.field(default_factory=list)
+
+  def __str__(self):
+    return (
+        f"{len(self.added)} added, {len(self.updated)} updated,"
+        f" {len(self.removed)} removed, {len(self.unchanged)} unchanged"
+    )
+
+
+# Served while no data asset is active.
+_EMPTY_CONTENT = asset_files.ContentMap()
+
+
+@dataclasses.dataclass(frozen=True)
+class ServingSnapshot:
+  """Immutable view of everything the request path reads.
+
+  Writers build a new snapshot off to the side and publish it with a single
+  reference swap, so readers never block and never see a half-applied update.
+
+  Attributes:
+    state_code: The ServiceState state code of the service.
+    active_asset_id: The ID of the data asset serving requests that no route
+      matches.
+    all_assets_content: Maps data asset IDs to their content maps.
+    asset_versions: Maps data asset IDs to the version they were loaded at.
+    last_reload_changes: What the last data asset reload changed, if any.
+    routes: Maps requests to the data assets serving them.
+  """
+
+  state_code: int
+  active_asset_id: Optional[str] = None
+  all_assets_content: Mapping[str, asset_files.ContentMap] = dataclasses.field(
+      default_factory=dict
+  )
+  asset_versions: Mapping[str, str] = dataclasses.field(default_factory=dict)
+  last_reload_changes: Optional[AssetChanges] = None
+  routes: routing.RoutingTable = dataclasses.field(
+      default_factory=routing.RoutingTable
+  )
+
+  @property
+  def active_content(self) -> asset_files.ContentMap:
+    """The content map of the active data asset."""
+    return self.all_assets_content.get(self.active_asset_id, _EMPTY_CONTENT)
+
+
+_snapshot = ServingSnapshot(
+    state_code=state_proto.SelfState.STATE_CODE_DISABLED
+)
+
+
+def current_snapshot() -> ServingSnapshot:
+  """Returns the snapshot the request path reads from. Never blocks."""
+  return _snapshot
+
+
+def update_snapshot(**changes) -> ServingSnapshot:
+  """Publishes a copy of the current snapshot with 'changes' applied.
+
+  Must be called with 'update_lock' held, so that concurrent writers do not
+  lose each other's changes.
+  """
+  global _snapshot
+  _snapshot = dataclasses.replace(_snapshot, **changes)
+  return _snapshot
 
 
 def get_runtime_context():
@@ -49,58 +210,395 @@ def get_runtime_context():
     return runtime_context_pb2.RuntimeContext.FromString(fin.read())
 
 
-def load_assets_to_memory():
-  """Discovers all installed data assets and unpacks them into a dictionary."""
+def _unpack_asset(asset_id, asset):
+  """Unpacks the files of 'asset' into a content map, or returns None if the
+  asset does not hold a ReferencedDataStruct."""
+  # Check if the asset's data is of the expected type.
+  if "ReferencedDataStruct" not in asset.data.type_url:
+    logging.warning(
+        f"Skipping asset '{asset_id}' with unexpected data type:"
+        f" {asset.data.type_url}"
+    )
+    return None
+
+  rds = referenced_data_struct_pb2.ReferencedDataStruct()
+  asset.data.Unpack(rds)
+
+  content_map = asset_files.build_content_map(
+      {
+          filename: data_value.referenced_data_value.inlined
+          for filename, data_value in rds.fields.items()
+      },
+      _blob_store,
+  )
+
+  for filename, asset_file in content_map.items():
+    sizes = [f"{len(asset_file.content)} bytes"] + [
+        f"{encoding}: {len(body)} bytes"
+        for encoding, body in asset_file.encodings.items()
+    ]
+    logging.info(
+        f"  - Loaded '{filename}' ({', '.join(sizes)}) into memory for"
+        f" asset '{asset_id}'."
+    )
+  return content_map
+
+
+def _asset_id(metadata):
+  """Returns the ID used for the data asset with the given metadata."""
+  return f"{metadata.id_version.id.package}.{metadata.id_version.id.name}"
+
+
+def list_installed_versions(data_asset_service):
+  """
+  Returns the versions of the installed ReferencedDataStruct data assets by
+  asset ID. Only lists metadata, filtered by the service, which makes it cheap
+  enough to poll.
+  """
+  all_metadata = data_asset_service.list_data_asset_metadata(
+      proto_name=_REFERENCED_DATA_STRUCT_PROTO_NAME
+  )
+  return {
+      _asset_id(metadata): metadata.id_version.version
+      for metadata in all_metadata
+  }
+
+
+def reload_assets(known_versions, known_content, progress=None):
+  """Brings the in-memory copy of the installed data assets up to date.
+
+  Only assets whose id_version differs from 'known_versions' are fetched and
+  unpacked again. Unchanged assets reuse their content map from
+  'known_content' by reference, and assets that are no longer installed are
+  dropped. Assets without a version are always fetched again, as they cannot
+  be compared. The first load lists all assets with their data in one call.
+
+  Args:
+    known_versions: Maps data asset IDs to the version they were loaded at.
+    known_content: Maps data asset IDs to their loaded content maps.
+    progress: If given, called with the number of data assets processed and
+      their total number after each one.
+
+  Returns:
+    A tuple of the new content maps by asset ID, the new versions by asset ID
+    and the AssetChanges made.
+  """
   data_asset_service = data_asset_utils.DataAssetsService()
-  available_assets = data_asset_service.list_data_assets()
+  if known_content:
+    installed_versions = list_installed_versions(data_asset_service)
+
+    def fetch(asset_id):
+      package, name = asset_id.rsplit(".", 1)
+      return data_asset_service.get_data_asset(package, name)
+
+  else:
+    listed_assets = {
+        _asset_id(asset.metadata): asset
+        for asset in data_asset_service.list_data_assets(
+            proto_name=_REFERENCED_DATA_STRUCT_PROTO_NAME
+        )
+    }
+    installed_versions = {
+        asset_id: asset.metadata.id_version.version
+        for asset_id, asset in listed_assets.items()
+    }
+    fetch = listed_assets.get
 
-  if not available_assets:
+  if not installed_versions:
     logging.critical("No installed data assets found. Server cannot start.")
     sys.exit(1)
 
   logging.info(
-      f"Found {len(available_assets)} installed data assets. Unpacking to"
-      " memory..."
+      f"Found {len(installed_versions)} installed data assets. Unpacking"
+      " new and updated ones to memory..."
   )
 
   all_assets_content = {}
-  for asset in available_assets:
-    asset_id = f"{asset.metadata.id_version.id.package}.{asset.metadata.id_version.id.name}"
+  asset_versions = {}
+  changes = AssetChanges()
+  for index, (asset_id, version) in enumerate(installed_versions.items()):
+    if progress:
+      progress(index, len(installed_versions))
 
-    # Check if the asset's data is of the expected type.
-    if "ReferencedDataStruct" in asset.data.type_url:
-      rds = referenced_data_struct_pb2.ReferencedDataStruct()
-      asset.data.Unpack(rds)
+    if (
+        version
+        and known_versions.get(asset_id) == version
+        and asset_id in known_content
+    ):
+      all_assets_content[asset_id] = known_content[asset_id]
+      asset_versions[asset_id] = version
+      changes.unchanged.append(asset_id)
+      continue
 
-      content_map = {
-          filename: data_value.referenced_data_value.inlined
-          for filename, data_value in rds.fields.items()
-      }
+    content_map = _unpack_asset(asset_id, fetch(asset_id))
+    if content_map is None:
+      continue
+    all_assets_content[asset_id] = content_map
+    asset_versions[asset_id] = version
+    if asset_id in known_content:
+      changes.updated.append(asset_id)
+    else:
+      changes.added.append(asset_id)
 
-      for filename, content in content_map.items():
-        logging.info(
-            f"  - Loaded '{filename}' ({len(content)} bytes) into memory for"
-            f" asset '{asset_id}'."
-        )
+  changes.removed = sorted(set(known_content) - set(all_assets_content))
+  logging.info(f"Data assets reloaded: {changes}.")
+  logging.info(
+      f"{sum(len(content_map) for content_map in all_assets_content.values())}"
+      f" files loaded, {len(_blob_store)} distinct ones held in memory."
+  )
+  return all_assets_content, asset_versions, changes
+
+
+def reload_asset_metadata(content_cache, known_versions):
+  """Lazy-mode counterpart of reload_assets().
+
+  Lists only the metadata of the installed data assets. Their content is
+  fetched through 'content_cache' on the first request for it. Cached content
+  of assets that changed or were removed is dropped from the cache.
+
+  Args:
+    content_cache: The lazy_assets.ContentCache that holds fetched content.
+    known_versions: Maps data asset IDs to the version they were loaded at.
+
+  Returns:
+    A tuple of the lazily loaded content maps by asset ID, the new versions by
+    asset ID and the AssetChanges made.
+  """
+  asset_versions = list_installed_versions(data_asset_utils.DataAssetsService())
+
+  if not asset_versions:
+    logging.critical("No installed data assets found. Server cannot start.")
+    sys.exit(1)
 
-      all_assets_content[asset_id] = content_map
+  changes = AssetChanges()
+  for asset_id, version in asset_versions.items():
+    if asset_id not in known_versions:
+      changes.added.append(asset_id)
+    elif version and known_versions[asset_id] == version:
+      changes.unchanged.append(asset_id)
     else:
-      logging.warning(
-          f"Skipping asset '{asset_id}' with unexpected data type:"
-          f" {asset.data.type_url}"
-      )
+      changes.updated.append(asset_id)
+  changes.removed = sorted(set(known_versions) - set(asset_versions))
+
+  # Assets without a version cannot be compared, so their content is always
+  # fetched again.
+  content_cache.retain(
+      (asset_id, version)
+      for asset_id, version in asset_versions.items()
+      if version
+  )
+  logging.info(f"Data asset metadata reloaded: {changes}.")
+  all_assets_content = lazy_assets.LazyAssetsContent(
+      content_cache, asset_versions
+  )
+  return all_assets_content, asset_versions, changes
+
+
+def _make_content_cache(budget_bytes):
+  """Creates the content cache for lazy mode, fetching from the data assets
+  service."""
+  data_asset_service = data_asset_utils.DataAssetsService()
+
+  def fetch(asset_id):
+    package, name = asset_id.rsplit(".", 1)
+    return _unpack_asset(
+        asset_id, data_asset_service.get_data_asset(package, name)
+    )
+
+  return lazy_assets.ContentCache(budget_bytes, fetch)
+
+
+def _load_assets(known_versions, known_content, progress=None):
+  """Reloads the data assets, lazily if the server runs in lazy mode."""
+  if _content_cache is not None:
+    return reload_asset_metadata(_content_cache, known_versions)
+  return reload_assets(known_versions, known_content, progress=progress)
+
+
+def load_assets_to_memory():
+  """Discovers all installed data assets and unpacks them into a dictionary.
+
+  Compressible files are precompressed here, once per load, so that serving
+  them never costs any CPU on the request path.
+  """
+  all_assets_content, _, _ = reload_assets({}, {})
   return all_assets_content
 
 
-def _reload_assets_and_enable_service():
+def _reload_assets_and_enable_service(report=None):
   """
-  Helper to reload all data assets from disk and set the service state to ENABLED.
+  Helper to reload all data assets from disk and set the service state to
+  ENABLED if an Enable request was made before the reload started and no
+  Disable request came in since. Reloads started for other reasons, e.g. by
+  the asset watcher, keep the state the service is in when they activate.
+  The assets are loaded and warmed up without holding 'update_lock', so
+  requests keep being served from the previous snapshot until the new one is
+  published in a single swap. Only new and updated assets are unpacked, see
+  reload_assets().
+
+  Args:
+    report: If given, a reload_jobs.ReportProgress called as the reload
+      advances.
   """
-  logging.info("Reloading all data assets from disk...")
-  all_assets_content = load_assets_to_memory()
-  app.config["ALL_ASSETS_CONTENT"] = all_assets_content
-  _SERVICE_STATE["state_code"] = state_proto.SelfState.STATE_CODE_ENABLED
-  logging.info("Asset reload complete. Service is now ENABLED.")
+  global _enable_requested
+  report = report or (lambda phase, done=0, total=0: None)
+  logging.info("Reloading data assets from disk...")
+  with update_lock:
+    enable = _enable_requested
+    _enable_requested = False
+    disable_count = _disable_count
+  snapshot = current_snapshot()
+  report("loading")
+  all_assets_content, asset_versions, changes = _load_assets(
+      snapshot.asset_versions,
+      snapshot.all_assets_content,
+      progress=lambda done, total: report("loading", done, total),
+  )
+  report("warming")
+  _warm_up(all_assets_content)
+  report("activating")
+  with update_lock:
+    state_code = current_snapshot().state_code
+    if enable and disable_count == _disable_count:
+      state_code = state_proto.SelfState.STATE_CODE_ENABLED
+    update_snapshot(
+        all_assets_content=all_assets_content,
+        asset_versions=asset_versions,
+        last_reload_changes=changes,
+        state_code=state_code,
+    )
+  logging.info(
+      "Asset reload complete. Service is now"
+      f" {state_proto.SelfState.StateCode.Name(state_code)}."
+  )
+  report("saving")
+  _save_to_disk_cache(all_assets_content, asset_versions)
+  return changes
+
+
+def _warm_up(all_assets_content):
+  """
+  Fetches the content that is served right after activation, so that the
+  first requests do not wait for it. Only lazy mode has anything to fetch:
+  eagerly loaded content is hashed and precompressed while it is loaded.
+  """
+  if _content_cache is None:
+    return
+  snapshot = current_snapshot()
+  asset_ids = {snapshot.active_asset_id}
+  asset_ids.update(route.data_asset_id for route in snapshot.routes.routes)
+  for asset_id in sorted(asset_ids):
+    if asset_id in all_assets_content:
+      all_assets_content.get(asset_id)
+
+
+def _run_reload_job(report):
+  """Runs one reload job of '_reload_scheduler'."""
+  start = time.perf_counter()
+  result = "failed"
+  try:
+    changes = _reload_assets_and_enable_service(report)
+    result = "succeeded"
+  finally:
+    _reload_seconds.observe(time.perf_counter() - start, (result,))
+  return dataclasses.asdict(changes)
+
+
+# Runs reloads in the background, coalescing duplicate requests.
+_reload_scheduler = reload_jobs.ReloadScheduler(_run_reload_job)
+
+# Bounds of the delay between attempts to reconcile a restored snapshot.
+_RECONCILE_MIN_BACKOFF_SECONDS = 1.0
+_RECONCILE_MAX_BACKOFF_SECONDS = 60.0
+
+
+def _reconcile_restored_assets(sleep=time.sleep):
+  """
+  Reloads the data assets until a reload succeeds, doubling the delay between
+  attempts up to a bound. Runs after a snapshot was restored from the disk
+  cache, typically at a cold start when the data assets service may not be
+  reachable yet. Until a reload succeeds, the restored content is served.
+  """
+  backoff = _RECONCILE_MIN_BACKOFF_SECONDS
+  while True:
+    job = _reload_scheduler.request()
+    job = _reload_scheduler.wait(job["job_id"])
+    if job["state"] == reload_jobs.SUCCEEDED:
+      logging.info("Restored data assets are reconciled.")
+      return
+    logging.warning(
+        "Failed to reconcile the restored data assets, retrying in"
+        f" {backoff:.0f}s."
+    )
+    sleep(backoff)
+    backoff = min(2 * backoff, _RECONCILE_MAX_BACKOFF_SECONDS)
+
+
+def _request_enable():
+  """
+  Schedules a reload job that enables the service once it has reloaded the
+  data assets, and returns its status.
+  """
+  global _enable_requested
+  with update_lock:
+    _enable_requested = True
+  return _reload_scheduler.request()
+
+
+def _disable():
+  """
+  Disables the service. A reload job that is pending or running keeps the
+  service disabled, even if it was requested by an earlier Enable.
+  """
+  global _enable_requested, _disable_count
+  with update_lock:
+    _enable_requested = False
+    _disable_count += 1
+    update_snapshot(state_code=state_proto.SelfState.STATE_CODE_DISABLED)
+
+
+def _apply_installed_asset_changes():
+  """
+  Schedules a reload for changes found by the asset watcher. A disabled
+  service is left alone; the next Enable picks the changes up.
+  """
+  if current_snapshot().state_code == state_proto.SelfState.STATE_CODE_DISABLED:
+    logging.info("Service is disabled, not applying data asset changes.")
+    return
+  _reload_scheduler.request()
+
+
+def _make_asset_watcher(interval_seconds):
+  """
+  Creates the watcher polling the installed data assets for changes. The
+  channel to the data assets service is only created by the first poll, in the
+  watcher's thread, so that a slow ingress does not hold up startup. Failing
+  to connect fails the poll, and the next poll tries again.
+  """
+
+  # One channel for all polls, rather than a new one per poll. Not cached if
+  # creating it fails.
+  @functools.lru_cache(maxsize=None)
+  def data_asset_service():
+    return data_asset_utils.DataAssetsService()
+
+  return asset_watcher.AssetWatcher(
+      list_installed=lambda: list_installed_versions(data_asset_service()),
+      list_loaded=lambda: current_snapshot().asset_versions,
+      on_change=_apply_installed_asset_changes,
+      interval_seconds=interval_seconds,
+  )
+
+
+def _save_to_disk_cache(all_assets_content, asset_versions):
+  """Persists the loaded assets if a snapshot cache directory is configured."""
+  if _snapshot_disk_cache is None or _content_cache is not None:
+    # Nothing to persist in lazy mode, where content is not fully loaded.
+    return
+  try:
+    _snapshot_disk_cache.save(all_assets_content, asset_versions)
+  except OSError as e:
+    logging.error(f"Failed to save the snapshot cache: {e}")
 
 
 class PlatformHttpServicer(state_grpc.ServiceStateServicer):
@@ -108,66 +606,226 @@ class PlatformHttpServicer(state_grpc.ServiceStateServicer):
 
   def GetState(self, request, context):
     """Returns the current state of the service."""
-    with update_lock:
-      return state_proto.SelfState(state_code=_SERVICE_STATE["state_code"])
+    return state_proto.SelfState(state_code=current_snapshot().state_code)
 
   def Enable(self, request, context):
-    """Enables the service via gRPC call."""
-    with update_lock:
-      _reload_assets_and_enable_service()
-    logging.info("Service has been enabled via gRPC.")
+    """
+    Enables the service via gRPC call. Returns right away; the service is
+    enabled once the background reload job activates the reloaded assets.
+    """
+    job = _request_enable()
+    logging.info(f"Enable requested via gRPC, reload job {job['job_id']}.")
     return state_proto.EnableResponse()
 
   def Disable(self, request, context):
     """Disables the service via gRPC call."""
-    with update_lock:
-      _SERVICE_STATE["state_code"] = state_proto.SelfState.STATE_CODE_DISABLED
+    _disable()
     logging.info("Service has been disabled via gRPC.")
     return state_proto.DisableResponse()
 
 
+class AsyncPlatformHttpServicer(state_grpc.ServiceStateServicer):
+  """
+  Implements the gRPC ServiceState servicer on the event loop of the async
+  mode. RPCs that may block run in a worker thread.
+  """
+
+  def __init__(self, executor):
+    self._servicer = PlatformHttpServicer()
+    self._executor = executor
+
+  async def _run_in_executor(self, method, request, context):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(self._executor, method, request, context)
+
+  async def GetState(self, request, context):
+    """Returns the current state of the service."""
+    return self._servicer.GetState(request, context)
+
+  async def Enable(self, request, context):
+    """Enables the service via gRPC call."""
+    return await self._run_in_executor(self._servicer.Enable, request, context)
+
+  async def Disable(self, request, context):
+    """Disables the service via gRPC call."""
+    return await self._run_in_executor(self._servicer.Disable, request, context)
+
+
+# Where the WSGI environ holds the perf_counter() value of the request start.
+_REQUEST_STARTED_KEY = "platform_http_server.request_started"
+
+
+def _track_in_flight_requests(wsgi_app):
+  """
+  Wraps 'wsgi_app' to count the requests in flight and to note when each
+  request started. A request stays in flight until its response is closed,
+  i.e. until a streamed body has been sent, see record_response_metrics().
+  """
+
+  @functools.wraps(wsgi_app)
+  def tracking_wsgi_app(environ, start_response):
+    environ[_REQUEST_STARTED_KEY] = time.perf_counter()
+    _in_flight_requests.inc()
+    try:
+      return wsgi_app(environ, start_response)
+    except BaseException:
+      # No response to close.
+      _in_flight_requests.dec()
+      raise
+
+  return tracking_wsgi_app
+
+
+app.wsgi_app = _track_in_flight_requests(app.wsgi_app)
+
+
+@app.after_request
+def record_response_metrics(response):
+  """
+  Records the latency and status code of the response, by route, and ends
+  the request's time in flight once the response is closed.
+  """
+  started = request.environ.get(_REQUEST_STARTED_KEY)
+  if started is not None:
+    route = request.endpoint or "unmatched"
+    _request_seconds.observe(time.perf_counter() - started, (route,))
+    _responses.inc((route, str(response.status_code)))
+    if response.direct_passthrough:
+      # Werkzeug hands streamed bodies to the server as they are, without the
+      # callbacks of call_on_close().
+      response.response = ClosingIterator(
+          response.response, _in_flight_requests.dec
+      )
+    else:
+      response.call_on_close(_in_flight_requests.dec)
+  return response
+
+
 @app.after_request
 def add_security_headers(response):
   """
   Applies security-enhancing headers to every outgoing response.
-  This helps to mitigate common web vulnerabilities.
-  """
-  # Prevents clickjacking attacks.
-  response.headers["X-Frame-Options"] = "SAMEORIGIN"
-  # Prevents browsers from MIME-sniffing the content type.
-  response.headers["X-Content-Type-Options"] = "nosniff"
-  # A robust Content Security Policy to prevent XSS.
-  response.headers["Content-Security-Policy"] = "default-src 'self'"
-  # Controls how much referrer information is sent.
-  response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+  This helps to mitigate common web vulnerabilities. File responses already
+  carry them as part of their precomputed headers.
+  """
+  if "X-Frame-Options" in response.headers:
+    return response
+  for name, value in asset_files.SECURITY_HEADERS:
+    response.headers[name] = value
   return response
 
 
 @app.route("/enable", methods=["POST"])
 def enable_service():
-  """Enables the service, allowing it to serve files."""
-  with update_lock:
-    _reload_assets_and_enable_service()
+  """
+  Enables the service, allowing it to serve files, once a background job has
+  reloaded the data assets. Answers 202 Accepted with the job right away, or
+  waits for the job with '?wait=true'.
+  """
+  job = _request_enable()
+  if request.args.get("wait", "").lower() not in ("1", "true"):
+    return jsonify({"status": "RELOADING", "job": job}), 202
+
+  job = _reload_scheduler.wait(job["job_id"])
+  if job["state"] != reload_jobs.SUCCEEDED:
+    return jsonify({"error": "Reload failed", "job": job}), 500
   logging.info("Service has been enabled via HTTP.")
-  return jsonify({"status": "ENABLED"}), 200
+  return jsonify({"status": "ENABLED", "job": job}), 200
+
+
+@app.route("/reload_jobs", methods=["GET"])
+def get_reload_jobs():
+  """Returns the progress and timings of the recent reload jobs, newest first."""
+  return jsonify({"jobs": _reload_scheduler.jobs()}), 200
+
+
+@app.route("/reload_jobs/<int:job_id>", methods=["GET"])
+def get_reload_job(job_id):
+  """Returns the progress and timings of one reload job."""
+  job = _reload_scheduler.get(job_id)
+  if job is None:
+    return jsonify({"error": f"Reload job {job_id} not found"}), 404
+  return jsonify(job), 200
 
 
 @app.route("/disable", methods=["POST"])
 def disable_service():
   """Disables the service, preventing it from serving files."""
-  with update_lock:
-    _SERVICE_STATE["state_code"] = state_proto.SelfState.STATE_CODE_DISABLED
+  _disable()
   logging.info("Service has been disabled via HTTP.")
   return jsonify({"status": "DISABLED"}), 200
 
 
 @app.route("/status", methods=["GET"])
 def get_status():
-  """Returns the current state of the service (ENABLED or DISABLED)."""
-  with update_lock:
-    state_code = _SERVICE_STATE.get("state_code")
-    status_str = state_proto.SelfState.StateCode.Name(state_code)
-  return jsonify({"status": status_str}), 200
+  """
+  Returns the current state of the service (ENABLED or DISABLED) and what the
+  last data asset reload changed.
+  """
+  snapshot = current_snapshot()
+  status_str = state_proto.SelfState.StateCode.Name(snapshot.state_code)
+  status = {"status": status_str}
+  if snapshot.last_reload_changes is not None:
+    status["last_reload"] = dataclasses.asdict(snapshot.last_reload_changes)
+  if _asset_watcher is not None:
+    status["watcher"] = _asset_watcher.status()
+  return jsonify(status), 200
+
+
+def _resident_content_bytes():
+  """
+  Returns the bytes held in memory for each loaded data asset, by asset ID.
+  Files shared between assets count for each of them. In lazy mode only the
+  cached and the pinned oversized assets hold content.
+  """
+  if _content_cache is not None:
+    sizes = _content_cache.cached_sizes()
+    sizes.update(_content_cache.pinned_sizes())
+    return {(asset_id,): size for (asset_id, _), size in sizes.items()}
+  return {
+      (asset_id,): lazy_assets.content_map_size(content_map)
+      for asset_id, content_map in current_snapshot().all_assets_content.items()
+  }
+
+
+def _oversized_content_bytes():
+  """
+  Returns the bytes of the data assets larger than the content cache budget,
+  by asset ID. Always empty outside of lazy mode.
+  """
+  if _content_cache is None:
+    return {}
+  return {
+      (asset_id,): size
+      for (asset_id, _), size in _content_cache.pinned_sizes().items()
+  }
+
+
+_metrics.callback_gauge(
+    "platform_http_server_resident_content_bytes",
+    "Bytes of file content held in memory, by data asset.",
+    ("data_asset_id",),
+    _resident_content_bytes,
+)
+_metrics.callback_gauge(
+    "platform_http_server_distinct_content_bytes",
+    "Bytes of file content held in memory, counting shared files once.",
+    (),
+    lambda: {(): _blob_store.resident_bytes},
+)
+_metrics.callback_gauge(
+    "platform_http_server_oversized_content_bytes",
+    "Bytes of lazily loaded data assets larger than the content cache budget,"
+    " held outside of it, by data asset.",
+    ("data_asset_id",),
+    _oversized_content_bytes,
+)
+
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+  """Returns the metrics in the Prometheus text exposition format."""
+  return Response(_metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 
 @app.route("/reconfigure", methods=["POST"])
@@ -187,14 +845,14 @@ def handle_reconfigure():
 
     logging.info(f"Hot reload triggered for asset: {new_asset_id}")
 
-    all_assets = app.config["ALL_ASSETS_CONTENT"]
-    if new_asset_id not in all_assets:
-      logging.error(f"Asset '{new_asset_id}' not found in memory.")
-      return jsonify({"error": f"Asset '{new_asset_id}' not found"}), 404
-
-    # Atomically swap the active asset ID using the lock.
+    # Atomically swap the active asset ID using the lock. The membership
+    # check happens under the lock too, so a concurrent reload cannot remove
+    # the asset in between.
     with update_lock:
-      app.config["ACTIVE_ASSET_ID"] = new_asset_id
+      if new_asset_id not in current_snapshot().all_assets_content:
+        logging.error(f"Asset '{new_asset_id}' not found in memory.")
+        return jsonify({"error": f"Asset '{new_asset_id}' not found"}), 404
+      update_snapshot(active_asset_id=new_asset_id)
 
     logging.info(f"Successfully reconfigured to serve asset '{new_asset_id}'.")
     return jsonify({"status": "ok"}), 200
@@ -204,58 +862,242 @@ def handle_reconfigure():
     return jsonify({"error": "Internal Server Error"}), 500
 
 
-@app.route("/")
-@app.route("/<path:filepath>")
-def serve_file(filepath=None):
+@functools.lru_cache(maxsize=256)
+def _best_encoding(accept_encoding, available_encodings):
   """
-  Handles GET requests by looking up the path in the active in-memory asset.
-  If the root path '/' is requested, it serves 'index.html' if available.
+  Returns the coding out of 'available_encodings' preferred by the given
+  Accept-Encoding header value. Clients send only a handful of distinct
+  values, so the parsed result is cached.
   """
-  path = filepath
+  return parse_accept_header(accept_encoding).best_match(available_encodings)
 
+
+@app.route("/routes", methods=["GET"])
+def get_routes():
+  """Returns the routing table that maps requests to data assets."""
+  routes = current_snapshot().routes.routes
+  return jsonify({"routes": [dataclasses.asdict(r) for r in routes]}), 200
+
+
+@app.route("/routes", methods=["POST"])
+def handle_update_routes():
+  """
+  Handles POST requests replacing the routing table without a restart.
+  Expects a JSON payload: {"routes": [{"data_asset_id": "asset.id",
+  "path_prefix": "station1", "host": "station1.local"}]}
+  """
+  data = request.get_json(silent=True)
+  if not isinstance(data, dict) or not isinstance(data.get("routes"), list):
+    return jsonify({"error": "Missing 'routes' list in request body"}), 400
+  try:
+    routes = routing.RoutingTable(
+        routing.make_route(
+            data_asset_id=entry.get("data_asset_id", ""),
+            path_prefix=entry.get("path_prefix", ""),
+            host=entry.get("host", ""),
+        )
+        for entry in data["routes"]
+    )
+  except (AttributeError, TypeError, ValueError) as e:
+    return jsonify({"error": f"Invalid route: {e}"}), 400
+
+  # As for /reconfigure, the membership check happens under the lock, so a
+  # concurrent reload cannot remove a routed asset in between.
   with update_lock:
-    if (
-        _SERVICE_STATE.get("state_code")
-        == state_proto.SelfState.STATE_CODE_DISABLED
-    ):
-      logging.warning("Request received while service is disabled.")
-      return jsonify({"error": "Service is disabled."}), 503
-    active_id = app.config["ACTIVE_ASSET_ID"]
-    active_content = app.config["ALL_ASSETS_CONTENT"].get(active_id, {})
+    all_assets_content = current_snapshot().all_assets_content
+    for route in routes.routes:
+      if route.data_asset_id not in all_assets_content:
+        logging.error(f"Asset '{route.data_asset_id}' not found in memory.")
+        return (
+            jsonify({"error": f"Asset '{route.data_asset_id}' not found"}),
+            404,
+        )
+    update_snapshot(routes=routes)
 
-  if not path:
-    for index_file in ["index.html", "hello_world.html"]:
-      if index_file in active_content:
-        path = index_file
-        break
+  logging.info(f"Routing table updated with {len(routes.routes)} routes.")
+  return jsonify({"status": "ok"}), 200
 
-  if not path:
-    logging.warning("No index file found to serve for root request.")
-    return "File Not Found", 404
 
-  content_bytes = active_content.get(path)
+def _route_request(snapshot, path):
+  """
+  Returns the ID of the data asset serving 'path', its content map and the
+  path of the file inside of it. Requests that no route matches are served
+  from the active data asset. The content map is None if the routed data
+  asset is not loaded.
+  """
+  match = snapshot.routes.resolve(request.host, path)
+  if match is None:
+    return snapshot.active_asset_id, snapshot.active_content, path
+  route, path = match
+  content_map = snapshot.all_assets_content.get(route.data_asset_id)
+  if content_map is None:
+    logging.warning(f"Routed asset '{route.data_asset_id}' is not loaded.")
+  return route.data_asset_id, content_map, path
+
 
-  if content_bytes:
-    mime_type, _ = mimetypes.guess_type(path)
-    if mime_type and ("\r" in mime_type or "\n" in mime_type):
-      logging.error(
-          f"Invalid characters detected in mime type for path: {path}"
-      )
-      return "Bad Request", 400
+def _negotiate_encoding(asset_file):
+  """
+  Returns the content coding to serve 'asset_file' with, based on the
+  request's Accept-Encoding header, or None to serve the raw bytes.
+  """
+  accept_encoding = request.headers.get("Accept-Encoding")
+  if not asset_file.encodings or not accept_encoding:
+    return None
+  # The encodings are stored in the order of preference.
+  return _best_encoding(accept_encoding, tuple(asset_file.encodings))
 
-    # Create a Flask Response object to send the file content.
-    return Response(
-        content_bytes, mimetype=mime_type or "application/octet-stream"
+
+def _requested_byte_range(length, etag):
+  """
+  Returns the (start, stop) byte range the request asks for in a body of
+  'length' bytes, or None if the whole body should be served. Multiple ranges
+  and ranges whose If-Range precondition fails are answered with the whole
+  body, as allowed by RFC 9110.
+  """
+  byte_range = request.range
+  if byte_range is None or byte_range.units != "bytes":
+    return None
+  if len(byte_range.ranges) != 1:
+    return None
+  if_range = request.if_range
+  if if_range.date is not None or if_range.etag not in (None, etag):
+    return None
+  start_stop = byte_range.range_for_length(length)
+  if start_stop is None:
+    raise RequestedRangeNotSatisfiable(length=length)
+  return start_stop
+
+
+def _stream_chunks(view):
+  """Yields zero-copy slices of the memoryview 'view'."""
+  for offset in range(0, len(view), _STREAM_CHUNK_SIZE):
+    yield view[offset : offset + _STREAM_CHUNK_SIZE]
+
+
+def _make_body_response(asset_file, encoding, headers):
+  """
+  Builds the response carrying the representation of 'asset_file' that uses
+  'encoding', or the requested byte range of its raw bytes. Large bodies are
+  streamed in chunks sliced from the stored bytes without copying them.
+  """
+  body = asset_file.encodings[encoding] if encoding else asset_file.content
+  total_length = len(body)
+  status = 200
+  start, stop = 0, total_length
+  if encoding is None and "Range" in request.headers:
+    byte_range = _requested_byte_range(total_length, asset_file.etag())
+    if byte_range is not None:
+      status = 206
+      start, stop = byte_range
+
+  threshold = app.config.get("STREAMING_THRESHOLD", DEFAULT_STREAMING_THRESHOLD)
+  if stop - start >= threshold:
+    view = memoryview(body)[start:stop]
+    response = Response(
+        _stream_chunks(view),
+        status=status,
+        headers=headers,
+        direct_passthrough=True,
     )
+    response.content_length = len(view)
   else:
+    # Create a Flask Response object to send the file content.
+    response = Response(
+        # Slicing returns 'body' itself for bytes, and turns memory-mapped
+        # content into bytes.
+        body[start:stop],
+        status=status,
+        headers=headers,
+    )
+
+  if status == 206:
+    response.content_range = f"bytes {start}-{stop - 1}/{total_length}"
+  return response
+
+
+@app.route("/")
+@app.route("/<path:filepath>")
+def serve_file(filepath=None):
+  """
+  Handles GET requests by looking up the path in the in-memory asset that the
+  routing table picks, or the active asset if no route matches. If the root
+  of an asset is requested, it serves 'index.html' if available.
+  Conditional requests whose If-None-Match matches the file's ETag are
+  answered with 304 Not Modified and no body, and a single byte Range is
+  answered with 206 Partial Content.
+  """
+  # Everything below reads from this one snapshot, so a concurrent update
+  # cannot mix the state of two snapshots within a single request.
+  snapshot = current_snapshot()
+  if snapshot.state_code == state_proto.SelfState.STATE_CODE_DISABLED:
+    logging.warning("Request received while service is disabled.")
+    return jsonify({"error": "Service is disabled."}), 503
+  asset_id, content_map, path = _route_request(snapshot, filepath or "")
+  if content_map is None:
+    return "File Not Found", 404
+  if not path and filepath and not filepath.endswith("/"):
+    # Relative links in the index file of a routed asset only resolve below
+    # the route's prefix if the URL ends with a slash.
+    return redirect(f"/{filepath}/", code=308)
+
+  path = path or content_map.index_path
+  if not path:
+    logging.warning("No index file found to serve for root request.")
+    return "File Not Found", 404
+
+  asset_file = content_map.get(path)
+  if asset_file is None:
     logging.warning(f"File not found in memory: {path}")
     return "File Not Found", 404
 
+  if "Range" in request.headers:
+    # Byte ranges always refer to the raw bytes, so range requests skip
+    # content negotiation.
+    encoding = None
+  else:
+    # Pick the smallest representation the client is able to decode.
+    encoding = _negotiate_encoding(asset_file)
+  # Everything about the response except the body was prepared when the data
+  # asset was loaded.
+  headers = asset_file.headers[encoding]
+
+  if (
+      "If-None-Match" in request.headers
+      and request.if_none_match.contains_weak(asset_file.etag(encoding))
+  ):
+    response = Response(status=304, headers=headers)
+  else:
+    response = _make_body_response(asset_file, encoding, headers)
+    _served_bytes.inc((asset_id or "",), response.content_length)
+  response.headers["Cache-Control"] = app.config.get(
+      "CACHE_CONTROL", DEFAULT_CACHE_CONTROL
+  )
+  return response
+
+
+def _serve_async(http_port, grpc_port):
+  """Serves HTTP and the ServiceState servicer on one asyncio event loop."""
+  executor = futures.ThreadPoolExecutor(max_workers=_ASYNC_WORKER_THREADS)
+
+  async def run():
+    grpc_server = grpc.aio.server()
+    state_grpc.add_ServiceStateServicer_to_server(
+        AsyncPlatformHttpServicer(executor), grpc_server
+    )
+    grpc_server.add_insecure_port(f"[::]:{grpc_port}")
+    await asgi.serve(
+        asgi.WsgiBridge(app, executor), grpc_server, "0.0.0.0", http_port
+    )
+
+  try:
+    asyncio.run(run())
+  finally:
+    executor.shutdown(wait=False)
+
 
 def main():
   """Main function to discover assets, unpack them to memory, and run the server."""
-  # Discover all installed data assets using the utility service.
-  all_assets_content = load_assets_to_memory()
+  global _content_cache, _snapshot_disk_cache, _asset_watcher
   # Read the configuration to determine which asset to load initially.
   context = get_runtime_context()
   config = platform_http_server_pb2.PlatformHttpServerConfig()
@@ -266,6 +1108,43 @@ def main():
     logging.critical("Config file is missing 'data_asset_id'.")
     sys.exit(1)
 
+  try:
+    routes = routing.RoutingTable(
+        routing.make_route(route.data_asset_id, route.path_prefix, route.host)
+        for route in config.routes
+    )
+  except ValueError as e:
+    logging.critical(f"Config file has an invalid route: {e}")
+    sys.exit(1)
+
+  if config.lazy_loading:
+    budget_bytes = (
+        config.content_cache_budget_bytes or DEFAULT_CONTENT_CACHE_BUDGET
+    )
+    logging.info(
+        "Lazy mode: asset content is fetched on demand and cached up to"
+        f" {budget_bytes} bytes."
+    )
+    _content_cache = _make_content_cache(budget_bytes)
+
+  if config.snapshot_cache_dir and not config.lazy_loading:
+    _snapshot_disk_cache = disk_cache.SnapshotDiskCache(
+        config.snapshot_cache_dir
+    )
+
+  # Serve the assets persisted by a previous run right away, if possible, and
+  # reconcile them with the installed data assets once the server is up.
+  restored = _snapshot_disk_cache.load() if _snapshot_disk_cache else None
+  reconcile_in_background = (
+      restored is not None and initial_asset_id in restored[0]
+  )
+  if reconcile_in_background:
+    all_assets_content, asset_versions = restored
+  else:
+    # Discover all installed data assets using the utility service.
+    all_assets_content, asset_versions, _ = _load_assets({}, {})
+    _save_to_disk_cache(all_assets_content, asset_versions)
+
   # Validate that the configured initial asset was found and unpacked.
   if initial_asset_id not in all_assets_content:
     logging.critical(
@@ -273,6 +1152,10 @@ def main():
         "or failed to unpack."
     )
     sys.exit(1)
+  for route in routes.routes:
+    if route.data_asset_id not in all_assets_content:
+      # It is served as soon as a reload finds it installed.
+      logging.warning(f"Routed asset '{route.data_asset_id}' was not found.")
 
   http_port = context.http_port if context else 8080
   if context and hasattr(context, "grpc_port"):
@@ -284,11 +1167,36 @@ def main():
     )
   logging.info(f"HTTP port set to: {http_port}")
 
-  _SERVICE_STATE["state_code"] = state_proto.SelfState.STATE_CODE_ENABLED
+  with update_lock:
+    update_snapshot(
+        state_code=state_proto.SelfState.STATE_CODE_ENABLED,
+        active_asset_id=initial_asset_id,
+        all_assets_content=all_assets_content,
+        asset_versions=asset_versions,
+        routes=routes,
+    )
 
   # Set the initial configuration for the Flask app.
-  app.config["ALL_ASSETS_CONTENT"] = all_assets_content
-  app.config["ACTIVE_ASSET_ID"] = initial_asset_id
+  app.config["CACHE_CONTROL"] = config.cache_control or DEFAULT_CACHE_CONTROL
+  app.config["STREAMING_THRESHOLD"] = (
+      config.streaming_threshold_bytes or DEFAULT_STREAMING_THRESHOLD
+  )
+
+  if reconcile_in_background:
+    # Brings the restored assets up to date while they are being served.
+    threading.Thread(
+        target=_reconcile_restored_assets, name="reconcile", daemon=True
+    ).start()
+  if config.watch_interval_seconds > 0:
+    _asset_watcher = _make_asset_watcher(config.watch_interval_seconds)
+    _asset_watcher.start()
+
+  logging.info(f"Starting in-memory HMI server on port {http_port}...")
+  logging.info(f"Serving initial content from asset '{initial_asset_id}'")
+  logging.info(f"Service state is initially 'ENABLED'")
+  if config.async_serving:
+    _serve_async(http_port, grpc_port)
+    return
 
   grpc_server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
   state_grpc.add_ServiceStateServicer_to_server(
@@ -298,10 +1206,6 @@ def main():
   grpc_thread = threading.Thread(target=grpc_server.start, daemon=True)
   grpc_thread.start()
   logging.info(f"gRPC ServiceState server started on port {grpc_port}.")
-
-  logging.info(f"Starting in-memory HMI server on port {http_port}...")
-  logging.info(f"Serving initial content from asset '{initial_asset_id}'")
-  logging.info(f"Service state is initially 'ENABLED'")
   serve(app, host="0.0.0.0", port=http_port)
 
 
@@ -1,8 +1,15 @@
+import asyncio
+from concurrent import futures
+import gc
+import gzip
 import json
 import sys
+import threading
+import time
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
+import brotli
 import pytest
 
 # Classes to imitate the Protobuf/gRPC objects.
@@ -95,6 +102,15 @@ sys.modules["intrinsic.assets.services.proto.v1"].service_state_pb2_grpc = (
 sys.modules["intrinsic.resources.proto"] = MagicMock()
 sys.modules["intrinsic.resources.proto"].runtime_context_pb2 = mock_runtime
 
+from services.platform_http_server import asgi
+from services.platform_http_server import asset_files
+from services.platform_http_server import asset_watcher
+from services.platform_http_server import disk_cache
+from services.platform_http_server import lazy_assets
+from services.platform_http_server import metrics
+from services.platform_http_server import preload_links
+from services.platform_http_server import reload_jobs
+from services.platform_http_server import routing
 from services.platform_http_server import server
 
 
@@ -113,8 +129,10 @@ def mock_assets():
           ),
           "css/style.css": b"body { background-color: #f0f0f0; }",
           "js/app.js": b"console.log('App loaded');",
+          "js/bundle.js": b"console.log('Bundle chunk loaded');\n" * 64,
           "images/logo.png": b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR...",
           "assets/fonts/roboto.woff2": b"\x00\x01\x00\x00",
+          "videos/intro.mp4": bytes(range(256)) * 1024,
       },
       "ai.intrinsic.asset2": {
           "index.html": b"<html>Version 2</html>",
@@ -136,10 +154,16 @@ def client(mock_assets):
       flask.testing.FlaskClient: A test client for the Flask application.
   """
   server.app.config["TESTING"] = True
-  server.app.config["ALL_ASSETS_CONTENT"] = mock_assets
-  server.app.config["ACTIVE_ASSET_ID"] = "ai.intrinsic.asset1"
-
-  server._SERVICE_STATE["state_code"] = 3
+  with server.update_lock:
+    server.update_snapshot(
+        state_code=3,
+        active_asset_id="ai.intrinsic.asset1",
+        all_assets_content={
+            asset_id: asset_files.build_content_map(files)
+            for asset_id, files in mock_assets.items()
+        },
+        routes=routing.RoutingTable(),
+    )
 
   with server.app.test_client() as client:
     yield client
@@ -195,6 +219,187 @@ class TestContentIntegrity:
     )
 
 
+class TestCompression:
+  """Tests for serving the precompressed variants of the asset files."""
+
+  def test_serve_gzip_when_accepted(self, client, mock_assets):
+    """Verifies that gzip-only clients get the gzip variant."""
+    response = client.get("/js/bundle.js", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert (
+        gzip.decompress(response.data)
+        == mock_assets["ai.intrinsic.asset1"]["js/bundle.js"]
+    )
+
+  def test_serve_brotli_when_preferred(self, client, mock_assets):
+    """Verifies that brotli is preferred when the client accepts both."""
+    response = client.get(
+        "/js/bundle.js", headers={"Accept-Encoding": "gzip, deflate, br"}
+    )
+    assert response.headers["Content-Encoding"] == "br"
+    assert (
+        brotli.decompress(response.data)
+        == mock_assets["ai.intrinsic.asset1"]["js/bundle.js"]
+    )
+
+  def test_serve_identity_without_accept_encoding(self, client, mock_assets):
+    """Verifies that clients without Accept-Encoding get the raw bytes."""
+    response = client.get("/js/bundle.js")
+    assert "Content-Encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert response.data == mock_assets["ai.intrinsic.asset1"]["js/bundle.js"]
+
+  def test_respects_zero_quality(self, client):
+    """Verifies that an encoding refused with q=0 is never used."""
+    response = client.get(
+        "/js/bundle.js", headers={"Accept-Encoding": "gzip, br;q=0"}
+    )
+    assert response.headers["Content-Encoding"] == "gzip"
+
+  def test_binary_files_not_compressed(self, client, mock_assets):
+    """Verifies that non-text files are always served as raw bytes."""
+    response = client.get(
+        "/images/logo.png", headers={"Accept-Encoding": "gzip, br"}
+    )
+    assert "Content-Encoding" not in response.headers
+    assert "Vary" not in response.headers
+    assert (
+        response.data == mock_assets["ai.intrinsic.asset1"]["images/logo.png"]
+    )
+
+
+class TestConditionalRequests:
+  """Tests for ETag validation and Cache-Control headers."""
+
+  def test_etag_and_cache_control_sent(self, client):
+    """Verifies that every served file carries an ETag and Cache-Control."""
+    response = client.get("/css/style.css")
+    assert response.headers["ETag"]
+    assert response.headers["Cache-Control"] == server.DEFAULT_CACHE_CONTROL
+
+  def test_if_none_match_returns_304(self, client):
+    """Verifies that a matching If-None-Match is answered without a body."""
+    etag = client.get("/css/style.css").headers["ETag"]
+    response = client.get("/css/style.css", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+
+  def test_stale_etag_returns_full_body(self, client, mock_assets):
+    """Verifies that an outdated ETag gets the full content."""
+    response = client.get(
+        "/css/style.css", headers={"If-None-Match": '"outdated"'}
+    )
+    assert response.status_code == 200
+    assert response.data == mock_assets["ai.intrinsic.asset1"]["css/style.css"]
+
+  def test_etag_differs_per_encoding(self, client):
+    """Verifies that each content coding is tagged as its own representation."""
+    identity = client.get("/js/bundle.js")
+    gzipped = client.get("/js/bundle.js", headers={"Accept-Encoding": "gzip"})
+    assert identity.headers["ETag"] != gzipped.headers["ETag"]
+    response = client.get(
+        "/js/bundle.js",
+        headers={
+            "Accept-Encoding": "gzip",
+            "If-None-Match": gzipped.headers["ETag"],
+        },
+    )
+    assert response.status_code == 304
+
+  def test_etag_changes_with_content(self, client):
+    """Verifies that switching to different content invalidates the ETag."""
+    etag = client.get("/").headers["ETag"]
+    client.post("/reconfigure", json={"data_asset_id": "ai.intrinsic.asset2"})
+    response = client.get("/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+  def test_configured_cache_control(self, client):
+    """Verifies that the Cache-Control value can be configured."""
+    server.app.config["CACHE_CONTROL"] = "public, max-age=60"
+    try:
+      response = client.get("/css/style.css")
+    finally:
+      del server.app.config["CACHE_CONTROL"]
+    assert response.headers["Cache-Control"] == "public, max-age=60"
+
+
+class TestRangeRequests:
+  """Tests for byte range requests and streamed responses."""
+
+  def test_range_returns_partial_content(self, client, mock_assets):
+    """Verifies that a single byte range is answered with 206."""
+    response = client.get("/videos/intro.mp4", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == "bytes 10-19/262144"
+    assert (
+        response.data
+        == mock_assets["ai.intrinsic.asset1"]["videos/intro.mp4"][10:20]
+    )
+
+  def test_suffix_range(self, client, mock_assets):
+    """Verifies that a suffix range returns the end of the file."""
+    response = client.get("/videos/intro.mp4", headers={"Range": "bytes=-100"})
+    assert response.status_code == 206
+    assert (
+        response.data
+        == mock_assets["ai.intrinsic.asset1"]["videos/intro.mp4"][-100:]
+    )
+
+  def test_unsatisfiable_range(self, client):
+    """Verifies that a range past the end of the file is answered with 416."""
+    response = client.get("/css/style.css", headers={"Range": "bytes=5000-"})
+    assert response.status_code == 416
+    assert response.headers["Content-Range"].startswith("bytes */")
+
+  def test_if_range_mismatch_returns_whole_file(self, client, mock_assets):
+    """Verifies that a stale If-Range precondition ignores the range."""
+    response = client.get(
+        "/videos/intro.mp4",
+        headers={"Range": "bytes=0-9", "If-Range": '"outdated"'},
+    )
+    assert response.status_code == 200
+    assert (
+        response.data == mock_assets["ai.intrinsic.asset1"]["videos/intro.mp4"]
+    )
+
+  def test_accept_ranges_advertised(self, client):
+    """Verifies that raw responses advertise byte range support."""
+    response = client.get("/videos/intro.mp4")
+    assert response.headers["Accept-Ranges"] == "bytes"
+
+  def test_large_file_streamed(self, client, mock_assets):
+    """Verifies that files above the threshold are streamed in chunks."""
+    server.app.config["STREAMING_THRESHOLD"] = 1024
+    try:
+      response = client.get("/videos/intro.mp4")
+      assert response.is_streamed
+      assert response.headers["Content-Length"] == "262144"
+      assert (
+          response.data
+          == mock_assets["ai.intrinsic.asset1"]["videos/intro.mp4"]
+      )
+    finally:
+      del server.app.config["STREAMING_THRESHOLD"]
+
+  def test_large_range_streamed(self, client, mock_assets):
+    """Verifies that large ranges are streamed too."""
+    server.app.config["STREAMING_THRESHOLD"] = 1024
+    try:
+      response = client.get(
+          "/videos/intro.mp4", headers={"Range": "bytes=1000-99999"}
+      )
+      assert response.status_code == 206
+      assert response.is_streamed
+      assert (
+          response.data
+          == mock_assets["ai.intrinsic.asset1"]["videos/intro.mp4"][1000:100000]
+      )
+    finally:
+      del server.app.config["STREAMING_THRESHOLD"]
+
+
 class TestHotReloading:
   """Tests for the dynamic reconfiguration (hot reloading) of assets."""
 
@@ -206,7 +411,7 @@ class TestHotReloading:
     payload = {"data_asset_id": "ai.intrinsic.asset2"}
     response = client.post("/reconfigure", json=payload)
     assert response.status_code == 200
-    assert server.app.config["ACTIVE_ASSET_ID"] == "ai.intrinsic.asset2"
+    assert server.current_snapshot().active_asset_id == "ai.intrinsic.asset2"
     assert (
         client.get("/").data == mock_assets["ai.intrinsic.asset2"]["index.html"]
     )
@@ -238,11 +443,108 @@ class TestHotReloading:
     assert response.status_code == 404
 
 
+class TestRouting:
+  """Tests for serving several assets at once by path prefix or Host header."""
+
+  def _set_routes(self, client, routes):
+    response = client.post("/routes", json={"routes": routes})
+    assert response.status_code == 200
+    return response
+
+  def test_path_prefix_serves_routed_asset(self, client, mock_assets):
+    """Verifies that a prefix serves its asset and others keep the default."""
+    self._set_routes(
+        client,
+        [{"data_asset_id": "ai.intrinsic.asset2", "path_prefix": "station2"}],
+    )
+    response = client.get("/station2/")
+    assert response.data == mock_assets["ai.intrinsic.asset2"]["index.html"]
+    response = client.get("/station2/index.html")
+    assert response.data == mock_assets["ai.intrinsic.asset2"]["index.html"]
+    assert (
+        client.get("/").data == mock_assets["ai.intrinsic.asset1"]["index.html"]
+    )
+    # Only whole path segments match.
+    assert client.get("/station2x/index.html").status_code == 404
+
+  def test_prefix_without_slash_redirects(self, client):
+    """Verifies the redirect that keeps relative links below the prefix."""
+    self._set_routes(
+        client,
+        [{"data_asset_id": "ai.intrinsic.asset2", "path_prefix": "/station2/"}],
+    )
+    response = client.get("/station2")
+    assert response.status_code == 308
+    assert response.headers["Location"].endswith("/station2/")
+
+  def test_host_route_takes_precedence(self, client, mock_assets):
+    """Verifies that a Host route wins over a catch-all prefix route."""
+    self._set_routes(
+        client,
+        [
+            {"data_asset_id": "ai.intrinsic.asset1", "path_prefix": ""},
+            {"data_asset_id": "ai.intrinsic.asset2", "host": "Station2.local"},
+        ],
+    )
+    response = client.get("/", headers={"Host": "station2.local:8080"})
+    assert response.data == mock_assets["ai.intrinsic.asset2"]["index.html"]
+    response = client.get("/", headers={"Host": "other.local"})
+    assert response.data == mock_assets["ai.intrinsic.asset1"]["index.html"]
+
+  def test_longest_prefix_wins(self):
+    """Verifies the lookup order of the routing table."""
+    table = routing.RoutingTable([
+        routing.make_route("a", "cell"),
+        routing.make_route("b", "cell/station1"),
+    ])
+    route, path = table.resolve("", "cell/station1/app.js")
+    assert (route.data_asset_id, path) == ("b", "app.js")
+    route, path = table.resolve("", "cell/station2/app.js")
+    assert (route.data_asset_id, path) == ("a", "station2/app.js")
+    assert table.resolve("", "other/app.js") is None
+
+  def test_get_routes(self, client):
+    """Verifies that the current routing table can be read back."""
+    self._set_routes(
+        client, [{"data_asset_id": "ai.intrinsic.asset2", "host": "a.local"}]
+    )
+    response = client.get("/routes")
+    assert response.get_json() == {
+        "routes": [{
+            "data_asset_id": "ai.intrinsic.asset2",
+            "path_prefix": "",
+            "host": "a.local",
+        }]
+    }
+
+  def test_unknown_asset_is_rejected(self, client):
+    """Verifies 404 Not Found for a route to an asset that is not loaded."""
+    response = client.post(
+        "/routes", json={"routes": [{"data_asset_id": "ai.intrinsic.asset3"}]}
+    )
+    assert response.status_code == 404
+    assert not server.current_snapshot().routes
+
+  @pytest.mark.parametrize(
+      "payload",
+      [
+          {"wrong_key": []},
+          {"routes": [{"path_prefix": "station1"}]},
+          {"routes": [{"data_asset_id": "a", "path_prefix": "a/../b"}]},
+          {"routes": ["ai.intrinsic.asset1"]},
+      ],
+  )
+  def test_invalid_routes_are_rejected(self, client, payload):
+    """Verifies 400 Bad Request for malformed routing tables."""
+    assert client.post("/routes", json=payload).status_code == 400
+
+
 class TestLifecycle:
   """Tests for the service lifecycle endpoints (enable/disable/status)."""
 
   @patch(
-      "services.platform_http_server.server._reload_assets_and_enable_service"
+      "services.platform_http_server.server._reload_assets_and_enable_service",
+      return_value=server.AssetChanges(),
   )
   def test_disable_and_enable_http(self, mock_reload, client):
     """Tests the full disable -> status check -> enable cycle.
@@ -264,11 +566,52 @@ class TestLifecycle:
     )
 
     # 3. Enable
-    response = client.post("/enable")
+    response = client.post("/enable?wait=true")
     assert response.status_code == 200
     mock_reload.assert_called_once()
 
 
+class TestSnapshotReads:
+  """Tests that the request path reads a published snapshot without locking."""
+
+  def test_serving_does_not_wait_for_writers(self, client, mock_assets):
+    """Verifies that files are served while a writer holds the update lock."""
+    with server.update_lock:
+      response = client.get("/")
+    assert response.status_code == 200
+    assert response.data == mock_assets["ai.intrinsic.asset1"]["index.html"]
+
+  def test_serving_during_reload(self, client, mock_assets):
+    """Verifies that the old content stays served while assets reload."""
+    served_during_reload = []
+
+    def slow_load(known_versions, known_content, progress=None):
+      assert not server.update_lock.locked()
+      # A separate client, as the fixture's one is busy with /enable.
+      served_during_reload.append(server.app.test_client().get("/").data)
+      content = {
+          "ai.intrinsic.asset1": asset_files.build_content_map(
+              {"index.html": b"<html>Reloaded</html>"}
+          )
+      }
+      return content, {}, server.AssetChanges()
+
+    with patch(
+        "services.platform_http_server.server.reload_assets",
+        side_effect=slow_load,
+    ):
+      client.post("/enable?wait=true")
+    assert served_during_reload == [
+        mock_assets["ai.intrinsic.asset1"]["index.html"]
+    ]
+    assert client.get("/").data == b"<html>Reloaded</html>"
+
+  def test_disabled_snapshot_rejects_requests(self, client):
+    """Verifies 503 once a disabled snapshot has been published."""
+    client.post("/disable")
+    assert client.get("/").status_code == 503
+
+
 class TestAssetLoadingLogic:
   """Tests for the backend logic that loads assets into memory."""
 
@@ -302,7 +645,1028 @@ class TestAssetLoadingLogic:
 
     result = server.load_assets_to_memory()
     assert "ai.intrinsic.test_asset" in result
-    assert result["ai.intrinsic.test_asset"]["index.html"] == b"HTML DATA"
+    assert (
+        result["ai.intrinsic.test_asset"]["index.html"].content == b"HTML DATA"
+    )
+
+
+def _make_mock_asset(name, version, files):
+  """Creates a mock ReferencedDataStruct data asset.
+
+  Args:
+      name (str): The asset name inside the 'ai.intrinsic' package.
+      version (str): The asset version.
+      files (dict): Maps file paths to their byte content.
+
+  Returns:
+      MagicMock: An object mimicking a DataAsset proto.
+  """
+  mock_asset = MagicMock()
+  mock_asset.metadata.id_version.id.package = "ai.intrinsic"
+  mock_asset.metadata.id_version.id.name = name
+  mock_asset.metadata.id_version.version = version
+  mock_asset.data.type_url = "type.googleapis.com/ReferencedDataStruct"
+
+  def side_effect_unpack(target_proto):
+    target_proto.fields = {
+        path: MagicMock(referenced_data_value=MagicMock(inlined=content))
+        for path, content in files.items()
+    }
+
+  mock_asset.data.Unpack.side_effect = side_effect_unpack
+  return mock_asset
+
+
+def _set_installed_assets(mock_service, assets):
+  """Makes 'mock_service' list the metadata of 'assets' and serve them."""
+  by_name = {asset.metadata.id_version.id.name: asset for asset in assets}
+  mock_service.list_data_asset_metadata.return_value = [
+      asset.metadata for asset in assets
+  ]
+  mock_service.get_data_asset.side_effect = lambda package, name: by_name[name]
+
+
+@patch(
+    "services.platform_http_server.server.data_asset_utils.DataAssetsService"
+)
+class TestIncrementalReload:
+  """Tests that reloads only unpack new and updated data assets."""
+
+  def test_first_load_adds_everything(self, MockDataAssetsService):
+    """Verifies that all assets are reported as added on the first load."""
+    MockDataAssetsService.return_value.list_data_assets.return_value = [
+        _make_mock_asset("a", "1.0.0", {"index.html": b"A"}),
+        _make_mock_asset("b", "1.0.0", {"index.html": b"B"}),
+    ]
+    content, versions, changes = server.reload_assets({}, {})
+    assert changes.added == ["ai.intrinsic.a", "ai.intrinsic.b"]
+    assert versions == {"ai.intrinsic.a": "1.0.0", "ai.intrinsic.b": "1.0.0"}
+    assert content["ai.intrinsic.b"]["index.html"].content == b"B"
+
+  def test_unchanged_assets_are_reused(self, MockDataAssetsService):
+    """Verifies that unchanged assets are neither fetched, unpacked nor copied."""
+    mock_service = MockDataAssetsService.return_value
+    asset_a = _make_mock_asset("a", "1.0.0", {"index.html": b"A"})
+    mock_service.list_data_assets.return_value = [asset_a]
+    content, versions, _ = server.reload_assets({}, {})
+    asset_a.data.Unpack.reset_mock()
+
+    mock_service.list_data_asset_metadata.return_value = [asset_a.metadata]
+    new_content, _, changes = server.reload_assets(versions, content)
+    asset_a.data.Unpack.assert_not_called()
+    mock_service.get_data_asset.assert_not_called()
+    assert changes.unchanged == ["ai.intrinsic.a"]
+    assert new_content["ai.intrinsic.a"] is content["ai.intrinsic.a"]
+
+  def test_updated_and_removed_assets(self, MockDataAssetsService):
+    """Verifies that version changes are unpacked and removals dropped."""
+    list_data_assets = MockDataAssetsService.return_value.list_data_assets
+    list_data_assets.return_value = [
+        _make_mock_asset("a", "1.0.0", {"index.html": b"A"}),
+        _make_mock_asset("b", "1.0.0", {"index.html": b"B"}),
+    ]
+    content, versions, _ = server.reload_assets({}, {})
+
+    _set_installed_assets(
+        MockDataAssetsService.return_value,
+        [
+            _make_mock_asset("a", "2.0.0", {"index.html": b"A2"}),
+            _make_mock_asset("c", "1.0.0", {"index.html": b"C"}),
+        ],
+    )
+    new_content, new_versions, changes = server.reload_assets(versions, content)
+    assert changes.updated == ["ai.intrinsic.a"]
+    assert changes.added == ["ai.intrinsic.c"]
+    assert changes.removed == ["ai.intrinsic.b"]
+    assert set(new_content) == {"ai.intrinsic.a", "ai.intrinsic.c"}
+    assert new_content["ai.intrinsic.a"]["index.html"].content == b"A2"
+    assert new_versions["ai.intrinsic.a"] == "2.0.0"
+
+  def test_status_reports_last_reload(self, MockDataAssetsService, client):
+    """Verifies that /status reports what the last /enable changed."""
+    _set_installed_assets(
+        MockDataAssetsService.return_value,
+        [_make_mock_asset("asset1", "1.0.0", {"index.html": b"A"})],
+    )
+    client.post("/enable?wait=true")
+    last_reload = client.get("/status").json["last_reload"]
+    assert last_reload["updated"] == ["ai.intrinsic.asset1"]
+    assert last_reload["removed"] == ["ai.intrinsic.asset2"]
+
+
+def _wait_until(predicate, timeout=5):
+  """Polls 'predicate' until it is true, failing after 'timeout' seconds."""
+  deadline = time.monotonic() + timeout
+  while not predicate():
+    assert time.monotonic() < deadline, "Timed out waiting for a condition."
+    time.sleep(0.001)
+
+
+class TestReloadJobs:
+  """Tests for reloading in background jobs that coalesce requests."""
+
+  def _make_blocking_scheduler(self):
+    """Creates a scheduler whose jobs block until 'release' is set."""
+    release = threading.Event()
+    runs = []
+
+    def run(report):
+      runs.append(len(runs) + 1)
+      report("loading", 1, 2)
+      release.wait(5)
+      report("activating")
+      return {"run": len(runs)}
+
+    return reload_jobs.ReloadScheduler(run), release, runs
+
+  def test_duplicate_requests_are_coalesced(self):
+    """Verifies that requests during a running job share one pending job."""
+    scheduler, release, runs = self._make_blocking_scheduler()
+    first = scheduler.request()
+    _wait_until(
+        lambda: scheduler.get(first["job_id"])["state"] == reload_jobs.RUNNING
+    )
+    later = [scheduler.request() for _ in range(3)]
+    assert len({job["job_id"] for job in later}) == 1
+    release.set()
+    second = scheduler.wait(later[0]["job_id"], timeout=5)
+    assert second["state"] == reload_jobs.SUCCEEDED
+    assert second["requests"] == 3
+    assert second["result"] == {"run": 2}
+    assert runs == [1, 2]
+
+  def test_progress_and_timings(self):
+    """Verifies the progress of a running job and the timings once done."""
+    scheduler, release, _ = self._make_blocking_scheduler()
+    job = scheduler.request()
+    _wait_until(lambda: scheduler.get(job["job_id"])["phase"] == "loading")
+    running = scheduler.get(job["job_id"])
+    assert (running["done"], running["total"]) == (1, 2)
+    release.set()
+    job = scheduler.wait(job["job_id"], timeout=5)
+    assert set(job["phase_seconds"]) == {"loading", "activating"}
+    assert job["run_seconds"] >= 0
+    assert job["queued_seconds"] >= 0
+
+  def test_failed_job_reports_error(self):
+    """Verifies that a failing reload fails its job, not the worker."""
+
+    def run(report):
+      raise SystemExit(1)
+
+    scheduler = reload_jobs.ReloadScheduler(run)
+    job = scheduler.wait(scheduler.request()["job_id"], timeout=5)
+    assert job["state"] == reload_jobs.FAILED
+    assert "SystemExit" in job["error"]
+    job = scheduler.wait(scheduler.request()["job_id"], timeout=5)
+    assert job["state"] == reload_jobs.FAILED
+
+  def test_enable_returns_before_reload(self, client):
+    """Verifies that /enable answers right away and activates atomically."""
+    release = threading.Event()
+
+    def slow_reload(report=None):
+      release.wait(5)
+      with server.update_lock:
+        server.update_snapshot(state_code=3)
+      return server.AssetChanges()
+
+    with server.update_lock:
+      server.update_snapshot(state_code=2)
+    with patch(
+        "services.platform_http_server.server._reload_assets_and_enable_service",
+        side_effect=slow_reload,
+    ):
+      response = client.post("/enable")
+      assert response.status_code == 202
+      job_id = response.json["job"]["job_id"]
+      assert client.get("/").status_code == 503
+      release.set()
+      server._reload_scheduler.wait(job_id, timeout=5)
+    job = client.get(f"/reload_jobs/{job_id}").json
+    assert job["state"] == reload_jobs.SUCCEEDED
+    assert client.get("/reload_jobs").json["jobs"][0]["job_id"] == job_id
+    assert client.get("/").status_code == 200
+
+  def test_enable_wait_reports_failure(self, client):
+    """Verifies 500 from /enable?wait=true if the reload fails."""
+    with patch(
+        "services.platform_http_server.server._reload_assets_and_enable_service",
+        side_effect=RuntimeError("unavailable"),
+    ):
+      response = client.post("/enable?wait=true")
+    assert response.status_code == 500
+    assert response.json["job"]["state"] == reload_jobs.FAILED
+
+  def test_unknown_job(self, client):
+    """Verifies 404 Not Found for an unknown reload job."""
+    assert client.get("/reload_jobs/999999").status_code == 404
+
+  def _patch_blocking_load(self, release):
+    """Patches the asset loading to block until 'release' is set."""
+    snapshot = server.current_snapshot()
+
+    def load(known_versions, known_content, progress=None):
+      release.wait(5)
+      return (
+          snapshot.all_assets_content,
+          snapshot.asset_versions,
+          server.AssetChanges(),
+      )
+
+    return patch(
+        "services.platform_http_server.server._load_assets", side_effect=load
+    )
+
+  def test_background_reload_keeps_disabled_state(self, client):
+    """Verifies that a Disable during a watcher reload is not undone."""
+    release = threading.Event()
+    with self._patch_blocking_load(release):
+      job = server._reload_scheduler.request()
+      assert client.post("/disable").status_code == 200
+      release.set()
+      server._reload_scheduler.wait(job["job_id"], timeout=5)
+    assert server.current_snapshot().state_code == 2
+
+    with self._patch_blocking_load(release):
+      job = server._reload_scheduler.request()
+      server._reload_scheduler.wait(job["job_id"], timeout=5)
+    assert server.current_snapshot().state_code == 2
+
+  def test_disable_overrides_pending_enable(self, client):
+    """Verifies that the later of Enable and Disable wins."""
+    release = threading.Event()
+    with self._patch_blocking_load(release):
+      job_id = client.post("/enable").json["job"]["job_id"]
+      client.post("/disable")
+      release.set()
+      server._reload_scheduler.wait(job_id, timeout=5)
+      assert server.current_snapshot().state_code == 2
+
+      assert client.post("/enable?wait=true").status_code == 200
+    assert server.current_snapshot().state_code == 3
+
+  def test_reconcile_retries_until_it_succeeds(self, client):
+    """Verifies that a failed reconcile of restored assets is retried."""
+    snapshot = server.current_snapshot()
+    results = [
+        RuntimeError("unreachable"),
+        RuntimeError("unreachable"),
+        (
+            snapshot.all_assets_content,
+            snapshot.asset_versions,
+            server.AssetChanges(),
+        ),
+    ]
+    delays = []
+    with patch(
+        "services.platform_http_server.server._load_assets",
+        side_effect=results,
+    ) as load:
+      server._reconcile_restored_assets(sleep=delays.append)
+    assert load.call_count == 3
+    assert delays == [1.0, 2.0]
+
+
+class TestAssetWatcher:
+  """Tests for polling the installed data assets and applying changes."""
+
+  def _make_watcher(self, installed, loaded, interval_seconds=60):
+    changes = []
+    watcher = asset_watcher.AssetWatcher(
+        list_installed=lambda: installed,
+        list_loaded=lambda: loaded,
+        on_change=lambda: changes.append(dict(installed)),
+        interval_seconds=interval_seconds,
+    )
+    return watcher, changes
+
+  def test_change_is_applied_once(self):
+    """Verifies that each new fingerprint triggers a single change."""
+    installed = {"ai.intrinsic.a": "1.0.0"}
+    watcher, changes = self._make_watcher(
+        installed, {"ai.intrinsic.a": "1.0.0"}
+    )
+    assert not watcher.poll()
+    installed["ai.intrinsic.a"] = "2.0.0"
+    assert watcher.poll()
+    assert not watcher.poll()
+    assert changes == [{"ai.intrinsic.a": "2.0.0"}]
+    assert watcher.status()["polls"] == 3
+    assert watcher.status()["changes_detected"] == 1
+
+  def test_already_loaded_change_is_ignored(self):
+    """Verifies that nothing happens if an Enable loaded the change first."""
+    installed = {"ai.intrinsic.a": "1.0.0"}
+    loaded = dict(installed)
+    watcher, changes = self._make_watcher(installed, loaded)
+    watcher.poll()
+    installed["ai.intrinsic.b"] = "1.0.0"
+    loaded["ai.intrinsic.b"] = "1.0.0"
+    assert not watcher.poll()
+    assert not changes
+
+  def test_poll_errors_keep_the_watcher_running(self):
+    """Verifies that a failing poll is reported and retried."""
+    polls = []
+
+    def list_installed():
+      polls.append(1)
+      raise RuntimeError("ingress unavailable")
+
+    watcher = asset_watcher.AssetWatcher(
+        list_installed, dict, lambda: None, interval_seconds=0.001
+    )
+    watcher.start()
+    _wait_until(lambda: len(polls) >= 2)
+    watcher.stop()
+    assert watcher.status()["last_error"] == "ingress unavailable"
+
+  def test_polls_only_filtered_metadata(self):
+    """Verifies that a poll lists metadata with the proto_name filter."""
+    mock_service = MagicMock()
+    mock_service.list_data_asset_metadata.return_value = [
+        _make_mock_asset("a", "1.0.0", {}).metadata
+    ]
+    versions = server.list_installed_versions(mock_service)
+    assert versions == {"ai.intrinsic.a": "1.0.0"}
+    mock_service.list_data_asset_metadata.assert_called_once_with(
+        proto_name=server._REFERENCED_DATA_STRUCT_PROTO_NAME
+    )
+    mock_service.list_data_assets.assert_not_called()
+
+  @patch("services.platform_http_server.server._reload_scheduler")
+  @patch(
+      "services.platform_http_server.server.data_asset_utils.DataAssetsService"
+  )
+  def test_watcher_connects_in_its_polls(
+      self, MockDataAssetsService, mock_scheduler
+  ):
+    """Verifies that a slow ingress fails a poll, not the startup."""
+    mock_service = MagicMock()
+    mock_service.list_data_asset_metadata.return_value = []
+    MockDataAssetsService.side_effect = [
+        TimeoutError("channel not ready"),
+        mock_service,
+    ]
+    watcher = server._make_asset_watcher(60)
+    MockDataAssetsService.assert_not_called()
+    with pytest.raises(TimeoutError):
+      watcher.poll()
+    watcher.poll()
+    watcher.poll()
+    assert MockDataAssetsService.call_count == 2
+    assert mock_service.list_data_asset_metadata.call_count == 2
+
+  @patch("services.platform_http_server.server._reload_scheduler")
+  def test_disabled_service_is_left_alone(self, mock_scheduler, client):
+    """Verifies that changes are not applied while the service is disabled."""
+    client.post("/disable")
+    server._apply_installed_asset_changes()
+    mock_scheduler.request.assert_not_called()
+    with server.update_lock:
+      server.update_snapshot(state_code=3)
+    server._apply_installed_asset_changes()
+    mock_scheduler.request.assert_called_once()
+
+
+class TestLazyLoading:
+  """Tests for fetching data asset content on demand within a byte budget."""
+
+  def _make_cache(self, budget_bytes, assets):
+    """Creates a ContentCache fetching from 'assets', recording every fetch."""
+    fetched = []
+
+    def fetch(asset_id):
+      fetched.append(asset_id)
+      return asset_files.build_content_map(assets[asset_id])
+
+    return lazy_assets.ContentCache(budget_bytes, fetch), fetched
+
+  def test_cache_evicts_least_recently_used(self):
+    """Verifies that the oldest asset is evicted once the budget is exceeded."""
+    assets = {name: {"f.bin": bytes(100)} for name in ("a", "b", "c")}
+    cache, fetched = self._make_cache(250, assets)
+    cache.get(("a", "1"))
+    cache.get(("b", "1"))
+    cache.get(("a", "1"))
+    cache.get(("c", "1"))
+    assert cache.cached_keys() == (("a", "1"), ("c", "1"))
+    assert cache.resident_bytes == 200
+    assert fetched == ["a", "b", "c"]
+
+  def test_cache_pins_oversized_assets(self):
+    """Verifies that an asset larger than the budget is fetched only once."""
+    cache, fetched = self._make_cache(
+        50, {"a": {"f.bin": bytes(100)}, "b": {"f.bin": bytes(10)}}
+    )
+    assert cache.get(("a", "1"))["f.bin"].content == bytes(100)
+    assert cache.get(("a", "1"))["f.bin"].content == bytes(100)
+    cache.get(("b", "1"))
+    assert fetched == ["a", "b"]
+    assert cache.cached_keys() == (("b", "1"),)
+    assert cache.resident_bytes == 10
+    assert cache.pinned_sizes() == {("a", "1"): 100}
+
+    cache.retain([("a", "2"), ("b", "1")])
+    assert cache.pinned_sizes() == {}
+    cache.get(("a", "2"))
+    assert fetched == ["a", "b", "a"]
+
+  def test_concurrent_misses_fetch_once(self):
+    """Verifies that concurrent requests for one asset share a fetch."""
+    release = threading.Event()
+    fetched = []
+
+    def slow_fetch(asset_id):
+      fetched.append(asset_id)
+      release.wait(timeout=5)
+      return asset_files.build_content_map({"f.bin": b"x"})
+
+    cache = lazy_assets.ContentCache(1000, slow_fetch)
+    threads = [
+        threading.Thread(target=cache.get, args=(("a", "1"),)) for _ in range(4)
+    ]
+    for thread in threads:
+      thread.start()
+    release.set()
+    for thread in threads:
+      thread.join()
+    assert fetched == ["a"]
+
+  @patch(
+      "services.platform_http_server.server.data_asset_utils.DataAssetsService"
+  )
+  def test_lazy_reload_lists_only_metadata(self, MockDataAssetsService):
+    """Verifies that a lazy reload fetches content only when it is served."""
+    metadata = MagicMock()
+    metadata.id_version.id.package = "ai.intrinsic"
+    metadata.id_version.id.name = "asset1"
+    metadata.id_version.version = "1.0.0"
+    mock_service = MockDataAssetsService.return_value
+    mock_service.list_data_asset_metadata.return_value = [metadata]
+    cache, fetched = self._make_cache(
+        1000, {"ai.intrinsic.asset1": {"index.html": b"<html>Lazy</html>"}}
+    )
+
+    content, versions, changes = server.reload_asset_metadata(cache, {})
+    mock_service.list_data_assets.assert_not_called()
+    assert changes.added == ["ai.intrinsic.asset1"]
+    assert "ai.intrinsic.asset1" in content
+    assert fetched == []
+
+    with server.update_lock:
+      server.update_snapshot(
+          state_code=3,
+          active_asset_id="ai.intrinsic.asset1",
+          all_assets_content=content,
+          asset_versions=versions,
+      )
+    with server.app.test_client() as client:
+      assert client.get("/").data == b"<html>Lazy</html>"
+      assert client.get("/").data == b"<html>Lazy</html>"
+    assert fetched == ["ai.intrinsic.asset1"]
+
+  def test_lazy_reload_drops_changed_content(self):
+    """Verifies that a new asset version is not served from the cache."""
+    cache, fetched = self._make_cache(1000, {"a": {"f.bin": b"x"}})
+    cache.get(("a", "1.0.0"))
+    metadata = MagicMock()
+    metadata.id_version.id.package = "ai.intrinsic"
+    metadata.id_version.id.name = "other"
+    metadata.id_version.version = "2.0.0"
+    with patch(
+        "services.platform_http_server.server.data_asset_utils.DataAssetsService"
+    ) as MockDataAssetsService:
+      MockDataAssetsService.return_value.list_data_asset_metadata.return_value = [
+          metadata
+      ]
+      _, _, changes = server.reload_asset_metadata(cache, {"a": "1.0.0"})
+    assert changes.removed == ["a"]
+    assert cache.cached_keys() == ()
+
+
+class TestResponseMetadata:
+  """Tests for the response metadata prepared when assets are loaded."""
+
+  def test_index_path_is_resolved_at_load_time(self):
+    """Verifies that the content map knows the file served on '/'."""
+    content_map = asset_files.build_content_map(
+        {"hello_world.html": b"<p>Hi</p>", "a.css": b"a {}"}
+    )
+    assert content_map.index_path == "hello_world.html"
+    assert asset_files.build_content_map({"a.css": b"a {}"}).index_path is None
+
+  def test_headers_are_precomputed_per_representation(self):
+    """Verifies the static headers of the raw and compressed variants."""
+    asset_file = asset_files.build_asset_file(
+        "a.css", b"a { color: red; }" * 50
+    )
+    identity = dict(asset_file.headers[None])
+    gzipped = dict(asset_file.headers["gzip"])
+    assert identity["Content-Type"] == "text/css; charset=utf-8"
+    assert identity["ETag"] == f'"{asset_file.digest}"'
+    assert identity["Accept-Ranges"] == "bytes"
+    assert gzipped["Content-Encoding"] == "gzip"
+    assert gzipped["Vary"] == "Accept-Encoding"
+    assert gzipped["X-Frame-Options"] == "SAMEORIGIN"
+
+  def test_unknown_mime_type_falls_back_to_octet_stream(self):
+    """Verifies the MIME type of files without a known extension."""
+    asset_file = asset_files.build_asset_file("data.unknownext", b"data")
+    assert asset_file.mime_type == "application/octet-stream"
+
+  def test_mime_type_with_line_break_is_rejected(self):
+    """Verifies that a malformed MIME type never reaches a header."""
+    with patch.object(
+        asset_files.mimetypes,
+        "guess_type",
+        return_value=("text/html\r\nX-Injected: 1", None),
+    ):
+      asset_file = asset_files.build_asset_file("page.html", b"<p>Hi</p>")
+    assert asset_file.mime_type == "application/octet-stream"
+
+  def test_json_responses_get_security_headers(self, client):
+    """Verifies that responses other than files still get them."""
+    response = client.get("/status")
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+    assert response.headers["Referrer-Policy"] == (
+        "strict-origin-when-cross-origin"
+    )
+
+
+class TestPreloadLinks:
+  """Tests for the Link preload headers derived from HTML pages."""
+
+  PAGE = b"""<!DOCTYPE html><html><head>
+      <link rel="stylesheet" href="css/style.css">
+      <link rel="icon" href="favicon.ico">
+      <link rel="alternate stylesheet" href="dark.css">
+      <script src="js/app.js"></script>
+      <script type="module" src="/js/main.mjs" crossorigin></script>
+      <script src="https://cdn.example.com/lib.js"></script>
+      <script src="//cdn.example.com/lib2.js"></script>
+      <script>inline();</script>
+      <script nomodule src="legacy.js"></script>
+    </head><body></body></html>"""
+
+  def test_same_origin_scripts_and_styles_are_found(self):
+    """Verifies the links, in document order and without other origins."""
+    assert preload_links.find_preload_links(self.PAGE) == (
+        "<css/style.css>; rel=preload; as=style",
+        "<js/app.js>; rel=preload; as=script",
+        "</js/main.mjs>; rel=modulepreload; crossorigin",
+    )
+
+  def test_pages_with_base_element_are_skipped(self):
+    """Verifies that references relative to a <base> are not preloaded."""
+    page = b'<base href="/other/"><script src="app.js"></script>'
+    assert preload_links.find_preload_links(page) == ()
+
+  def test_urls_cannot_break_out_of_the_header(self):
+    """Verifies that URLs are percent-encoded for the header."""
+    page = b'<script src="a b>\r\nX-Injected: 1,c.js"></script>'
+    (link,) = preload_links.find_preload_links(page)
+    assert (
+        link == "<a%20b%3E%0D%0AX-Injected:%201%2Cc.js>; rel=preload; as=script"
+    )
+
+  def test_number_of_links_is_bounded(self):
+    """Verifies that huge pages do not produce huge headers."""
+    page = b"".join(b'<script src="%d.js"></script>' % i for i in range(100))
+    assert len(preload_links.find_preload_links(page)) == (
+        preload_links.MAX_PRELOAD_LINKS
+    )
+
+  def test_index_response_carries_link_header(self, client):
+    """Verifies the header on the page and its absence elsewhere."""
+    with server.update_lock:
+      server.update_snapshot(
+          all_assets_content={
+              "ai.intrinsic.asset1": asset_files.build_content_map({
+                  "index.html": self.PAGE,
+                  "css/style.css": b"body {}",
+              })
+          }
+      )
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Link"] == (
+        "<css/style.css>; rel=preload; as=style,"
+        " <js/app.js>; rel=preload; as=script,"
+        " </js/main.mjs>; rel=modulepreload; crossorigin"
+    )
+    assert "Link" not in client.get("/css/style.css").headers
+
+
+class TestBlobStore:
+  """Tests for sharing identical files across data assets."""
+
+  def test_identical_files_are_shared(self):
+    """Verifies that equal content and MIME type map to one AssetFile."""
+    store = asset_files.BlobStore()
+    css = b"body { color: red; }" * 20
+    frontend_1 = asset_files.build_content_map(
+        {"hello_world.css": css, "hello_world.html": b"<p>1</p>"}, store
+    )
+    frontend_2 = asset_files.build_content_map(
+        {"hello_world.css": css, "hello_world.html": b"<p>2</p>"}, store
+    )
+    assert frontend_1["hello_world.css"] is frontend_2["hello_world.css"]
+    assert frontend_1["hello_world.html"] is not frontend_2["hello_world.html"]
+    assert len(store) == 3
+
+  def test_different_mime_types_are_not_shared(self):
+    """Verifies that the same bytes under another type get their own entry."""
+    store = asset_files.BlobStore()
+    content = b"x" * 1000
+    content_map = asset_files.build_content_map(
+        {"a.txt": content, "a.bin": content}, store
+    )
+    assert content_map["a.txt"].encodings
+    assert not content_map["a.bin"].encodings
+
+  def test_unused_files_are_released(self):
+    """Verifies that the store does not keep files alive on its own."""
+    store = asset_files.BlobStore()
+    content_map = asset_files.build_content_map({"a.txt": b"a"}, store)
+    assert len(store) == 1
+    del content_map
+    gc.collect()
+    assert len(store) == 0
+
+  @patch(
+      "services.platform_http_server.server.data_asset_utils.DataAssetsService"
+  )
+  def test_reload_shares_files_across_assets(self, MockDataAssetsService):
+    """Verifies that loaded assets point into the shared store."""
+    shared = {"hello_world.js": b"console.log('hello');" * 30}
+    MockDataAssetsService.return_value.list_data_assets.return_value = [
+        _make_mock_asset("frontend_1", "1.0.0", shared),
+        _make_mock_asset("frontend_2", "1.0.0", shared),
+    ]
+    content, _, _ = server.reload_assets({}, {})
+    assert (
+        content["ai.intrinsic.frontend_1"]["hello_world.js"]
+        is content["ai.intrinsic.frontend_2"]["hello_world.js"]
+    )
+
+
+class TestSnapshotDiskCache:
+  """Tests for persisting loaded assets and restoring them on startup."""
+
+  def test_save_and_load_round_trip(self, tmp_path, mock_assets):
+    """Verifies that restored assets match the saved ones byte for byte."""
+    content = {
+        asset_id: asset_files.build_content_map(files)
+        for asset_id, files in mock_assets.items()
+    }
+    versions = {"ai.intrinsic.asset1": "1.0.0", "ai.intrinsic.asset2": "2.0.0"}
+    cache = disk_cache.SnapshotDiskCache(str(tmp_path))
+    cache.save(content, versions)
+
+    restored_content, restored_versions = cache.load()
+    assert restored_versions == versions
+    for asset_id, files in mock_assets.items():
+      for path, data in files.items():
+        restored = restored_content[asset_id][path]
+        assert restored.content[:] == data
+        assert restored.digest == content[asset_id][path].digest
+    bundle = restored_content["ai.intrinsic.asset1"]["js/bundle.js"]
+    assert set(bundle.encodings) == {"br", "gzip"}
+    assert (
+        gzip.decompress(bundle.encodings["gzip"][:])
+        == mock_assets["ai.intrinsic.asset1"]["js/bundle.js"]
+    )
+
+  def test_identical_files_share_one_blob(self, tmp_path):
+    """Verifies that the cache is content-addressed."""
+    content = {
+        "ai.intrinsic.a": asset_files.build_content_map({"x.png": b"same"}),
+        "ai.intrinsic.b": asset_files.build_content_map({"y.png": b"same"}),
+    }
+    disk_cache.SnapshotDiskCache(str(tmp_path)).save(content, {})
+    assert len(list((tmp_path / "blobs").iterdir())) == 1
+
+  def test_unreferenced_blobs_are_deleted(self, tmp_path):
+    """Verifies that content of removed assets is garbage collected."""
+    cache = disk_cache.SnapshotDiskCache(str(tmp_path))
+    cache.save(
+        {"ai.intrinsic.a": asset_files.build_content_map({"x.png": b"old"})},
+        {},
+    )
+    cache.save(
+        {"ai.intrinsic.a": asset_files.build_content_map({"x.png": b"new"})},
+        {},
+    )
+    blobs = list((tmp_path / "blobs").iterdir())
+    assert [blob.read_bytes() for blob in blobs] == [b"new"]
+
+  def test_truncated_blob_drops_the_snapshot(self, tmp_path):
+    """Verifies that a blob cut short, e.g. by a power loss, is not served."""
+    content = {
+        "ai.intrinsic.a": asset_files.build_content_map({"x.png": b"content"})
+    }
+    cache = disk_cache.SnapshotDiskCache(str(tmp_path))
+    cache.save(content, {})
+    (blob,) = (tmp_path / "blobs").iterdir()
+    blob.write_bytes(b"cont")
+    assert cache.load() is None
+
+    # The next save writes the incomplete blob again.
+    cache.save(content, {})
+    restored_content, _ = cache.load()
+    assert restored_content["ai.intrinsic.a"]["x.png"].content[:] == b"content"
+
+  def test_missing_or_corrupt_cache(self, tmp_path):
+    """Verifies that an unusable cache is ignored instead of failing."""
+    cache = disk_cache.SnapshotDiskCache(str(tmp_path))
+    assert cache.load() is None
+    (tmp_path / "manifest.json").write_text("{not json")
+    assert cache.load() is None
+
+  def test_serve_restored_content(self, tmp_path, client, mock_assets):
+    """Verifies that memory-mapped content is served, in full and in ranges."""
+    content = {
+        asset_id: asset_files.build_content_map(files)
+        for asset_id, files in mock_assets.items()
+    }
+    cache = disk_cache.SnapshotDiskCache(str(tmp_path))
+    cache.save(content, {})
+    restored_content, _ = cache.load()
+    with server.update_lock:
+      server.update_snapshot(all_assets_content=restored_content)
+
+    video = mock_assets["ai.intrinsic.asset1"]["videos/intro.mp4"]
+    assert (
+        client.get("/").data == mock_assets["ai.intrinsic.asset1"]["index.html"]
+    )
+    assert client.get("/videos/intro.mp4").data == video
+    response = client.get("/videos/intro.mp4", headers={"Range": "bytes=5-9"})
+    assert response.data == video[5:10]
+
+
+def _wait_for_reload_jobs():
+  """Waits for the reload jobs the server has scheduled so far."""
+  for job in server._reload_scheduler.jobs():
+    server._reload_scheduler.wait(job["job_id"], timeout=5)
+
+
+def _call_asgi(app, method, path, headers=(), body=b"", messages=None):
+  """Sends one request to the ASGI 'app' and returns its response.
+
+  Args:
+      messages (list): If given, the ASGI messages sent are appended to it.
+
+  Returns:
+      tuple: The status code, the headers as a dict and the body.
+  """
+  scope = {
+      "type": "http",
+      "http_version": "1.1",
+      "method": method,
+      "path": path,
+      "query_string": b"",
+      "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+      "server": ("127.0.0.1", 8080),
+      "client": ("127.0.0.1", 12345),
+  }
+  messages = [] if messages is None else messages
+
+  async def receive():
+    return {"type": "http.request", "body": body, "more_body": False}
+
+  async def send(message):
+    messages.append(message)
+
+  asyncio.run(app(scope, receive, send))
+  start = messages[0]
+  response_headers = {k.decode(): v.decode() for k, v in start["headers"]}
+  response_body = b"".join(m.get("body", b"") for m in messages[1:])
+  return start["status"], response_headers, response_body
+
+
+class TestAsyncServing:
+  """Tests for serving through the ASGI bridge of the async mode."""
+
+  @pytest.fixture
+  def bridge(self, client):
+    with futures.ThreadPoolExecutor(max_workers=2) as executor:
+      yield asgi.WsgiBridge(server.app, executor)
+
+  def test_serves_files(self, bridge, mock_assets):
+    """Verifies that a file and its headers make it through the bridge."""
+    status, headers, body = _call_asgi(
+        bridge, "GET", "/js/bundle.js", [("Accept-Encoding", "gzip")]
+    )
+    assert status == 200
+    assert headers["content-encoding"] == "gzip"
+    assert headers["x-frame-options"] == "SAMEORIGIN"
+    assert (
+        gzip.decompress(body)
+        == mock_assets["ai.intrinsic.asset1"]["js/bundle.js"]
+    )
+
+  def test_streams_large_files(self, bridge, mock_assets):
+    """Verifies that every chunk of a streamed body is sent."""
+    server.app.config["STREAMING_THRESHOLD"] = 1024
+    try:
+      status, _, body = _call_asgi(bridge, "GET", "/videos/intro.mp4")
+    finally:
+      del server.app.config["STREAMING_THRESHOLD"]
+    assert status == 200
+    assert body == mock_assets["ai.intrinsic.asset1"]["videos/intro.mp4"]
+
+  def test_streams_bodies_from_the_pool_without_copies(self):
+    """Verifies that body chunks are produced in the pool and not copied."""
+    data = memoryview(b"abcdef")
+    threads = []
+
+    def body():
+      for start in range(0, len(data), 2):
+        threads.append(threading.current_thread())
+        yield data[start : start + 2]
+
+    def wsgi_app(environ, start_response):
+      start_response("200 OK", [])
+      return body()
+
+    messages = []
+    with futures.ThreadPoolExecutor(max_workers=1) as executor:
+      bridge = asgi.WsgiBridge(wsgi_app, executor)
+      _, _, response_body = _call_asgi(bridge, "GET", "/", messages=messages)
+    assert response_body == b"abcdef"
+    chunks = [m["body"] for m in messages[1:] if m["body"]]
+    assert all(isinstance(chunk, memoryview) for chunk in chunks)
+    assert threading.main_thread() not in threads
+
+  def test_passes_request_bodies(self, bridge):
+    """Verifies that JSON control requests are handled."""
+    status, _, _ = _call_asgi(
+        bridge,
+        "POST",
+        "/reconfigure",
+        [("Content-Type", "application/json")],
+        json.dumps({"data_asset_id": "ai.intrinsic.asset2"}).encode(),
+    )
+    assert status == 200
+    assert server.current_snapshot().active_asset_id == "ai.intrinsic.asset2"
+
+  @patch(
+      "services.platform_http_server.server._reload_assets_and_enable_service",
+      return_value=server.AssetChanges(),
+  )
+  def test_async_servicer(self, mock_reload):
+    """Verifies that the async RPCs share the servicer implementation."""
+    with server.update_lock:
+      server.update_snapshot(state_code=3)
+    with futures.ThreadPoolExecutor(max_workers=1) as executor:
+      servicer = server.AsyncPlatformHttpServicer(executor)
+      response = asyncio.run(servicer.GetState(MagicMock(), MagicMock()))
+      assert response.state_code == 3
+      asyncio.run(servicer.Enable(MagicMock(), MagicMock()))
+      _wait_for_reload_jobs()
+      mock_reload.assert_called_once()
+      asyncio.run(servicer.Disable(MagicMock(), MagicMock()))
+    assert server.current_snapshot().state_code == 2
+
+
+def _scrape(client):
+  """Returns the samples on /metrics, mapping each name and labels to a value."""
+  # Buffered, so that the response is closed and no longer in flight.
+  response = client.get("/metrics", buffered=True)
+  assert response.status_code == 200
+  samples = {}
+  for line in response.get_data(as_text=True).splitlines():
+    if line and not line.startswith("#"):
+      name, value = line.rsplit(" ", 1)
+      samples[name] = float(value)
+  return samples
+
+
+class TestMetrics:
+  """Tests for the metrics served on /metrics."""
+
+  def test_counters_of_all_threads_are_merged(self):
+    """Verifies that values recorded in other threads are summed on scrape."""
+    registry = metrics.Registry()
+    counter = registry.counter("requests_total", "Requests.", ("code",))
+    threads = [
+        threading.Thread(
+            target=lambda: [counter.inc(("200",)) for _ in range(1000)]
+        )
+        for _ in range(4)
+    ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    counter.inc(("304",), 2)
+    assert registry.render() == (
+        "# HELP requests_total Requests.\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{code="200"} 4000\n'
+        'requests_total{code="304"} 2\n'
+    )
+
+  def test_shards_of_ended_threads_are_retired(self):
+    """Verifies that threads that ended keep their counts but no shard."""
+    registry = metrics.Registry()
+    counter = registry.counter("jobs_total", "Jobs.")
+    histogram = registry.histogram("job_seconds", "Job time.", buckets=(1,))
+    for _ in range(10):
+      thread = threading.Thread(
+          target=lambda: (counter.inc(), histogram.observe(0.5))
+      )
+      thread.start()
+      thread.join()
+    gc.collect()
+    assert not registry._shards
+    lines = registry.render().splitlines()
+    assert "jobs_total 10" in lines
+    assert 'job_seconds_bucket{le="1"} 10' in lines
+    assert "job_seconds_count 10" in lines
+
+  def test_histogram_buckets_are_cumulative(self):
+    """Verifies the buckets, sum and count of a histogram."""
+    registry = metrics.Registry()
+    histogram = registry.histogram(
+        "latency_seconds", "Latency.", ("route",), buckets=(0.1, 1)
+    )
+    for value in (0.05, 0.5, 0.5, 5):
+      histogram.observe(value, ('a"b',))
+    lines = registry.render().splitlines()
+    assert lines[2:] == [
+        'latency_seconds_bucket{route="a\\"b",le="0.1"} 1',
+        'latency_seconds_bucket{route="a\\"b",le="1"} 3',
+        'latency_seconds_bucket{route="a\\"b",le="+Inf"} 4',
+        'latency_seconds_sum{route="a\\"b"} 6.05',
+        'latency_seconds_count{route="a\\"b"} 4',
+    ]
+
+  def test_responses_and_bytes_are_counted(self, client, mock_assets):
+    """Verifies the per-route counters of 200 and 304 responses."""
+    etag = client.get("/css/style.css").headers["ETag"]
+    before = _scrape(client)
+    client.get("/css/style.css", buffered=True)
+    client.get("/css/style.css", headers={"If-None-Match": etag}, buffered=True)
+    after = _scrape(client)
+
+    def delta(name):
+      return after.get(name, 0) - before.get(name, 0)
+
+    ok = 'platform_http_server_responses_total{route="serve_file",code="200"}'
+    not_modified = ok.replace("200", "304")
+    assert delta(ok) == 1
+    assert delta(not_modified) == 1
+    assert delta(
+        "platform_http_server_served_bytes_total"
+        '{data_asset_id="ai.intrinsic.asset1"}'
+    ) == len(mock_assets["ai.intrinsic.asset1"]["css/style.css"])
+    assert (
+        delta(
+            "platform_http_server_request_duration_seconds_count"
+            '{route="serve_file"}'
+        )
+        == 2
+    )
+    # Only the scrape itself is in flight.
+    assert delta("platform_http_server_in_flight_requests") == 0
+
+  def test_streamed_responses_are_in_flight_until_closed(self, client):
+    """Verifies that a streamed body counts as in flight until it is sent."""
+    client.application.config["STREAMING_THRESHOLD"] = 1024
+    try:
+      in_flight = "platform_http_server_in_flight_requests"
+      before = _scrape(client)[in_flight]
+      response = client.get("/videos/intro.mp4")
+      assert _scrape(client)[in_flight] == before + 1
+      response.close()
+      assert _scrape(client)[in_flight] == before
+    finally:
+      del client.application.config["STREAMING_THRESHOLD"]
+
+  def test_resident_bytes_and_lock_waits(self, client, mock_assets):
+    """Verifies the scrape-time gauges and the update lock histogram."""
+    samples = _scrape(client)
+    size = sum(len(c) for c in mock_assets["ai.intrinsic.asset2"].values())
+    assert (
+        samples[
+            "platform_http_server_resident_content_bytes"
+            '{data_asset_id="ai.intrinsic.asset2"}'
+        ]
+        >= size
+    )
+    # The client fixture took the update lock.
+    assert (
+        samples['platform_http_server_lock_wait_seconds_count{lock="update"}']
+        >= 1
+    )
+
+  def test_content_type(self, client):
+    """Verifies the content type Prometheus expects."""
+    response = client.get("/metrics")
+    assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
 
 
 class TestGrpcServicer:
@@ -312,32 +1676,37 @@ class TestGrpcServicer:
   def setup_servicer(self):
     """Sets up the servicer instance and mock context before each test."""
     # Reset Global State
-    server._SERVICE_STATE["state_code"] = 2
+    with server.update_lock:
+      server.update_snapshot(state_code=2)
     self.servicer = server.PlatformHttpServicer()
     self.mock_context = MagicMock()
 
   def test_get_state(self):
     """Verifies GetState returns the correct state code."""
-    server._SERVICE_STATE["state_code"] = 3
+    with server.update_lock:
+      server.update_snapshot(state_code=3)
     request = MagicMock()
     response = self.servicer.GetState(request, self.mock_context)
     assert response.state_code == 3
 
   @patch(
-      "services.platform_http_server.server._reload_assets_and_enable_service"
+      "services.platform_http_server.server._reload_assets_and_enable_service",
+      return_value=server.AssetChanges(),
   )
   def test_enable_rpc(self, mock_reload):
     """Verifies the Enable RPC triggers a reload."""
     request = MagicMock()
     self.servicer.Enable(request, self.mock_context)
+    _wait_for_reload_jobs()
     mock_reload.assert_called_once()
 
   def test_disable_rpc(self):
     """Verifies the Disable RPC updates the global state code."""
-    server._SERVICE_STATE["state_code"] = 3
+    with server.update_lock:
+      server.update_snapshot(state_code=3)
     request = MagicMock()
     self.servicer.Disable(request, self.mock_context)
-    assert server._SERVICE_STATE["state_code"] == 2
+    assert server.current_snapshot().state_code == 2
 
   def test_concurrency_lock(self):
     """Verifies that the concurrency lock is acquired during state changes."""
@@ -0,0 +1,160 @@
+"""Compares the throughput of batch and single-item point storage RPCs.
+
+Runs the point storage service in-process on a local gRPC port. By default it
+is backed by an in-memory key-value store that adds a configurable delay to
+every call to imitate the round trip to the platform's store. With
+--backend=sqlite it uses the local SQLite backend in a temporary directory
+instead, as a baseline for the overhead of the key-value store. Then stores,
+reads and deletes the same points once with one RPC per point and once with
+batch RPCs.
+
+Usage:
+  bazel run //services/point_storage:benchmark -- --num_points=500
+  bazel run //services/point_storage:benchmark -- --backend=sqlite
+"""
+
+from concurrent import futures
+import os
+import tempfile
+import time
+
+from absl import app
+from absl import flags
+from absl import logging
+from google.protobuf import any_pb2
+import grpc
+from services.point_storage import point_storage_service
+from services.point_storage import point_storage_service_pb2 as point_storage_proto
+from services.point_storage import point_storage_service_pb2_grpc as point_storage_grpc
+from services.point_storage import storage
+
+FLAGS = flags.FLAGS
+flags.DEFINE_integer("num_points", 500, "The number of points, e.g. a grid.")
+flags.DEFINE_integer(
+    "batch_size",
+    point_storage_service.MAX_BATCH_SIZE,
+    "The number of points per batch RPC.",
+)
+flags.DEFINE_enum(
+    "backend",
+    "kvstore",
+    ["kvstore", "sqlite"],
+    "The storage backend: the in-memory key-value store, or SQLite.",
+)
+flags.DEFINE_float(
+    "kvstore_latency_ms",
+    1.0,
+    "The delay added to every call to the key-value store.",
+)
+
+
+class InMemoryKeyValueStore:
+  """Stands in for the platform's key-value store, with a fixed latency."""
+
+  def __init__(self, latency_seconds: float):
+    self._latency_seconds = latency_seconds
+    self._values = {}
+
+  def Set(self, key, value):
+    time.sleep(self._latency_seconds)
+    wrapped = any_pb2.Any()
+    wrapped.Pack(value)
+    self._values[key] = wrapped
+
+  def Get(self, key):
+    time.sleep(self._latency_seconds)
+    if key not in self._values:
+      raise RuntimeError(f"NOT_FOUND: key {key} not found")
+    return self._values[key]
+
+  def GetAllSynchronous(self, key_expression):
+    time.sleep(self._latency_seconds)
+    prefix = key_expression.removesuffix("**")
+    return {
+        f"kv_store/{key}": value
+        for key, value in self._values.items()
+        if key.startswith(prefix)
+    }
+
+  def Delete(self, key):
+    time.sleep(self._latency_seconds)
+    self._values.pop(key, None)
+
+
+def _names():
+  return [f"grid/point_{i}" for i in range(FLAGS.num_points)]
+
+
+def _batches(items):
+  for start in range(0, len(items), FLAGS.batch_size):
+    yield items[start : start + FLAGS.batch_size]
+
+
+def _run_single(stub):
+  for i, name in enumerate(_names()):
+    stub.Put(
+        point_storage_proto.PutRequest(
+            name=name, point=point_storage_proto.Point(x=i, y=i, z=0)
+        )
+    )
+  for name in _names():
+    stub.Get(point_storage_proto.GetRequest(name=name))
+  for name in _names():
+    stub.Delete(point_storage_proto.DeleteRequest(name=name))
+
+
+def _run_batched(stub):
+  items = [
+      point_storage_proto.NamedPoint(
+          name=name, point=point_storage_proto.Point(x=i, y=i, z=0)
+      )
+      for i, name in enumerate(_names())
+  ]
+  for batch in _batches(items):
+    stub.PutMany(point_storage_proto.PutManyRequest(items=batch))
+  for batch in _batches(_names()):
+    stub.GetMany(point_storage_proto.GetManyRequest(names=batch))
+  for batch in _batches(_names()):
+    stub.DeleteMany(point_storage_proto.DeleteManyRequest(names=batch))
+
+
+def _run_benchmark(backend: storage.StorageBackend):
+  servicer = point_storage_service.PointStorageServicer(backend)
+  server = grpc.server(futures.ThreadPoolExecutor())
+  point_storage_grpc.add_PointStorageServiceServicer_to_server(servicer, server)
+  port = server.add_insecure_port("localhost:0")
+  server.start()
+  try:
+    with grpc.insecure_channel(f"localhost:{port}") as channel:
+      stub = point_storage_grpc.PointStorageServiceStub(channel)
+      for name, run in (("single", _run_single), ("batched", _run_batched)):
+        start = time.perf_counter()
+        run(stub)
+        elapsed = time.perf_counter() - start
+        # Every point is stored, read and deleted once.
+        operations = 3 * FLAGS.num_points
+        print(
+            f"{name:<8} {elapsed:8.3f}s {operations / elapsed:10.0f} points/s"
+        )
+  finally:
+    server.stop(grace=None)
+
+
+def main(argv):
+  del argv  # Unused.
+  logging.set_verbosity(logging.WARNING)
+  if FLAGS.backend == "sqlite":
+    with tempfile.TemporaryDirectory() as database_dir:
+      _run_benchmark(
+          storage.SqliteBackend(os.path.join(database_dir, "points.db"))
+      )
+  else:
+    _run_benchmark(
+        storage.KeyValueStoreBackend(
+            InMemoryKeyValueStore(FLAGS.kvstore_latency_ms / 1000)
+        )
+    )
+
+
+if __name__ == "__main__":
+  app.run(main)
@@ -0,0 +1,105 @@
+"""Sorted index of the point names, for listing the points under a prefix.
+
+Point names are hierarchical by convention, e.g. "fixture_3/corner_1". Keeping
+the names sorted puts all names with the same prefix next to each other, so
+listing them is a binary search for the first one and a scan over the matches
+only, however many other points are stored.
+"""
+
+import bisect
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from services.point_storage import spatial_index
+
+# The name and coordinates of a point.
+NamedCoordinates = Tuple[str, spatial_index.Coordinates]
+
+
+class NameIndex:
+  """Points by name, listable in name order by prefix.
+
+  Not thread-safe, callers serialize access.
+  """
+
+  def __init__(
+      self, points: Iterable[Tuple[str, spatial_index.Coordinates]] = ()
+  ):
+    """Builds the index.
+
+    Args:
+      points: (name, coordinates) pairs. Of several with the same name, the
+        last one is kept.
+    """
+    self._coordinates: Dict[str, spatial_index.Coordinates] = {
+        name: tuple(coordinates) for name, coordinates in points
+    }
+    self._names: List[str] = sorted(self._coordinates)
+
+  def __len__(self) -> int:
+    return len(self._names)
+
+  def insert(self, name: str, coordinates: spatial_index.Coordinates) -> None:
+    """Adds the point, or updates its coordinates."""
+    if name not in self._coordinates:
+      # Shifts the names after it, which is a fast memmove even for many
+      # thousands of points.
+      bisect.insort(self._names, name)
+    self._coordinates[name] = tuple(coordinates)
+
+  def remove(self, name: str) -> None:
+    """Removes the point, if it is indexed."""
+    if self._coordinates.pop(name, None) is None:
+      return
+    del self._names[bisect.bisect_left(self._names, name)]
+
+  def differences(
+      self, other: "NameIndex"
+  ) -> List[Tuple[str, Optional[spatial_index.Coordinates]]]:
+    """Returns the points that 'other' holds differently, in name order.
+
+    Returns:
+      (name, coordinates) pairs of the points that 'other' adds or moves, and
+      (name, None) pairs of the ones it doesn't hold.
+    """
+    changed = [
+        (name, coordinates)
+        for name, coordinates in other._coordinates.items()
+        if self._coordinates.get(name) != coordinates
+    ]
+    changed.extend(
+        (name, None)
+        for name in self._coordinates
+        if name not in other._coordinates
+    )
+    changed.sort(key=lambda entry: entry[0])
+    return changed
+
+  def list(
+      self, prefix: str, after: Optional[str], limit: int
+  ) -> Tuple[List[NamedCoordinates], bool]:
+    """Lists the points whose names start with 'prefix', in name order.
+
+    Args:
+      prefix: The prefix of the names, empty for all points.
+      after: Only names greater than this one are listed, if given.
+      limit: The maximum number of points to return.
+
+    Returns:
+      The points, and whether more points follow them.
+    """
+    start = bisect.bisect_left(self._names, prefix)
+    if after is not None:
+      start = max(start, bisect.bisect_right(self._names, after))
+    matches = []
+    for position in range(start, len(self._names)):
+      name = self._names[position]
+      if not name.startswith(prefix):
+        break
+      if len(matches) == limit:
+        return matches, True
+      matches.append((name, self._coordinates[name]))
+    return matches, False
@@ -0,0 +1,44 @@
+import unittest
+
+from services.point_storage import name_index
+
+
+class NameIndexTest(unittest.TestCase):
+
+  def test_list_by_prefix_and_page(self):
+    index = name_index.NameIndex(
+        [("b/1", (1.0, 0.0, 0.0)), ("a/2", (2.0, 0.0, 0.0))]
+    )
+    index.insert("a/1", (3.0, 0.0, 0.0))
+    index.insert("a/3", (4.0, 0.0, 0.0))
+    index.insert("a/2", (5.0, 0.0, 0.0))
+    self.assertEqual(len(index), 4)
+
+    self.assertEqual(
+        index.list("a/", None, 2),
+        ([("a/1", (3.0, 0.0, 0.0)), ("a/2", (5.0, 0.0, 0.0))], True),
+    )
+    self.assertEqual(
+        index.list("a/", "a/2", 2), ([("a/3", (4.0, 0.0, 0.0))], False)
+    )
+    index.remove("a/3")
+    index.remove("missing")
+    self.assertEqual(index.list("a/", "a/2", 2), ([], False))
+    self.assertEqual(index.list("", None, 10)[0][-1][0], "b/1")
+
+  def test_differences(self):
+    old = name_index.NameIndex(
+        [("a", (1.0, 0.0, 0.0)), ("b", (2.0, 0.0, 0.0)), ("c", (3.0, 0.0, 0.0))]
+    )
+    new = name_index.NameIndex(
+        [("a", (1.0, 0.0, 0.0)), ("c", (4.0, 0.0, 0.0)), ("d", (5.0, 0.0, 0.0))]
+    )
+    self.assertEqual(
+        old.differences(new),
+        [("b", None), ("c", (4.0, 0.0, 0.0)), ("d", (5.0, 0.0, 0.0))],
+    )
+    self.assertEqual(new.differences(new), [])
+
+
+if __name__ == "__main__":
+  unittest.main()
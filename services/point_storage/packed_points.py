@@ -0,0 +1,96 @@
+"""Client helpers moving many points as NumPy arrays.
+
+ExportPacked and ImportPacked carry the coordinates of up to thousands of
+points as one buffer of little-endian float32 values per message. These
+helpers load that buffer into an (n, 3) array, and build it from one, without
+creating a message or any other object per point.
+
+Usage:
+  stub = point_storage_grpc.PointStorageServiceStub(channel)
+  names, coordinates = packed_points.export_points(stub, prefix="fixture_3/")
+  packed_points.import_points(stub, names, coordinates + offset)
+"""
+
+from typing import Iterator
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+from services.point_storage import point_storage_service_pb2 as point_storage_proto
+
+# The number of points per message that import_points() sends.
+DEFAULT_CHUNK_SIZE = 10000
+
+_WIRE_DTYPE = np.dtype("<f4")
+
+
+def export_points(stub, prefix: str = "") -> Tuple[List[str], np.ndarray]:
+  """Exports the points whose names start with 'prefix'.
+
+  Args:
+    stub: A PointStorageServiceStub.
+    prefix: The prefix of the names, empty for all points.
+
+  Returns:
+    The names of the points, ordered by name, and their coordinates as an
+    (n, 3) float32 array in the same order.
+  """
+  names = []
+  buffers = []
+  for chunk in stub.ExportPacked(
+      point_storage_proto.ExportPackedRequest(prefix=prefix)
+  ):
+    names.extend(chunk.names)
+    buffers.append(chunk.coordinates)
+  coordinates = np.frombuffer(b"".join(buffers), dtype=_WIRE_DTYPE)
+  return names, coordinates.astype(np.float32).reshape(-1, 3)
+
+
+def packed_chunks(
+    names: Sequence[str],
+    coordinates: np.ndarray,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[point_storage_proto.PackedPoints]:
+  """Yields the points as PackedPoints messages of up to 'chunk_size' points.
+
+  Raises:
+    ValueError: If 'coordinates' isn't of shape (len(names), 3).
+  """
+  coordinates = np.asarray(coordinates, dtype=_WIRE_DTYPE)
+  if coordinates.shape != (len(names), 3):
+    raise ValueError(
+        f"expected coordinates of shape ({len(names)}, 3) for the names, got"
+        f" {coordinates.shape}"
+    )
+  for start in range(0, len(names), chunk_size):
+    yield point_storage_proto.PackedPoints(
+        names=names[start : start + chunk_size],
+        coordinates=coordinates[start : start + chunk_size].tobytes(),
+    )
+
+
+def import_points(
+    stub,
+    names: Sequence[str],
+    coordinates: np.ndarray,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+  """Stores the points, replacing the ones with the same names.
+
+  Args:
+    stub: A PointStorageServiceStub.
+    names: The names of the points.
+    coordinates: The coordinates of the points, as an (n, 3) array in the
+      order of the names.
+    chunk_size: The number of points per message.
+
+  Returns:
+    The number of points stored.
+
+  Raises:
+    ValueError: If 'coordinates' isn't of shape (len(names), 3).
+  """
+  # Validates the shape before the call starts.
+  chunks = list(packed_chunks(names, coordinates, chunk_size))
+  return stub.ImportPacked(iter(chunks)).count
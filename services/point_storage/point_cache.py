@@ -0,0 +1,113 @@
+"""In-process cache of decoded points, in front of the storage backend.
+
+Reads fill the cache, writes of this replica update it, and changes made by
+other replicas invalidate it. Entries also expire after a while, which bounds
+how long a point can be stale if a change notification is lost.
+"""
+
+import collections
+import threading
+import time
+from typing import Callable
+from typing import Dict
+from typing import Optional
+
+from services.point_storage import point_storage_service_pb2 as point_storage_proto
+
+# Upper bound of the number of cached points. The least recently used ones are
+# evicted first.
+DEFAULT_MAX_ENTRIES = 10000
+
+# The time after which a cached point is read from the storage backend again.
+DEFAULT_MAX_AGE_SECONDS = 30.0
+
+
+class PointCache:
+  """Thread-safe LRU cache of points by name, with hit and miss counters.
+
+  A read that misses fetches the point itself and then calls fill(). To keep
+  the cache from holding a value that a concurrent write has replaced, the
+  reader takes a generation() before fetching, and fill() drops the point if
+  any write or invalidation happened in between.
+  """
+
+  def __init__(
+      self,
+      max_entries: int = DEFAULT_MAX_ENTRIES,
+      max_age_seconds: float = DEFAULT_MAX_AGE_SECONDS,
+      clock: Callable[[], float] = time.monotonic,
+  ):
+    self._max_entries = max_entries
+    self._max_age_seconds = max_age_seconds
+    self._clock = clock
+    self._lock = threading.Lock()
+    # Maps names to (point, expiry time), least recently used first.
+    self._entries = collections.OrderedDict()
+    self._generation = 0
+    self._hits = 0
+    self._misses = 0
+    self._invalidations = 0
+    self._evictions = 0
+
+  def get(self, name: str) -> Optional[point_storage_proto.Point]:
+    """Returns the cached point, or None on a miss.
+
+    The returned message is shared with the cache and must not be modified.
+    """
+    with self._lock:
+      entry = self._entries.get(name)
+      if entry is not None and entry[1] <= self._clock():
+        del self._entries[name]
+        entry = None
+      if entry is None:
+        self._misses += 1
+        return None
+      self._entries.move_to_end(name)
+      self._hits += 1
+      return entry[0]
+
+  def generation(self) -> int:
+    """Returns a token to pass to fill() after fetching a missed point."""
+    with self._lock:
+      return self._generation
+
+  def fill(
+      self, name: str, point: point_storage_proto.Point, generation: int
+  ) -> None:
+    """Caches a point fetched from the store, unless it may be outdated."""
+    with self._lock:
+      if generation == self._generation:
+        self._store(name, point)
+
+  def put(self, name: str, point: point_storage_proto.Point) -> None:
+    """Caches the point just written by this replica."""
+    with self._lock:
+      self._generation += 1
+      self._store(name, point)
+
+  def invalidate(self, name: str) -> None:
+    """Drops the cached point, e.g. after it was changed or deleted."""
+    with self._lock:
+      self._generation += 1
+      self._invalidations += 1
+      self._entries.pop(name, None)
+
+  def stats(self) -> Dict[str, int]:
+    """Returns the counters of the cache."""
+    with self._lock:
+      return {
+          "hits": self._hits,
+          "misses": self._misses,
+          "invalidations": self._invalidations,
+          "evictions": self._evictions,
+          "entries": len(self._entries),
+      }
+
+  def _store(self, name, point):
+    cached = point_storage_proto.Point()
+    cached.CopyFrom(point)
+    self._entries[name] = (cached, self._clock() + self._max_age_seconds)
+    self._entries.move_to_end(name)
+    while len(self._entries) > self._max_entries:
+      self._entries.popitem(last=False)
+      self._evictions += 1
@@ -0,0 +1,79 @@
+import unittest
+
+from services.point_storage import point_cache
+from services.point_storage import point_storage_service_pb2 as point_storage_proto
+
+_POINT_A = point_storage_proto.Point(x=1.0, y=2.0, z=3.0)
+_POINT_B = point_storage_proto.Point(x=10.0, y=20.0, z=30.0)
+
+
+class FakeClock:
+
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+
+class PointCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.clock = FakeClock()
+    self.cache = point_cache.PointCache(
+        max_entries=2, max_age_seconds=30.0, clock=self.clock
+    )
+
+  def test_hits_and_misses(self):
+    self.assertIsNone(self.cache.get("a"))
+    self.cache.fill("a", _POINT_A, self.cache.generation())
+    self.assertEqual(self.cache.get("a"), _POINT_A)
+    self.assertEqual(self.cache.stats()["hits"], 1)
+    self.assertEqual(self.cache.stats()["misses"], 1)
+
+  def test_entries_expire(self):
+    self.cache.put("a", _POINT_A)
+    self.clock.now = 29.0
+    self.assertEqual(self.cache.get("a"), _POINT_A)
+    self.clock.now = 30.0
+    self.assertIsNone(self.cache.get("a"))
+    self.assertEqual(self.cache.stats()["entries"], 0)
+    self.assertEqual(self.cache.stats()["misses"], 1)
+
+  def test_least_recently_used_is_evicted(self):
+    self.cache.put("a", _POINT_A)
+    self.cache.put("b", _POINT_B)
+    self.cache.get("a")
+    self.cache.put("c", _POINT_B)
+    self.assertIsNone(self.cache.get("b"))
+    self.assertEqual(self.cache.get("a"), _POINT_A)
+    self.assertEqual(self.cache.stats()["evictions"], 1)
+
+  def test_invalidate(self):
+    self.cache.put("a", _POINT_A)
+    self.cache.invalidate("a")
+    self.assertIsNone(self.cache.get("a"))
+    self.assertEqual(self.cache.stats()["invalidations"], 1)
+
+  def test_fill_after_concurrent_write_is_dropped(self):
+    generation = self.cache.generation()
+    # Another thread writes the point while this one reads the old value.
+    self.cache.put("a", _POINT_B)
+    self.cache.fill("a", _POINT_A, generation)
+    self.assertEqual(self.cache.get("a"), _POINT_B)
+
+    generation = self.cache.generation()
+    self.cache.invalidate("b")
+    self.cache.fill("b", _POINT_A, generation)
+    self.assertIsNone(self.cache.get("b"))
+
+  def test_cached_point_is_a_copy(self):
+    pt = point_storage_proto.Point(x=1.0)
+    self.cache.put("a", pt)
+    pt.x = 2.0
+    self.assertEqual(self.cache.get("a").x, 1.0)
+
+
+if __name__ == "__main__":
+  unittest.main()
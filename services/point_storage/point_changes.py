@@ -0,0 +1,116 @@
+"""Shares the changes of points between the replicas of the service.
+
+Every replica publishes a PointChange message when it stores or deletes a
+point, and subscribes to the messages of the others. Listeners in this process
+see both: the changes made here right away, and the ones made by other
+replicas as their messages arrive.
+"""
+
+import threading
+from typing import Callable
+from typing import List
+from typing import Optional
+import uuid
+
+from absl import logging
+from intrinsic.platform.pubsub.python import pubsub
+from services.point_storage import point_storage_service_pb2 as point_storage_proto
+
+# The pubsub topic the replicas exchange PointChange messages on.
+CHANGES_TOPIC = "ai.intrinsic/point_changes"
+
+# Called with a change and whether it was made by this replica.
+Listener = Callable[[point_storage_proto.PointChange, bool], None]
+
+# Called when a change of another replica may have been missed.
+ErrorListener = Callable[[], None]
+
+
+class ChangeFeed:
+  """Publishes the changes of this replica and receives the ones of others.
+
+  Without a pubsub instance, changes only reach the listeners in this process,
+  which suits a single replica, e.g. in tests and benchmarks.
+  """
+
+  def __init__(self, pubsub_instance=None):
+    """Initializes the feed.
+
+    Args:
+      pubsub_instance: The platform's pubsub to exchange changes over, or None
+        to keep them in this process.
+
+    Raises:
+      RuntimeError: If the publisher or the subscription can't be created.
+    """
+    # Tells the messages of this replica apart from the ones of others.
+    self._origin = uuid.uuid4().hex
+    self._lock = threading.Lock()
+    self._listeners: List[Listener] = []
+    self._error_listeners: List[ErrorListener] = []
+    self._publisher = None
+    self._subscription = None
+    if pubsub_instance is not None:
+      self._publisher = pubsub_instance.CreatePublisher(
+          CHANGES_TOPIC, pubsub.TopicConfig()
+      )
+      self._subscription = pubsub_instance.CreateSubscription(
+          topic=CHANGES_TOPIC,
+          config=pubsub.TopicConfig(),
+          exemplar=point_storage_proto.PointChange(),
+          msg_callback=self._on_message,
+          error_callback=self._on_error,
+      )
+
+  def add_listener(self, listener: Listener) -> None:
+    """Calls 'listener' for every change from now on."""
+    with self._lock:
+      self._listeners.append(listener)
+
+  def add_error_listener(self, listener: ErrorListener) -> None:
+    """Calls 'listener' whenever receiving a change failed from now on."""
+    with self._lock:
+      self._error_listeners.append(listener)
+
+  def publish(
+      self, name: str, point: Optional[point_storage_proto.Point] = None
+  ) -> None:
+    """Announces that this replica stored 'point', or deleted it if None."""
+    change = point_storage_proto.PointChange(name=name, origin=self._origin)
+    if point is None:
+      change.deleted = True
+    else:
+      change.point.CopyFrom(point)
+    self._notify(change, local=True)
+    if self._publisher is None:
+      return
+    try:
+      self._publisher.Publish(change)
+    except RuntimeError as e:
+      # The write itself succeeded. Other replicas see it once their cached
+      # copy expires and once they rebuild their indexes from the store.
+      logging.warning("Failed to publish the change of point %s: %s", name, e)
+
+  def _on_message(self, change: point_storage_proto.PointChange) -> None:
+    if change.origin == self._origin:
+      return
+    self._notify(change, local=False)
+
+  def _on_error(self, packet, error) -> None:
+    del packet  # Unused.
+    logging.warning("Failed to receive a point change: %s", error)
+    with self._lock:
+      listeners = list(self._error_listeners)
+    for listener in listeners:
+      listener()
+
+  def _notify(self, change, local):
+    with self._lock:
+      listeners = list(self._listeners)
+    for listener in listeners:
+      try:
+        listener(change, local)
+      except Exception as e:
+        logging.error(
+            "Failed to apply the change of point %s: %s", change.name, e
+        )
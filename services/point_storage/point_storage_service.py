@@ -1,39 +1,406 @@
 #!/usr/bin/env python3
 
+import array
+import base64
+import contextlib
+import hashlib
+import itertools
 from concurrent.futures import ThreadPoolExecutor
 import sys
+import threading
+import time
+from typing import Iterable
+from typing import List
+from typing import Sequence
 
+from absl import app
+from absl import flags
 from absl import logging
 import grpc
 from intrinsic.platform.pubsub.python import pubsub
 from intrinsic.resources.proto import runtime_context_pb2
+from services.point_storage import name_index
+from services.point_storage import point_cache
+from services.point_storage import point_changes
 from services.point_storage import point_storage_service_pb2 as point_storage_proto
 from services.point_storage import point_storage_service_pb2_grpc as point_storage_grpc
+from services.point_storage import spatial_index
+from services.point_storage import storage
+from services.point_storage import watchers
 
-logger = logging.getLogger(__name__)
+FLAGS = flags.FLAGS
+flags.DEFINE_integer(
+    "port",
+    None,
+    "The port to serve on instead of the one of the runtime context, e.g. to"
+    " run the service without the platform.",
+)
+flags.DEFINE_string(
+    "sqlite_path",
+    None,
+    "Stores the points in this SQLite database instead of the backend of the"
+    " config.",
+)
 
+# Upper bound of the number of items in one batch request.
+MAX_BATCH_SIZE = 1000
 
-def make_key(point_name: str) -> str:
-  return f"ai.intrinsic/points/{point_name}"
+# The number of items of a batch request that are sent to the storage backend
+# at the same time.
+BATCH_PARALLELISM = 16
+
+# Upper bound of the page size of GetAll and the chunk size of StreamAll.
+MAX_PAGE_SIZE = 1000
+
+# The number of points per response of StreamAll if the request sets none.
+DEFAULT_CHUNK_SIZE = 500
+
+# Upper bound of the number of points returned by the Find RPCs.
+MAX_FIND_RESULTS = 1000
+
+# The number of points per message of ExportPacked.
+PACKED_CHUNK_SIZE = 10000
+
+# The number of changes queued for a Watch call. A client that falls further
+# behind is sent a new snapshot instead.
+WATCH_QUEUE_SIZE = 1000
+
+# Upper bound of the number of Watch calls in progress. Each holds a server
+# thread for as long as it runs, so further ones fail with RESOURCE_EXHAUSTED
+# rather than starving the other RPCs.
+MAX_CONCURRENT_WATCHES = 16
+
+# The number of server threads kept for the RPCs other than Watch.
+UNARY_RPC_THREADS = 16
+
+# How long the indexes answer queries before they are rebuilt from the store.
+# Bounds how long a change is missing from them if its notification was lost,
+# or if it was made by another client of the store.
+INDEX_MAX_AGE_SECONDS = 60.0
+
+# How often a Watch call without changes checks whether the client is gone.
+_WATCH_POLL_SECONDS = 1.0
+
+# The number of locks that writes of the same point serialize on. Points are
+# spread over them by name.
+_KEY_LOCK_STRIPES = 64
+
+
+def encode_page_token(last_name: str) -> str:
+  """Returns the token of the page after the point named 'last_name'."""
+  return base64.urlsafe_b64encode(last_name.encode()).decode()
+
+
+def decode_page_token(page_token: str) -> str:
+  """Returns the name of the last point before the page of 'page_token'.
+
+  Raises:
+    ValueError: If the token is malformed.
+  """
+  return base64.b64decode(page_token, altchars=b"-_", validate=True).decode()
+
+
+def _coordinates(pt: point_storage_proto.Point) -> spatial_index.Coordinates:
+  return (pt.x, pt.y, pt.z)
+
+
+def _point(coordinates: spatial_index.Coordinates) -> point_storage_proto.Point:
+  x, y, z = coordinates
+  return point_storage_proto.Point(x=x, y=y, z=z)
+
+
+def point_version(pt: point_storage_proto.Point) -> str:
+  """Returns the version of a stored point, which changes with its value."""
+  return hashlib.blake2b(
+      pt.SerializeToString(deterministic=True), digest_size=8
+  ).hexdigest()
+
+
+def _pack_coordinates(
+    coordinates: Iterable[spatial_index.Coordinates],
+) -> bytes:
+  """Returns the coordinates as consecutive little-endian float32 values."""
+  values = array.array("f", itertools.chain.from_iterable(coordinates))
+  if sys.byteorder == "big":
+    values.byteswap()
+  return values.tobytes()
+
+
+def _unpack_coordinates(packed: bytes) -> array.array:
+  values = array.array("f")
+  values.frombytes(packed)
+  if sys.byteorder == "big":
+    values.byteswap()
+  return values
+
+
+def _ok_status() -> point_storage_proto.ItemStatus:
+  return point_storage_proto.ItemStatus(code=grpc.StatusCode.OK.value[0])
+
+
+def _error_status(
+    code: grpc.StatusCode, message: str
+) -> point_storage_proto.ItemStatus:
+  return point_storage_proto.ItemStatus(code=code.value[0], message=message)
 
 
 class PointStorageServicer(point_storage_grpc.PointStorageServiceServicer):
   """Implementation of the Point storage service."""
 
-  def __init__(self):
-    self.pubsub_instance = pubsub.PubSub()
-    self.kvstore = self.pubsub_instance.KeyValueStore()
+  def __init__(
+      self,
+      storage_backend: storage.StorageBackend = None,
+      pubsub_instance=None,
+      index_max_age_seconds: float = INDEX_MAX_AGE_SECONDS,
+  ):
+    """Initializes the servicer.
+
+    Args:
+      storage_backend: Holds the points. Defaults to the key-value store of
+        the platform's pubsub.
+      pubsub_instance: The pubsub to share point changes with the other
+        replicas over. Defaults to the platform's pubsub if 'storage_backend'
+        isn't given either, otherwise changes are only seen by this replica.
+      index_max_age_seconds: How long the indexes answer queries before they
+        are rebuilt from the store.
+    """
+    if storage_backend is None:
+      pubsub_instance = pubsub_instance or pubsub.PubSub()
+      storage_backend = storage.KeyValueStoreBackend(
+          pubsub_instance.KeyValueStore()
+      )
+    self.pubsub_instance = pubsub_instance
+    self.storage_backend = storage_backend
+    self._cache = point_cache.PointCache()
+    self._changes = point_changes.ChangeFeed(pubsub_instance)
+    self._changes.add_listener(self._update_cache)
+    # The indexes are built from the store on first use, see _seed_indexes(),
+    # and rebuilt once they are outdated, see _refresh_indexes().
+    self._seed_lock = threading.Lock()
+    self._index_lock = threading.Lock()
+    self._spatial_index = None
+    self._name_index = None
+    self._index_max_age_seconds = index_max_age_seconds
+    # The following are updated under the index lock.
+    # When the indexes were built, in time.monotonic() seconds.
+    self._indexes_built_at = 0.0
+    # Whether the indexes may have missed a change.
+    self._indexes_stale = False
+    # Whether the indexes are being rebuilt in the background.
+    self._rebuilding_indexes = False
+    # The Watch calls in progress.
+    self._watchers = set()
+    # The changes made while the indexes are being built, or None.
+    self._pending_changes = None
+    self._changes.add_listener(self._update_indexes)
+    self._changes.add_error_listener(self._mark_indexes_stale)
+    # Writes of the same point take the same lock, so that an Update can't
+    # interleave with another write of its point.
+    self._key_locks = [threading.RLock() for _ in range(_KEY_LOCK_STRIPES)]
+    # Shared by all batch requests, which bounds the load they put on the
+    # storage backend.
+    self._batch_executor = ThreadPoolExecutor(
+        max_workers=BATCH_PARALLELISM, thread_name_prefix="batch"
+    )
+
+  def _get_point(self, name: str) -> point_storage_proto.Point:
+    """Returns the point from the cache, or from the store on a miss.
+
+    The returned message may be shared with the cache and must not be
+    modified.
+    """
+    pt = self._cache.get(name)
+    if pt is not None:
+      return pt
+    generation = self._cache.generation()
+    pt = self._read_point(name)
+    self._cache.fill(name, pt, generation)
+    return pt
+
+  def _read_point(self, name: str) -> point_storage_proto.Point:
+    """Returns the point from the store, bypassing the cache."""
+    return self.storage_backend.get(name)
+
+  def _key_lock(self, name: str) -> threading.RLock:
+    return self._key_locks[hash(name) % _KEY_LOCK_STRIPES]
+
+  def _store_point(self, name: str, pt: point_storage_proto.Point) -> None:
+    with self._key_lock(name):
+      self.storage_backend.put(name, pt)
+      self._changes.publish(name, pt)
+
+  def _delete_point(self, name: str) -> None:
+    with self._key_lock(name):
+      self.storage_backend.delete(name)
+      self._changes.publish(name)
+
+  def _update_cache(
+      self, change: point_storage_proto.PointChange, local: bool
+  ) -> None:
+    if local and not change.deleted:
+      self._cache.put(change.name, change.point)
+    else:
+      # Changes of other replicas may arrive out of order, so the point is
+      # read from the store again rather than taken from the message.
+      self._cache.invalidate(change.name)
+
+  def _update_indexes(
+      self, change: point_storage_proto.PointChange, local: bool
+  ) -> None:
+    del local  # Unused, the indexes take the changes of all replicas.
+    with self._index_lock:
+      if self._pending_changes is not None:
+        self._pending_changes.append(change)
+      if self._spatial_index is not None:
+        self._apply_to_indexes(self._spatial_index, self._name_index, change)
+        for watcher in self._watchers:
+          watcher.offer(change)
+
+  def _apply_to_indexes(
+      self,
+      spatial: spatial_index.SpatialIndex,
+      names: name_index.NameIndex,
+      change: point_storage_proto.PointChange,
+  ):
+    if change.deleted:
+      spatial.remove(change.name)
+      names.remove(change.name)
+    else:
+      coordinates = _coordinates(change.point)
+      spatial.insert(change.name, coordinates)
+      names.insert(change.name, coordinates)
+
+  def _mark_indexes_stale(self) -> None:
+    with self._index_lock:
+      self._indexes_stale = True
+
+  def _seed_indexes(self):
+    """Builds the indexes from all stored points, unless they exist.
+
+    Only the first calls wait for the indexes to be built. Once they exist,
+    this returns right away, even while they are being rebuilt.
+
+    Raises:
+      RuntimeError: If the points can't be listed. The next call tries again.
+    """
+    if self._spatial_index is not None:
+      return
+    with self._seed_lock:
+      if self._spatial_index is None:
+        self._build_indexes()
+
+  def _refresh_indexes(self):
+    """Starts rebuilding the indexes if they are outdated.
+
+    They are outdated once they are older than the maximum age, or if a
+    change may have been missed. Queries keep using the current indexes, and
+    the changes applied to them, until the rebuilt ones take over.
+    """
+    with self._index_lock:
+      age = time.monotonic() - self._indexes_built_at
+      if self._rebuilding_indexes or (
+          not self._indexes_stale and age < self._index_max_age_seconds
+      ):
+        return
+      self._rebuilding_indexes = True
+    # Not in the batch executor, whose workers a full scan would hold up.
+    threading.Thread(
+        target=self._rebuild_indexes, name="index-rebuild", daemon=True
+    ).start()
+
+  def _rebuild_indexes(self):
+    try:
+      self._build_indexes()
+    except RuntimeError as e:
+      logging.error("Failed to rebuild the indexes: %s", e)
+      self._mark_indexes_stale()
+    finally:
+      with self._index_lock:
+        self._rebuilding_indexes = False
+
+  def _build_indexes(self):
+    """Builds the indexes from all stored points and replaces the current ones.
+
+    Changes made while the points are listed are recorded and applied on top,
+    so that none is lost between the listing and the new indexes taking over.
+    Watch calls are sent the points that the new indexes hold differently.
+    Only one build runs at a time: the first one under the seed lock, the
+    later ones while _rebuilding_indexes is set.
+
+    Raises:
+      RuntimeError: If the points can't be listed.
+    """
+    with self._index_lock:
+      self._pending_changes = []
+      # Changes missed from now on are caught by the next rebuild.
+      self._indexes_stale = False
+    try:
+      points = self._unpack_points(self.storage_backend.list_all())
+    except RuntimeError:
+      with self._index_lock:
+        self._pending_changes = None
+      raise
+    coordinates = [(item.name, _coordinates(item.point)) for item in points]
+    spatial = spatial_index.SpatialIndex(coordinates)
+    names = name_index.NameIndex(coordinates)
+    with self._index_lock:
+      for change in self._pending_changes:
+        self._apply_to_indexes(spatial, names, change)
+      self._pending_changes = None
+      missed = []
+      if self._name_index is not None:
+        missed = self._name_index.differences(names)
+      self._spatial_index = spatial
+      self._name_index = names
+      self._indexes_built_at = time.monotonic()
+      for name, point_coordinates in missed:
+        change = point_storage_proto.PointChange(name=name)
+        if point_coordinates is None:
+          change.deleted = True
+        else:
+          change.point.CopyFrom(_point(point_coordinates))
+        for watcher in self._watchers:
+          watcher.offer(change)
+    if missed:
+      logging.warning(
+          "Rebuilding the indexes found %d points out of date", len(missed)
+      )
+    logging.info("Indexed %d points", len(coordinates))
+
+  def _unpack_points(self, entries) -> List[point_storage_proto.NamedPoint]:
+    items = []
+    for name, wrapped_point in entries:
+      pt = point_storage_proto.Point()
+      wrapped_point.Unpack(pt)
+      items.append(point_storage_proto.NamedPoint(name=name, point=pt))
+    return items
+
+  def _check_batch_size(self, size: int, context: grpc.ServicerContext):
+    if size > MAX_BATCH_SIZE:
+      context.abort(
+          grpc.StatusCode.INVALID_ARGUMENT,
+          f"batch of {size} items exceeds the limit of {MAX_BATCH_SIZE}",
+      )
+
+  def _run_batch(self, operation, items):
+    """Applies 'operation' to all 'items' in parallel.
+
+    Returns:
+      The results of 'operation', in the order of 'items'.
+    """
+    return list(self._batch_executor.map(operation, items))
 
   def Put(
       self,
       request: point_storage_proto.PutRequest,
       context: grpc.ServicerContext,
   ) -> point_storage_proto.PutResponse:
-    key = make_key(request.name)
     try:
       pt = request.point
-      logging.info("Setting value of %s to (%f, %f, %f)", key, pt.x, pt.y, pt.z)
-      self.kvstore.Set(key, pt)
+      logging.info(
+          "Setting value of %s to (%f, %f, %f)", request.name, pt.x, pt.y, pt.z
+      )
+      self._store_point(request.name, pt)
       return point_storage_proto.PutResponse()
     except RuntimeError as e:
       logging.error("Caught runtime error %s", e)
@@ -47,17 +414,16 @@ class PointStorageServicer(point_storage_grpc.PointStorageServiceServicer):
       request: point_storage_proto.GetRequest,
       context: grpc.ServicerContext,
   ) -> point_storage_proto.GetResponse:
-    key = make_key(request.name)
     try:
-      logging.info("Getting value for key %s", key)
-      any_msg = self.kvstore.Get(key)
-      pt = point_storage_proto.Point()
-      any_msg.Unpack(pt)
+      logging.info("Getting value of %s", request.name)
+      pt = self._get_point(request.name)
       logging.info("Got (%f, %f, %f)", pt.x, pt.y, pt.z)
-      return point_storage_proto.GetResponse(point=pt)
+      return point_storage_proto.GetResponse(
+          point=pt, version=point_version(pt)
+      )
     except RuntimeError as e:
-      if "NOT_FOUND" in str(e):
-        logging.error("Key %s not found", key)
+      if isinstance(e, storage.NotFoundError):
+        logging.error("Point %s not found", request.name)
         context.abort(
             grpc.StatusCode.NOT_FOUND,
             f"point {request.name} not found",
@@ -74,37 +440,81 @@ class PointStorageServicer(point_storage_grpc.PointStorageServiceServicer):
       request: point_storage_proto.GetAllRequest,
       context: grpc.ServicerContext,
   ) -> point_storage_proto.GetAllResponse:
-    key = make_key("**")
     try:
-      all_points = self.kvstore.GetAllSynchronous(key)
-      logging.info("Got %d points", len(all_points))
-      response = point_storage_proto.GetAllResponse()
-      for key, wrapped_point in all_points.items():
-        pt = point_storage_proto.Point()
-        wrapped_point.Unpack(pt)
-        response.items.append(
-            point_storage_proto.NamedPoint(
-                name=key.replace("kv_store/ai.intrinsic/points/", ""), point=pt
-            )
-        )
-        logging.info("- (%f, %f, %f)", pt.x, pt.y, pt.z)
-      return response
+      after_name = (
+          decode_page_token(request.page_token) if request.page_token else None
+      )
+    except ValueError:
+      context.abort(
+          grpc.StatusCode.INVALID_ARGUMENT,
+          f"malformed page token {request.page_token!r}",
+      )
+    page_size = min(request.page_size, MAX_PAGE_SIZE)
+    try:
+      # Reads the store rather than the indexes, so that the points written
+      # by other clients of the store are seen right away.
+      with contextlib.closing(
+          self.storage_backend.iterate(after_name)
+      ) as entries:
+        if page_size > 0:
+          page = list(itertools.islice(entries, page_size + 1))
+        else:
+          page = list(entries)
     except RuntimeError as e:
-      logging.error("Failed to get all points matching %s: %s", key, e)
+      logging.error("Failed to list the points: %s", e)
       context.abort(
           grpc.StatusCode.INTERNAL,
           str(e),
       )
 
+    more = 0 < page_size < len(page)
+    if more:
+      del page[page_size:]
+    response = point_storage_proto.GetAllResponse(
+        items=self._unpack_points(page)
+    )
+    if more:
+      response.next_page_token = encode_page_token(page[-1][0])
+    logging.info("Got %d points", len(page))
+    return response
+
+  def StreamAll(
+      self,
+      request: point_storage_proto.StreamAllRequest,
+      context: grpc.ServicerContext,
+  ):
+    chunk_size = DEFAULT_CHUNK_SIZE
+    if request.chunk_size > 0:
+      chunk_size = min(request.chunk_size, MAX_PAGE_SIZE)
+    count = 0
+    try:
+      # Only one chunk of points is held at a time, if the backend supports
+      # it.
+      with contextlib.closing(self.storage_backend.iterate()) as entries:
+        while True:
+          chunk = list(itertools.islice(entries, chunk_size))
+          if not chunk:
+            break
+          count += len(chunk)
+          yield point_storage_proto.GetAllResponse(
+              items=self._unpack_points(chunk)
+          )
+    except RuntimeError as e:
+      logging.error("Failed to list the points: %s", e)
+      context.abort(
+          grpc.StatusCode.INTERNAL,
+          str(e),
+      )
+    logging.info("Streamed %d points", count)
+
   def Delete(
       self,
       request: point_storage_proto.DeleteRequest,
       context: grpc.ServicerContext,
   ) -> point_storage_proto.DeleteResponse:
-    key = make_key(request.name)
     try:
-      logging.info("Deleting value for %s", key)
-      self.kvstore.Delete(key)
+      logging.info("Deleting value of %s", request.name)
+      self._delete_point(request.name)
       return point_storage_proto.DeleteResponse()
     except RuntimeError as e:
       logging.error("Failed to delete point %s: %s", request.name, e)
@@ -113,21 +523,425 @@ class PointStorageServicer(point_storage_grpc.PointStorageServiceServicer):
           str(e),
       )
 
+  def Update(
+      self,
+      request: point_storage_proto.UpdateRequest,
+      context: grpc.ServicerContext,
+  ) -> point_storage_proto.UpdateResponse:
+    update = request.WhichOneof("update")
+    if update is None:
+      context.abort(
+          grpc.StatusCode.INVALID_ARGUMENT,
+          "either the offset or the point must be set",
+      )
+    with self._key_lock(request.name):
+      try:
+        pt = self._read_point(request.name)
+      except RuntimeError as e:
+        if isinstance(e, storage.NotFoundError):
+          context.abort(
+              grpc.StatusCode.NOT_FOUND,
+              f"point {request.name} not found",
+          )
+        logging.error("Failed to get point %s: %s", request.name, e)
+        context.abort(grpc.StatusCode.INTERNAL, str(e))
+
+      if (
+          request.expected_version
+          and request.expected_version != point_version(pt)
+      ):
+        context.abort(
+            grpc.StatusCode.ABORTED,
+            f"point {request.name} changed, its version is no longer"
+            f" {request.expected_version}",
+        )
+      match update:
+        case "offset":
+          offset = request.offset
+          logging.info(
+              "Moving point %s by (%f, %f, %f)",
+              request.name,
+              offset.x,
+              offset.y,
+              offset.z,
+          )
+          pt = point_storage_proto.Point(
+              x=pt.x + offset.x, y=pt.y + offset.y, z=pt.z + offset.z
+          )
+        case "point":
+          pt = request.point
+
+      try:
+        self._store_point(request.name, pt)
+      except RuntimeError as e:
+        logging.error("Failed to store point %s: %s", request.name, e)
+        context.abort(
+            grpc.StatusCode.INTERNAL,
+            f"failed to store point {request.name}: {e}",
+        )
+    return point_storage_proto.UpdateResponse(
+        point=pt, version=point_version(pt)
+    )
+
+  def PutMany(
+      self,
+      request: point_storage_proto.PutManyRequest,
+      context: grpc.ServicerContext,
+  ) -> point_storage_proto.PutManyResponse:
+    self._check_batch_size(len(request.items), context)
+
+    def put(item):
+      try:
+        self._store_point(item.name, item.point)
+        return _ok_status()
+      except RuntimeError as e:
+        logging.error("Failed to store point %s: %s", item.name, e)
+        return _error_status(
+            grpc.StatusCode.INTERNAL,
+            f"failed to store point {item.name}: {e}",
+        )
+
+    statuses = self._run_batch(put, request.items)
+    logging.info("Stored a batch of %d points", len(statuses))
+    return point_storage_proto.PutManyResponse(statuses=statuses)
+
+  def GetMany(
+      self,
+      request: point_storage_proto.GetManyRequest,
+      context: grpc.ServicerContext,
+  ) -> point_storage_proto.GetManyResponse:
+    self._check_batch_size(len(request.names), context)
+
+    def get(name):
+      item = point_storage_proto.GetManyResponse.Item(name=name)
+      try:
+        item.point.CopyFrom(self._get_point(name))
+        item.status.CopyFrom(_ok_status())
+      except RuntimeError as e:
+        if isinstance(e, storage.NotFoundError):
+          item.status.CopyFrom(
+              _error_status(
+                  grpc.StatusCode.NOT_FOUND, f"point {name} not found"
+              )
+          )
+        else:
+          logging.error("Failed to get point %s: %s", name, e)
+          item.status.CopyFrom(_error_status(grpc.StatusCode.INTERNAL, str(e)))
+      return item
+
+    items = self._run_batch(get, request.names)
+    logging.info("Got a batch of %d points", len(items))
+    return point_storage_proto.GetManyResponse(items=items)
+
+  def DeleteMany(
+      self,
+      request: point_storage_proto.DeleteManyRequest,
+      context: grpc.ServicerContext,
+  ) -> point_storage_proto.DeleteManyResponse:
+    self._check_batch_size(len(request.names), context)
+
+    def delete(name):
+      try:
+        self._delete_point(name)
+        return _ok_status()
+      except RuntimeError as e:
+        logging.error("Failed to delete point %s: %s", name, e)
+        return _error_status(grpc.StatusCode.INTERNAL, str(e))
+
+    statuses = self._run_batch(delete, request.names)
+    logging.info("Deleted a batch of %d points", len(statuses))
+    return point_storage_proto.DeleteManyResponse(statuses=statuses)
+
+  def _query_indexes(self, context: grpc.ServicerContext, query):
+    """Returns the result of 'query', building the indexes first if needed.
+
+    'query' runs while the indexes are locked.
+    """
+    try:
+      self._seed_indexes()
+    except RuntimeError as e:
+      logging.error("Failed to index the points: %s", e)
+      context.abort(grpc.StatusCode.INTERNAL, str(e))
+    self._refresh_indexes()
+    with self._index_lock:
+      return query()
+
+  def List(
+      self,
+      request: point_storage_proto.ListRequest,
+      context: grpc.ServicerContext,
+  ) -> point_storage_proto.GetAllResponse:
+    try:
+      after_name = (
+          decode_page_token(request.page_token) if request.page_token else None
+      )
+    except ValueError:
+      context.abort(
+          grpc.StatusCode.INVALID_ARGUMENT,
+          f"malformed page token {request.page_token!r}",
+      )
+    page_size = MAX_PAGE_SIZE
+    if request.page_size > 0:
+      page_size = min(request.page_size, MAX_PAGE_SIZE)
+    matches, more = self._query_indexes(
+        context,
+        lambda: self._name_index.list(request.prefix, after_name, page_size),
+    )
+    response = point_storage_proto.GetAllResponse()
+    for name, coordinates in matches:
+      response.items.add(name=name, point=_point(coordinates))
+    if more:
+      response.next_page_token = encode_page_token(matches[-1][0])
+    logging.info(
+        "Listed %d points with prefix %r", len(matches), request.prefix
+    )
+    return response
+
+  def ExportPacked(
+      self,
+      request: point_storage_proto.ExportPackedRequest,
+      context: grpc.ServicerContext,
+  ):
+    chunk_size = PACKED_CHUNK_SIZE
+    if request.chunk_size > 0:
+      chunk_size = min(request.chunk_size, PACKED_CHUNK_SIZE)
+    points, _ = self._query_indexes(
+        context,
+        lambda: self._name_index.list(
+            request.prefix, None, len(self._name_index)
+        ),
+    )
+    for start in range(0, len(points), chunk_size):
+      chunk = points[start : start + chunk_size]
+      yield point_storage_proto.PackedPoints(
+          names=[name for name, _ in chunk],
+          coordinates=_pack_coordinates(
+              coordinates for _, coordinates in chunk
+          ),
+      )
+    logging.info(
+        "Exported %d points with prefix %r", len(points), request.prefix
+    )
+
+  def ImportPacked(
+      self,
+      request_iterator,
+      context: grpc.ServicerContext,
+  ) -> point_storage_proto.ImportPackedResponse:
+    def store(item):
+      name, pt = item
+      try:
+        self._store_point(name, pt)
+        return None
+      except RuntimeError as e:
+        logging.error("Failed to store point %s: %s", name, e)
+        return f"failed to store point {name}: {e}"
+
+    count = 0
+    for chunk in request_iterator:
+      if len(chunk.coordinates) != 12 * len(chunk.names):
+        context.abort(
+            grpc.StatusCode.INVALID_ARGUMENT,
+            f"{len(chunk.coordinates)} bytes of coordinates for"
+            f" {len(chunk.names)} points, expected 12 bytes per point",
+        )
+      values = _unpack_coordinates(chunk.coordinates)
+      items = [
+          (
+              name,
+              point_storage_proto.Point(
+                  x=values[3 * i], y=values[3 * i + 1], z=values[3 * i + 2]
+              ),
+          )
+          for i, name in enumerate(chunk.names)
+      ]
+      errors = [error for error in self._run_batch(store, items) if error]
+      if errors:
+        context.abort(
+            grpc.StatusCode.INTERNAL,
+            f"{len(errors)} points of a chunk failed after importing"
+            f" {count} points, e.g. {errors[0]}",
+        )
+      count += len(items)
+    logging.info("Imported %d points", count)
+    return point_storage_proto.ImportPackedResponse(count=count)
+
+  def _watched_points(
+      self, watcher: watchers.Watcher
+  ) -> Sequence[name_index.NamedCoordinates]:
+    """Returns the points that 'watcher' watches, as of its latest change.
+
+    Must be called under the index lock, so that the snapshot matches the
+    changes queued before it.
+    """
+    watcher.reset()
+    points, _ = self._name_index.list(
+        watcher.prefix, None, len(self._name_index)
+    )
+    return points
+
+  def _snapshot_responses(self, points):
+    if not points:
+      yield point_storage_proto.WatchResponse(
+          snapshot=point_storage_proto.WatchResponse.Snapshot(last=True)
+      )
+    for start in range(0, len(points), DEFAULT_CHUNK_SIZE):
+      response = point_storage_proto.WatchResponse()
+      for name, coordinates in points[start : start + DEFAULT_CHUNK_SIZE]:
+        response.snapshot.items.add(name=name, point=_point(coordinates))
+      response.snapshot.last = start + DEFAULT_CHUNK_SIZE >= len(points)
+      yield response
+
+  def Watch(
+      self,
+      request: point_storage_proto.WatchRequest,
+      context: grpc.ServicerContext,
+  ):
+    watcher = watchers.Watcher(request.prefix, WATCH_QUEUE_SIZE)
+
+    def subscribe():
+      if len(self._watchers) >= MAX_CONCURRENT_WATCHES:
+        return None
+      self._watchers.add(watcher)
+      return self._watched_points(watcher)
+
+    def unsubscribe():
+      with self._index_lock:
+        self._watchers.discard(watcher)
+
+    points = self._query_indexes(context, subscribe)
+    if points is None:
+      context.abort(
+          grpc.StatusCode.RESOURCE_EXHAUSTED,
+          f"at most {MAX_CONCURRENT_WATCHES} Watch calls can run at a time",
+      )
+    context.add_callback(unsubscribe)
+    logging.info(
+        "Watching %d points with prefix %r", len(points), request.prefix
+    )
+    try:
+      yield from self._snapshot_responses(points)
+      while context.is_active():
+        if watcher.overflowed:
+          logging.warning(
+              "Watch of prefix %r fell behind, sending a new snapshot",
+              request.prefix,
+          )
+          points = self._query_indexes(
+              context, lambda: self._watched_points(watcher)
+          )
+          yield from self._snapshot_responses(points)
+          continue
+        change = watcher.next_change(_WATCH_POLL_SECONDS)
+        if change is not None:
+          event = point_storage_proto.WatchResponse(change=change)
+          event.change.ClearField("origin")
+          yield event
+    finally:
+      unsubscribe()
+
+  def _find_response(
+      self, matches: Sequence[spatial_index.Match], max_results: int
+  ) -> point_storage_proto.FindResponse:
+    limit = MAX_FIND_RESULTS
+    if max_results > 0:
+      limit = min(max_results, MAX_FIND_RESULTS)
+    response = point_storage_proto.FindResponse(truncated=len(matches) > limit)
+    for name, coordinates, distance in matches[:limit]:
+      response.items.add(
+          name=name, point=_point(coordinates), distance=distance
+      )
+    return response
+
+  def FindNearest(
+      self,
+      request: point_storage_proto.FindNearestRequest,
+      context: grpc.ServicerContext,
+  ) -> point_storage_proto.FindResponse:
+    k = min(request.k, MAX_FIND_RESULTS) if request.k > 0 else 1
+    target = _coordinates(request.point)
+    matches = self._query_indexes(
+        context, lambda: self._spatial_index.nearest(target, k)
+    )
+    return self._find_response(matches, k)
+
+  def FindWithinRadius(
+      self,
+      request: point_storage_proto.FindWithinRadiusRequest,
+      context: grpc.ServicerContext,
+  ) -> point_storage_proto.FindResponse:
+    if request.radius < 0:
+      context.abort(
+          grpc.StatusCode.INVALID_ARGUMENT,
+          f"negative radius {request.radius}",
+      )
+    center = _coordinates(request.center)
+    matches = self._query_indexes(
+        context,
+        lambda: self._spatial_index.within_radius(center, request.radius),
+    )
+    return self._find_response(matches, request.max_results)
+
+  def FindInBox(
+      self,
+      request: point_storage_proto.FindInBoxRequest,
+      context: grpc.ServicerContext,
+  ) -> point_storage_proto.FindResponse:
+    lower = _coordinates(request.min_corner)
+    upper = _coordinates(request.max_corner)
+    if any(low > high for low, high in zip(lower, upper)):
+      context.abort(
+          grpc.StatusCode.INVALID_ARGUMENT,
+          f"box corner {lower} exceeds {upper} on some axis",
+      )
+    matches = self._query_indexes(
+        context,
+        lambda: [
+            (name, coordinates, 0.0)
+            for name, coordinates in self._spatial_index.in_box(lower, upper)
+        ],
+    )
+    return self._find_response(matches, request.max_results)
+
+  def GetCacheStats(
+      self,
+      request: point_storage_proto.GetCacheStatsRequest,
+      context: grpc.ServicerContext,
+  ) -> point_storage_proto.CacheStats:
+    return point_storage_proto.CacheStats(**self._cache.stats())
+
 
 def get_runtime_context():
   with open("/etc/intrinsic/runtime_config.pb", "rb") as fin:
     return runtime_context_pb2.RuntimeContext.FromString(fin.read())
 
 
-def make_grpc_server(port):
+def make_servicer(
+    config: point_storage_proto.PointStorageConfig,
+) -> PointStorageServicer:
+  """Returns a servicer using the storage backend of 'config'.
+
+  Raises:
+    ValueError: If the config is invalid.
+  """
+  if config.WhichOneof("backend") == "sqlite":
+    if not config.sqlite.path:
+      raise ValueError("the SQLite backend needs a database path")
+    logging.info("Storing the points in SQLite database %s", config.sqlite.path)
+    return PointStorageServicer(storage.SqliteBackend(config.sqlite.path))
+  logging.info("Storing the points in the key-value store")
+  return PointStorageServicer()
+
+
+def make_grpc_server(port, servicer: PointStorageServicer):
   server = grpc.server(
-      ThreadPoolExecutor(),
+      ThreadPoolExecutor(
+          max_workers=MAX_CONCURRENT_WATCHES + UNARY_RPC_THREADS
+      ),
       options=(("grpc.so_reuseport", 0),),
   )
 
-  point_storage_grpc.add_PointStorageServiceServicer_to_server(
-      PointStorageServicer(), server
-  )
+  point_storage_grpc.add_PointStorageServiceServicer_to_server(servicer, server)
   endpoint = f"[::]:{port}"
   added_port = server.add_insecure_port(endpoint)
   if added_port != port:
@@ -135,21 +949,33 @@ def make_grpc_server(port):
   return server
 
 
-def main():
-  context = get_runtime_context()
+def main(argv):
+  del argv  # Unused.
+  config = point_storage_proto.PointStorageConfig()
+  if FLAGS.port is None:
+    context = get_runtime_context()
+    port = context.port
+    if context.config.type_url and not context.config.Unpack(config):
+      logging.critical(
+          "Config is a %s, not a PointStorageConfig.", context.config.type_url
+      )
+      sys.exit(1)
+  else:
+    port = FLAGS.port
+  if FLAGS.sqlite_path:
+    config.sqlite.path = FLAGS.sqlite_path
 
-  logging.info("Starting Point storage service on port: %d", context.port)
+  logging.info("Starting Point storage service on port: %d", port)
 
-  server = make_grpc_server(context.port)
+  server = make_grpc_server(port, make_servicer(config))
   server.start()
 
   logging.info("--------------------------------")
-  logging.info("-- Point storage service listening on port %d", context.port)
+  logging.info("-- Point storage service listening on port %d", port)
   logging.info("--------------------------------")
 
   server.wait_for_termination()
 
 
 if __name__ == "__main__":
-  logging.basicConfig(stream=sys.stderr, level=logging.INFO)
-  main()
+  app.run(main)
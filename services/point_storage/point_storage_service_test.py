@@ -0,0 +1,527 @@
+from concurrent import futures
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import grpc
+import numpy as np
+from services.point_storage import packed_points
+from services.point_storage import point_storage_service
+from services.point_storage import point_storage_service_pb2 as point_storage_proto
+from services.point_storage import point_storage_service_pb2_grpc as point_storage_grpc
+from services.point_storage import storage
+
+
+class FailingBackend(storage.SqliteBackend):
+  """Fails to store or delete the points whose names start with "bad"."""
+
+  def put(self, name, point):
+    if name.startswith("bad"):
+      raise RuntimeError("disk full")
+    super().put(name, point)
+
+  def delete(self, name):
+    if name.startswith("bad"):
+      raise RuntimeError("disk full")
+    super().delete(name)
+
+
+class Aborted(Exception):
+  """Raised by FakeContext.abort()."""
+
+  def __init__(self, code, details):
+    super().__init__(details)
+    self.code = code
+
+
+class FakeContext:
+  """Stands in for the context of a call that is driven directly."""
+
+  def is_active(self):
+    return True
+
+  def add_callback(self, callback):
+    del callback  # Unused, the call never ends on its own.
+
+  def abort(self, code, details):
+    raise Aborted(code, details)
+
+
+def _point(x, y=0.0, z=0.0):
+  return point_storage_proto.Point(x=x, y=y, z=z)
+
+
+def _wait_until(condition, timeout=5.0):
+  """Returns whether 'condition' became true within 'timeout' seconds."""
+  deadline = time.monotonic() + timeout
+  while not condition():
+    if time.monotonic() > deadline:
+      return False
+    time.sleep(0.01)
+  return True
+
+
+class PointStorageServiceTest(unittest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.backend = FailingBackend(os.path.join(directory.name, "points.db"))
+    self.servicer = point_storage_service.PointStorageServicer(self.backend)
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=4))
+    point_storage_grpc.add_PointStorageServiceServicer_to_server(
+        self.servicer, server
+    )
+    port = server.add_insecure_port("localhost:0")
+    server.start()
+    self.addCleanup(server.stop, None)
+    channel = grpc.insecure_channel(f"localhost:{port}")
+    self.addCleanup(channel.close)
+    self.stub = point_storage_grpc.PointStorageServiceStub(channel)
+
+  def _put(self, name, pt):
+    self.stub.Put(point_storage_proto.PutRequest(name=name, point=pt))
+
+  def _put_grid(self, count):
+    """Stores points p0, p1, ... at (0, 0, 0), (1, 0, 0), ..."""
+    self.stub.PutMany(
+        point_storage_proto.PutManyRequest(
+            items=[
+                point_storage_proto.NamedPoint(name=f"p{i}", point=_point(i))
+                for i in range(count)
+            ]
+        )
+    )
+
+  def assertFailsWith(self, code, rpc, request):
+    with self.assertRaises(grpc.RpcError) as raised:
+      rpc(request)
+    self.assertEqual(raised.exception.code(), code)
+
+  def test_put_get_delete(self):
+    self._put("a", _point(1.0, 2.0, 3.0))
+    response = self.stub.Get(point_storage_proto.GetRequest(name="a"))
+    self.assertEqual(response.point, _point(1.0, 2.0, 3.0))
+
+    self.stub.Delete(point_storage_proto.DeleteRequest(name="a"))
+    self.assertFailsWith(
+        grpc.StatusCode.NOT_FOUND,
+        self.stub.Get,
+        point_storage_proto.GetRequest(name="a"),
+    )
+
+  def test_batch_reports_status_per_item(self):
+    response = self.stub.PutMany(
+        point_storage_proto.PutManyRequest(
+            items=[
+                point_storage_proto.NamedPoint(name="a", point=_point(1.0)),
+                point_storage_proto.NamedPoint(name="bad", point=_point(2.0)),
+                point_storage_proto.NamedPoint(name="b", point=_point(3.0)),
+            ]
+        )
+    )
+    self.assertEqual(
+        [status.code for status in response.statuses],
+        [
+            grpc.StatusCode.OK.value[0],
+            grpc.StatusCode.INTERNAL.value[0],
+            grpc.StatusCode.OK.value[0],
+        ],
+    )
+    self.assertIn("disk full", response.statuses[1].message)
+
+    response = self.stub.GetMany(
+        point_storage_proto.GetManyRequest(names=["b", "missing", "a"])
+    )
+    self.assertEqual(
+        [(item.name, item.status.code) for item in response.items],
+        [
+            ("b", grpc.StatusCode.OK.value[0]),
+            ("missing", grpc.StatusCode.NOT_FOUND.value[0]),
+            ("a", grpc.StatusCode.OK.value[0]),
+        ],
+    )
+    self.assertEqual(response.items[0].point, _point(3.0))
+
+    response = self.stub.DeleteMany(
+        point_storage_proto.DeleteManyRequest(names=["a", "bad"])
+    )
+    self.assertEqual(
+        [status.code for status in response.statuses],
+        [grpc.StatusCode.OK.value[0], grpc.StatusCode.INTERNAL.value[0]],
+    )
+
+  def test_batch_size_is_limited(self):
+    names = [f"p{i}" for i in range(point_storage_service.MAX_BATCH_SIZE + 1)]
+    self.assertFailsWith(
+        grpc.StatusCode.INVALID_ARGUMENT,
+        self.stub.GetMany,
+        point_storage_proto.GetManyRequest(names=names),
+    )
+
+  def test_get_all_pages(self):
+    self._put_grid(5)
+    names = []
+    page_token = ""
+    pages = 0
+    while True:
+      response = self.stub.GetAll(
+          point_storage_proto.GetAllRequest(page_size=2, page_token=page_token)
+      )
+      names.extend(item.name for item in response.items)
+      pages += 1
+      page_token = response.next_page_token
+      if not page_token:
+        break
+    self.assertEqual(names, ["p0", "p1", "p2", "p3", "p4"])
+    self.assertEqual(pages, 3)
+
+    response = self.stub.GetAll(point_storage_proto.GetAllRequest())
+    self.assertEqual(len(response.items), 5)
+    self.assertFalse(response.next_page_token)
+
+  def test_get_all_reads_the_store(self):
+    self._put_grid(2)
+    # Another client of the store writes without notifying this replica.
+    self.backend.put("remote", _point(5.0))
+    response = self.stub.GetAll(point_storage_proto.GetAllRequest())
+    self.assertEqual(
+        [item.name for item in response.items], ["p0", "p1", "remote"]
+    )
+
+  def test_malformed_page_token(self):
+    self.assertFailsWith(
+        grpc.StatusCode.INVALID_ARGUMENT,
+        self.stub.GetAll,
+        point_storage_proto.GetAllRequest(page_token="!!"),
+    )
+
+  def test_stream_all_chunks(self):
+    self._put_grid(5)
+    chunks = list(
+        self.stub.StreamAll(point_storage_proto.StreamAllRequest(chunk_size=2))
+    )
+    self.assertEqual([len(chunk.items) for chunk in chunks], [2, 2, 1])
+    self.assertEqual(chunks[2].items[0].name, "p4")
+
+  def test_list_by_prefix(self):
+    for name in ("fixture_1/a", "fixture_1/b", "fixture_1/c", "fixture_2/a"):
+      self._put(name, _point(1.0))
+    response = self.stub.List(
+        point_storage_proto.ListRequest(prefix="fixture_1/", page_size=2)
+    )
+    self.assertEqual(
+        [item.name for item in response.items], ["fixture_1/a", "fixture_1/b"]
+    )
+    response = self.stub.List(
+        point_storage_proto.ListRequest(
+            prefix="fixture_1/",
+            page_size=2,
+            page_token=response.next_page_token,
+        )
+    )
+    self.assertEqual([item.name for item in response.items], ["fixture_1/c"])
+    self.assertFalse(response.next_page_token)
+
+  def test_malformed_list_page_token(self):
+    self.assertFailsWith(
+        grpc.StatusCode.INVALID_ARGUMENT,
+        self.stub.List,
+        point_storage_proto.ListRequest(page_token="!!"),
+    )
+
+  def test_cache_counters(self):
+    stats = lambda: self.stub.GetCacheStats(
+        point_storage_proto.GetCacheStatsRequest()
+    )
+    self.backend.put("a", _point(1.0))
+    self.stub.Get(point_storage_proto.GetRequest(name="a"))
+    self.stub.Get(point_storage_proto.GetRequest(name="a"))
+    self.assertEqual((stats().hits, stats().misses), (1, 1))
+    self.assertEqual(stats().entries, 1)
+
+    self._put("a", _point(2.0))
+    response = self.stub.Get(point_storage_proto.GetRequest(name="a"))
+    self.assertEqual(response.point, _point(2.0))
+    self.assertEqual((stats().hits, stats().misses), (2, 1))
+
+    self.stub.Delete(point_storage_proto.DeleteRequest(name="a"))
+    self.assertEqual(stats().invalidations, 1)
+    self.assertEqual(stats().entries, 0)
+
+  def test_get_returns_the_version(self):
+    self._put("a", _point(1.0, 2.0, 3.0))
+    response = self.stub.Get(point_storage_proto.GetRequest(name="a"))
+    self.assertEqual(
+        response.version, point_storage_service.point_version(response.point)
+    )
+
+  def test_update_by_offset(self):
+    self._put("a", _point(1.0, 2.0, 3.0))
+    response = self.stub.Update(
+        point_storage_proto.UpdateRequest(
+            name="a", offset=_point(1.0, 1.0, 1.0)
+        )
+    )
+    self.assertEqual(response.point, _point(2.0, 3.0, 4.0))
+    self.assertEqual(
+        self.stub.Get(point_storage_proto.GetRequest(name="a")).point,
+        _point(2.0, 3.0, 4.0),
+    )
+
+  def test_update_with_expected_version(self):
+    self._put("a", _point(1.0))
+    version = self.stub.Get(point_storage_proto.GetRequest(name="a")).version
+    response = self.stub.Update(
+        point_storage_proto.UpdateRequest(
+            name="a", point=_point(2.0), expected_version=version
+        )
+    )
+    self.assertNotEqual(response.version, version)
+
+    self.assertFailsWith(
+        grpc.StatusCode.ABORTED,
+        self.stub.Update,
+        point_storage_proto.UpdateRequest(
+            name="a",
+            point=_point(3.0),
+            expected_version=version,
+        ),
+    )
+    self.assertEqual(
+        self.stub.Get(point_storage_proto.GetRequest(name="a")).point,
+        _point(2.0),
+    )
+
+  def test_update_fails_for_missing_point(self):
+    self.assertFailsWith(
+        grpc.StatusCode.NOT_FOUND,
+        self.stub.Update,
+        point_storage_proto.UpdateRequest(
+            name="missing",
+            offset=_point(1.0),
+        ),
+    )
+    self.assertFailsWith(
+        grpc.StatusCode.INVALID_ARGUMENT,
+        self.stub.Update,
+        point_storage_proto.UpdateRequest(name="missing"),
+    )
+
+  def test_find(self):
+    self._put_grid(10)
+    response = self.stub.FindNearest(
+        point_storage_proto.FindNearestRequest(point=_point(3.2), k=2)
+    )
+    self.assertEqual([item.name for item in response.items], ["p3", "p4"])
+    response = self.stub.FindWithinRadius(
+        point_storage_proto.FindWithinRadiusRequest(
+            center=_point(5.0), radius=1.0, max_results=2
+        )
+    )
+    self.assertEqual([item.name for item in response.items], ["p5", "p4"])
+    self.assertTrue(response.truncated)
+    response = self.stub.FindInBox(
+        point_storage_proto.FindInBoxRequest(
+            min_corner=_point(7.5, -1.0, -1.0),
+            max_corner=_point(20.0, 1.0, 1.0),
+        )
+    )
+    self.assertEqual([item.name for item in response.items], ["p8", "p9"])
+
+  def test_export_import_round_trip(self):
+    names = [f"p{i}" for i in range(25)]
+    coordinates = np.arange(75, dtype=np.float32).reshape(25, 3)
+    count = packed_points.import_points(
+        self.stub, names, coordinates, chunk_size=10
+    )
+    self.assertEqual(count, 25)
+
+    exported_names, exported = packed_points.export_points(self.stub)
+    self.assertEqual(exported_names, sorted(names))
+    order = [names.index(name) for name in exported_names]
+    np.testing.assert_array_equal(exported, coordinates[order])
+    self.assertEqual(
+        self.stub.Get(point_storage_proto.GetRequest(name="p1")).point,
+        _point(3.0, 4.0, 5.0),
+    )
+
+  def test_import_rejects_truncated_coordinates(self):
+    chunk = point_storage_proto.PackedPoints(names=["a"], coordinates=bytes(8))
+    self.assertFailsWith(
+        grpc.StatusCode.INVALID_ARGUMENT,
+        self.stub.ImportPacked,
+        iter([chunk]),
+    )
+
+  def test_watch_sends_snapshot_then_changes(self):
+    self._put("a/1", _point(1.0))
+    self._put("b/1", _point(2.0))
+    responses = self.stub.Watch(point_storage_proto.WatchRequest(prefix="a/"))
+    snapshot = next(responses).snapshot
+    self.assertTrue(snapshot.last)
+    self.assertEqual([item.name for item in snapshot.items], ["a/1"])
+
+    self._put("b/2", _point(3.0))
+    self._put("a/2", _point(4.0))
+    change = next(responses).change
+    self.assertEqual(change.name, "a/2")
+    self.assertEqual(change.point, _point(4.0))
+    self.stub.Delete(point_storage_proto.DeleteRequest(name="a/1"))
+    change = next(responses).change
+    self.assertEqual(change.name, "a/1")
+    self.assertTrue(change.deleted)
+    responses.cancel()
+
+  def test_watch_resyncs_after_overflow(self):
+    context = FakeContext()
+    with mock.patch.object(point_storage_service, "WATCH_QUEUE_SIZE", 2):
+      responses = self.servicer.Watch(
+          point_storage_proto.WatchRequest(), context
+      )
+      self.assertTrue(next(responses).snapshot.last)
+    for i in range(3):
+      self.servicer.Put(
+          point_storage_proto.PutRequest(name=f"p{i}", point=_point(i)),
+          context,
+      )
+    snapshot = next(responses).snapshot
+    self.assertEqual([item.name for item in snapshot.items], ["p0", "p1", "p2"])
+    self.servicer.Put(
+        point_storage_proto.PutRequest(name="p3", point=_point(3.0)), context
+    )
+    self.assertEqual(next(responses).change.name, "p3")
+    responses.close()
+
+  def _nearest_names(self, servicer, context):
+    response = servicer.FindNearest(
+        point_storage_proto.FindNearestRequest(point=_point(0.0), k=10),
+        context,
+    )
+    return [item.name for item in response.items]
+
+  def test_indexes_are_rebuilt_once_outdated(self):
+    servicer = point_storage_service.PointStorageServicer(
+        self.backend, index_max_age_seconds=0.0
+    )
+    context = FakeContext()
+    self.assertEqual(self._nearest_names(servicer, context), [])
+
+    # Another client of the store writes without notifying this replica.
+    self.backend.put("remote", _point(1.0))
+    self.assertTrue(
+        _wait_until(
+            lambda: self._nearest_names(servicer, context) == ["remote"]
+        )
+    )
+
+  def test_list_agrees_with_the_store_after_remote_changes(self):
+    servicer = point_storage_service.PointStorageServicer(
+        self.backend, index_max_age_seconds=0.0
+    )
+    context = FakeContext()
+    for name in ("a", "b", "c"):
+      servicer.Put(
+          point_storage_proto.PutRequest(name=name, point=_point(1.0)), context
+      )
+    # Another replica moves, adds and deletes points behind this one's back.
+    self.backend.put("b", _point(2.0))
+    self.backend.put("d", _point(3.0))
+    self.backend.delete("a")
+
+    def listed():
+      response = servicer.List(point_storage_proto.ListRequest(), context)
+      return [(item.name, item.point) for item in response.items]
+
+    stored = []
+    for name, packed in self.backend.list_all():
+      stored.append((name, point_storage_proto.Point()))
+      packed.Unpack(stored[-1][1])
+    self.assertEqual(
+        stored, [("b", _point(2.0)), ("c", _point(1.0)), ("d", _point(3.0))]
+    )
+    self.assertTrue(_wait_until(lambda: listed() == stored))
+
+  def test_indexes_are_rebuilt_after_feed_errors(self):
+    pubsub_instance = mock.Mock()
+    servicer = point_storage_service.PointStorageServicer(
+        self.backend, pubsub_instance
+    )
+    on_error = pubsub_instance.CreateSubscription.call_args.kwargs[
+        "error_callback"
+    ]
+    context = FakeContext()
+    responses = servicer.Watch(point_storage_proto.WatchRequest(), context)
+    self.assertTrue(next(responses).snapshot.last)
+
+    # The change notification of another replica is lost.
+    self.backend.put("remote", _point(1.0))
+    self.assertEqual(self._nearest_names(servicer, context), [])
+    on_error(None, "connection lost")
+    self.assertTrue(
+        _wait_until(
+            lambda: self._nearest_names(servicer, context) == ["remote"]
+        )
+    )
+    change = next(responses).change
+    self.assertEqual(change.name, "remote")
+    self.assertEqual(change.point, _point(1.0))
+    responses.close()
+
+  def test_queries_do_not_wait_for_rebuilds(self):
+    pubsub_instance = mock.Mock()
+    servicer = point_storage_service.PointStorageServicer(
+        self.backend, pubsub_instance
+    )
+    on_error = pubsub_instance.CreateSubscription.call_args.kwargs[
+        "error_callback"
+    ]
+    context = FakeContext()
+    self.assertEqual(self._nearest_names(servicer, context), [])
+
+    release = threading.Event()
+    self.addCleanup(release.set)
+    list_all = self.backend.list_all
+
+    def slow_list_all():
+      release.wait(5)
+      return list_all()
+
+    self.backend.put("remote", _point(1.0))
+    with mock.patch.object(self.backend, "list_all", side_effect=slow_list_all):
+      on_error(None, "connection lost")
+      started = time.monotonic()
+      # Starts the rebuild, then answers from the current indexes.
+      self.assertEqual(self._nearest_names(servicer, context), [])
+      self.assertEqual(self._nearest_names(servicer, context), [])
+      self.assertLess(time.monotonic() - started, 1.0)
+      release.set()
+      self.assertTrue(
+          _wait_until(
+              lambda: self._nearest_names(servicer, context) == ["remote"]
+          )
+      )
+
+  def test_concurrent_watches_are_limited(self):
+    context = FakeContext()
+    with mock.patch.object(point_storage_service, "MAX_CONCURRENT_WATCHES", 1):
+      first = self.servicer.Watch(point_storage_proto.WatchRequest(), context)
+      self.assertTrue(next(first).snapshot.last)
+      second = self.servicer.Watch(point_storage_proto.WatchRequest(), context)
+      with self.assertRaises(Aborted) as raised:
+        next(second)
+      self.assertEqual(
+          raised.exception.code, grpc.StatusCode.RESOURCE_EXHAUSTED
+      )
+      first.close()
+      third = self.servicer.Watch(point_storage_proto.WatchRequest(), context)
+      self.assertTrue(next(third).snapshot.last)
+      third.close()
+
+
+if __name__ == "__main__":
+  unittest.main()
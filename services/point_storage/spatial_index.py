@@ -0,0 +1,214 @@
+"""In-memory spatial index of the stored points, for geometric queries.
+
+The index is a set of static, balanced k-d trees whose sizes are distinct
+powers of two, the "logarithmic method": inserting a point merges the trees of
+all smaller sizes into one new tree, like the carry of a binary counter. A
+write never rebuilds the whole index, inserts cost O(log^2 n) amortized, and a
+query for a few points visits O(log^2 n) nodes. Removed points stay in their
+tree, marked dead, until a merge drops them or they outnumber the live ones.
+"""
+
+import heapq
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+# The x, y and z coordinates of a point.
+Coordinates = Tuple[float, float, float]
+
+# A point found by a distance query: its name, coordinates and distance.
+Match = Tuple[str, Coordinates, float]
+
+
+class _Entry:
+  """One point in a tree, marked dead once removed or replaced."""
+
+  __slots__ = ("name", "coordinates", "alive")
+
+  def __init__(self, name: str, coordinates: Coordinates):
+    self.name = name
+    self.coordinates = coordinates
+    self.alive = True
+
+
+class _KdTree:
+  """A static, balanced k-d tree, stored in one list.
+
+  The root of the entries in [lo, hi) is at (lo + hi) // 2 and splits them on
+  axis depth % 3: the ones before it are not greater on that axis, the ones
+  after it not smaller.
+  """
+
+  def __init__(self, entries: List[_Entry]):
+    self.entries = entries
+    self._build(0, len(entries), 0)
+
+  def _build(self, lo, hi, depth):
+    if hi - lo <= 1:
+      return
+    axis = depth % 3
+    self.entries[lo:hi] = sorted(
+        self.entries[lo:hi], key=lambda entry: entry.coordinates[axis]
+    )
+    mid = (lo + hi) // 2
+    self._build(lo, mid, depth + 1)
+    self._build(mid + 1, hi, depth + 1)
+
+  def nearest(self, target, k, heap, lo=0, hi=None, depth=0):
+    """Adds the live entries nearest to 'target' to 'heap'.
+
+    'heap' holds up to 'k' (-squared distance, name, entry) tuples of the
+    nearest entries found so far, the farthest one first.
+    """
+    if hi is None:
+      hi = len(self.entries)
+    if lo >= hi:
+      return
+    mid = (lo + hi) // 2
+    entry = self.entries[mid]
+    if entry.alive:
+      item = (-_squared_distance(entry.coordinates, target), entry.name, entry)
+      if len(heap) < k:
+        heapq.heappush(heap, item)
+      elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+    axis = depth % 3
+    offset = target[axis] - entry.coordinates[axis]
+    if offset < 0:
+      near, far = (lo, mid), (mid + 1, hi)
+    else:
+      near, far = (mid + 1, hi), (lo, mid)
+    self.nearest(target, k, heap, *near, depth + 1)
+    # The other side is at least 'offset' away along the splitting axis.
+    if len(heap) < k or offset * offset < -heap[0][0]:
+      self.nearest(target, k, heap, *far, depth + 1)
+
+  def in_box(self, lower, upper, matches, lo=0, hi=None, depth=0):
+    """Adds the live entries within the box to 'matches'."""
+    if hi is None:
+      hi = len(self.entries)
+    if lo >= hi:
+      return
+    mid = (lo + hi) // 2
+    entry = self.entries[mid]
+    coordinates = entry.coordinates
+    if entry.alive and all(
+        low <= value <= high
+        for low, value, high in zip(lower, coordinates, upper)
+    ):
+      matches.append(entry)
+    axis = depth % 3
+    if lower[axis] <= coordinates[axis]:
+      self.in_box(lower, upper, matches, lo, mid, depth + 1)
+    if upper[axis] >= coordinates[axis]:
+      self.in_box(lower, upper, matches, mid + 1, hi, depth + 1)
+
+
+def _squared_distance(a: Coordinates, b: Coordinates) -> float:
+  return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2
+
+
+class SpatialIndex:
+  """Points by name, queryable by distance and by bounding box.
+
+  Not thread-safe, callers serialize access.
+  """
+
+  def __init__(self, points: Iterable[Tuple[str, Coordinates]] = ()):
+    """Builds the index.
+
+    Args:
+      points: (name, coordinates) pairs. Of several with the same name, the
+        last one is kept.
+    """
+    self._entries: Dict[str, _Entry] = {}
+    self._trees: List[Optional[_KdTree]] = []
+    self._dead = 0
+    for name, coordinates in points:
+      self._entries[name] = _Entry(name, tuple(coordinates))
+    self._rebuild()
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  def insert(self, name: str, coordinates: Coordinates) -> None:
+    """Adds the point, or moves it if it is already indexed."""
+    self.remove(name)
+    entry = self._entries[name] = _Entry(name, tuple(coordinates))
+    carry = [entry]
+    for size_bit, tree in enumerate(self._trees):
+      if tree is None:
+        self._trees[size_bit] = _KdTree(carry)
+        return
+      alive = [other for other in tree.entries if other.alive]
+      self._dead -= len(tree.entries) - len(alive)
+      carry.extend(alive)
+      self._trees[size_bit] = None
+    self._trees.append(_KdTree(carry))
+
+  def remove(self, name: str) -> None:
+    """Removes the point, if it is indexed."""
+    entry = self._entries.pop(name, None)
+    if entry is None:
+      return
+    entry.alive = False
+    self._dead += 1
+    if self._dead > len(self._entries):
+      self._rebuild()
+
+  def nearest(self, target: Coordinates, k: int) -> List[Match]:
+    """Returns the 'k' points nearest to 'target', the nearest first."""
+    if k <= 0:
+      return []
+    heap = []
+    for tree in self._trees:
+      if tree is not None:
+        tree.nearest(target, k, heap)
+    return sorted(
+        (
+            (entry.name, entry.coordinates, (-negative_distance) ** 0.5)
+            for negative_distance, _, entry in heap
+        ),
+        key=lambda match: (match[2], match[0]),
+    )
+
+  def within_radius(self, center: Coordinates, radius: float) -> List[Match]:
+    """Returns the points at most 'radius' from 'center', the nearest first."""
+    lower = tuple(value - radius for value in center)
+    upper = tuple(value + radius for value in center)
+    matches = []
+    for entry in self._in_box(lower, upper):
+      distance = _squared_distance(entry.coordinates, center) ** 0.5
+      if distance <= radius:
+        matches.append((entry.name, entry.coordinates, distance))
+    matches.sort(key=lambda match: (match[2], match[0]))
+    return matches
+
+  def in_box(
+      self, lower: Coordinates, upper: Coordinates
+  ) -> List[Tuple[str, Coordinates]]:
+    """Returns the points within the box, borders included, sorted by name."""
+    return sorted(
+        (entry.name, entry.coordinates) for entry in self._in_box(lower, upper)
+    )
+
+  def _in_box(self, lower, upper) -> List[_Entry]:
+    matches = []
+    for tree in self._trees:
+      if tree is not None:
+        tree.in_box(lower, upper, matches)
+    return matches
+
+  def _rebuild(self):
+    """Rebuilds the trees from the live points, dropping the dead ones."""
+    entries = list(self._entries.values())
+    self._trees = [None] * len(entries).bit_length()
+    self._dead = 0
+    start = 0
+    for size_bit in reversed(range(len(self._trees))):
+      size = 1 << size_bit
+      if len(entries) & size:
+        self._trees[size_bit] = _KdTree(entries[start : start + size])
+        start += size
@@ -0,0 +1,78 @@
+import random
+import unittest
+
+from services.point_storage import spatial_index
+
+
+def _distance(a, b):
+  return sum((x - y) ** 2 for x, y in zip(a, b)) ** 0.5
+
+
+class SpatialIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    self.random = random.Random(0)
+
+  def _random_coordinates(self):
+    return tuple(self.random.uniform(-10.0, 10.0) for _ in range(3))
+
+  def test_queries_match_brute_force(self):
+    points = {}
+    index = spatial_index.SpatialIndex()
+    # Inserts, moves and removes points, so that the trees get merged and
+    # rebuilt and hold dead entries.
+    for step in range(2000):
+      name = f"p{self.random.randrange(300)}"
+      if step % 4 == 3:
+        index.remove(name)
+        points.pop(name, None)
+      else:
+        coordinates = self._random_coordinates()
+        index.insert(name, coordinates)
+        points[name] = coordinates
+    self.assertEqual(len(index), len(points))
+
+    for _ in range(50):
+      target = self._random_coordinates()
+      expected = sorted(
+          (_distance(coordinates, target), name)
+          for name, coordinates in points.items()
+      )
+      nearest = index.nearest(target, 5)
+      self.assertEqual(
+          [name for name, _, _ in nearest], [name for _, name in expected[:5]]
+      )
+
+      within = index.within_radius(target, 4.0)
+      self.assertEqual(
+          [name for name, _, _ in within],
+          [name for distance, name in expected if distance <= 4.0],
+      )
+
+      lower = tuple(value - 3.0 for value in target)
+      upper = tuple(value + 3.0 for value in target)
+      self.assertEqual(
+          index.in_box(lower, upper),
+          sorted(
+              (name, coordinates)
+              for name, coordinates in points.items()
+              if all(
+                  low <= value <= high
+                  for low, value, high in zip(lower, coordinates, upper)
+              )
+          ),
+      )
+
+  def test_build_keeps_the_last_of_duplicate_names(self):
+    index = spatial_index.SpatialIndex(
+        [("a", (0.0, 0.0, 0.0)), ("a", (5.0, 0.0, 0.0))]
+    )
+    self.assertEqual(len(index), 1)
+    self.assertEqual(
+        index.nearest((0.0, 0.0, 0.0), 2), [("a", (5.0, 0.0, 0.0), 5.0)]
+    )
+
+
+if __name__ == "__main__":
+  unittest.main()
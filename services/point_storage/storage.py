@@ -0,0 +1,244 @@
+"""Storage backends holding the points: the platform's key-value store or SQLite.
+
+The servicer only talks to a StorageBackend. Deployed services use the
+key-value store, which all replicas share. The SQLite backend keeps the points
+in a local database file instead, so that the service runs without the
+platform, e.g. during development and in CI, and gives a baseline to profile
+the key-value store against.
+"""
+
+import abc
+import bisect
+import contextlib
+import sqlite3
+import threading
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from google.protobuf import any_pb2
+from services.point_storage import point_storage_service_pb2 as point_storage_proto
+
+# The number of rows SqliteBackend.iterate() reads from the database at a time.
+_ITERATE_BATCH_SIZE = 1000
+
+# The type URL of the Any messages holding a Point.
+_POINT_TYPE_URL = (
+    f"type.googleapis.com/{point_storage_proto.Point.DESCRIPTOR.full_name}"
+)
+
+
+class NotFoundError(RuntimeError):
+  """Raised when the requested point doesn't exist."""
+
+
+class StorageBackend(abc.ABC):
+  """Stores points by name. Implementations are thread-safe.
+
+  All methods raise RuntimeError if the storage fails.
+  """
+
+  @abc.abstractmethod
+  def put(self, name: str, point: point_storage_proto.Point) -> None:
+    """Stores the point, replacing the one with the same name."""
+
+  @abc.abstractmethod
+  def get(self, name: str) -> point_storage_proto.Point:
+    """Returns the point.
+
+    Raises:
+      NotFoundError: If there is no point with this name.
+    """
+
+  @abc.abstractmethod
+  def list_all(self) -> List[Tuple[str, any_pb2.Any]]:
+    """Returns (name, packed point) pairs of all points, sorted by name.
+
+    The points are packed so that callers can decode only the ones they need
+    at a time.
+    """
+
+  def iterate(
+      self, after: Optional[str] = None
+  ) -> Iterator[Tuple[str, any_pb2.Any]]:
+    """Yields (name, packed point) pairs of the points, sorted by name.
+
+    Backends that can read the points in batches only hold one batch at a
+    time. This default lists all points at once.
+
+    Args:
+      after: Only the points with greater names are yielded, if given.
+    """
+    entries = self.list_all()
+    start = 0
+    if after is not None:
+      start = bisect.bisect_right(entries, after, key=lambda entry: entry[0])
+    yield from entries[start:]
+
+  @abc.abstractmethod
+  def delete(self, name: str) -> None:
+    """Deletes the point. No-op if it doesn't exist."""
+
+
+def make_key(point_name: str) -> str:
+  return f"ai.intrinsic/points/{point_name}"
+
+
+# The prefix of the keys that GetAllSynchronous returns for the points.
+_STORED_KEY_PREFIX = f"kv_store/{make_key('')}"
+
+
+def point_name(stored_key: str) -> str:
+  """Returns the name of the point stored under 'stored_key'."""
+  return stored_key.removeprefix(_STORED_KEY_PREFIX)
+
+
+class KeyValueStoreBackend(StorageBackend):
+  """Stores the points in the platform's key-value store, one key per point.
+
+  The key-value store only returns all keys at once, so iterate() lists all
+  points.
+  """
+
+  def __init__(self, kvstore):
+    """Initializes the backend.
+
+    Args:
+      kvstore: The key-value store, e.g. pubsub.PubSub().KeyValueStore().
+    """
+    self.kvstore = kvstore
+
+  def put(self, name, point):
+    self.kvstore.Set(make_key(name), point)
+
+  def get(self, name):
+    try:
+      any_msg = self.kvstore.Get(make_key(name))
+    except RuntimeError as e:
+      if "NOT_FOUND" in str(e):
+        raise NotFoundError(f"point {name} not found") from e
+      raise
+    pt = point_storage_proto.Point()
+    any_msg.Unpack(pt)
+    return pt
+
+  def list_all(self):
+    all_points = self.kvstore.GetAllSynchronous(make_key("**"))
+    return sorted(
+        ((point_name(key), value) for key, value in all_points.items()),
+        key=lambda entry: entry[0],
+    )
+
+  def delete(self, name):
+    self.kvstore.Delete(make_key(name))
+
+
+class SqliteBackend(StorageBackend):
+  """Stores the points in a local SQLite database, one row per point.
+
+  The database runs in write-ahead log mode: reads don't wait for writes, and
+  a write only appends to the log instead of rewriting pages in place. Every
+  thread uses its own connection, so reads of different threads run in
+  parallel.
+  """
+
+  def __init__(self, path: str):
+    """Opens the database, creating it if needed.
+
+    Args:
+      path: The database file. Must be a file, since every thread opens it
+        separately.
+
+    Raises:
+      RuntimeError: If the database can't be opened.
+    """
+    self._path = path
+    self._local = threading.local()
+    with self._errors("open the database"):
+      connection = self._connection()
+      # Persists in the database file, so it only needs to be set once.
+      connection.execute("PRAGMA journal_mode=WAL")
+      connection.execute(
+          "CREATE TABLE IF NOT EXISTS points"
+          " (name TEXT PRIMARY KEY, point BLOB NOT NULL) WITHOUT ROWID"
+      )
+
+  def _connection(self) -> sqlite3.Connection:
+    connection = getattr(self._local, "connection", None)
+    if connection is None:
+      # In autocommit mode every statement is its own transaction.
+      connection = sqlite3.connect(
+          self._path, isolation_level=None, check_same_thread=False
+      )
+      # Waits for the write lock instead of failing at once.
+      connection.execute("PRAGMA busy_timeout=5000")
+      # Safe in WAL mode: the database can't be corrupted, only the latest
+      # writes can be lost if the machine loses power.
+      connection.execute("PRAGMA synchronous=NORMAL")
+      self._local.connection = connection
+    return connection
+
+  @contextlib.contextmanager
+  def _errors(self, action: str):
+    try:
+      yield
+    except sqlite3.Error as e:
+      raise RuntimeError(f"failed to {action} in {self._path}: {e}") from e
+
+  def put(self, name, point):
+    with self._errors(f"store point {name}"):
+      self._connection().execute(
+          "INSERT OR REPLACE INTO points (name, point) VALUES (?, ?)",
+          (name, point.SerializeToString()),
+      )
+
+  def get(self, name):
+    with self._errors(f"read point {name}"):
+      row = (
+          self._connection()
+          .execute("SELECT point FROM points WHERE name = ?", (name,))
+          .fetchone()
+      )
+    if row is None:
+      raise NotFoundError(f"point {name} not found")
+    return point_storage_proto.Point.FromString(row[0])
+
+  def list_all(self):
+    with self._errors("list the points"):
+      rows = (
+          self._connection()
+          .execute("SELECT name, point FROM points ORDER BY name")
+          .fetchall()
+      )
+    return [
+        (name, any_pb2.Any(type_url=_POINT_TYPE_URL, value=value))
+        for name, value in rows
+    ]
+
+  def iterate(self, after=None):
+    with self._errors("list the points"):
+      if after is None:
+        cursor = self._connection().execute(
+            "SELECT name, point FROM points ORDER BY name"
+        )
+      else:
+        cursor = self._connection().execute(
+            "SELECT name, point FROM points WHERE name > ? ORDER BY name",
+            (after,),
+        )
+    try:
+      while True:
+        with self._errors("list the points"):
+          rows = cursor.fetchmany(_ITERATE_BATCH_SIZE)
+        if not rows:
+          return
+        for name, value in rows:
+          yield name, any_pb2.Any(type_url=_POINT_TYPE_URL, value=value)
+    finally:
+      # Ends the read transaction if the caller stops early.
+      cursor.close()
+
+  def delete(self, name):
+    with self._errors(f"delete point {name}"):
+      self._connection().execute("DELETE FROM points WHERE name = ?", (name,))
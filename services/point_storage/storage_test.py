@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from services.point_storage import point_storage_service_pb2 as point_storage_proto
+from services.point_storage import storage
+
+
+class ListingBackend(storage.SqliteBackend):
+  """Iterates with the default of StorageBackend, by listing all points."""
+
+  def iterate(self, after=None):
+    return storage.StorageBackend.iterate(self, after)
+
+
+class IterateTest(unittest.TestCase):
+
+  def setUp(self):
+    super().setUp()
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.path = os.path.join(directory.name, "points.db")
+
+  def _fill(self, backend):
+    for name in ("c", "a", "d", "b", "e"):
+      backend.put(name, point_storage_proto.Point(x=ord(name)))
+
+  def _names(self, entries):
+    return [name for name, _ in entries]
+
+  def test_sqlite_reads_in_batches(self):
+    backend = storage.SqliteBackend(self.path)
+    self._fill(backend)
+    with mock.patch.object(storage, "_ITERATE_BATCH_SIZE", 2):
+      self.assertEqual(
+          self._names(backend.iterate()), ["a", "b", "c", "d", "e"]
+      )
+      self.assertEqual(self._names(backend.iterate("b")), ["c", "d", "e"])
+      name, packed = next(backend.iterate("d"))
+    point = point_storage_proto.Point()
+    self.assertTrue(packed.Unpack(point))
+    self.assertEqual((name, point.x), ("e", ord("e")))
+
+  def test_default_lists_all_points(self):
+    backend = ListingBackend(self.path)
+    self._fill(backend)
+    self.assertEqual(self._names(backend.iterate()), ["a", "b", "c", "d", "e"])
+    self.assertEqual(self._names(backend.iterate("bb")), ["c", "d", "e"])
+    self.assertEqual(self._names(backend.iterate("e")), [])
+
+
+if __name__ == "__main__":
+  unittest.main()
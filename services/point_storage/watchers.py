@@ -0,0 +1,60 @@
+"""Bounded queues of point changes for the clients watching the points.
+
+Changes are offered to every watcher by the thread that applies them, which
+must never wait for a slow client. So a watcher's queue has a fixed size, and
+once it is full the watcher stops queueing and is marked overflowed. The
+client is then sent a new snapshot instead of the changes it missed.
+"""
+
+import queue
+import threading
+from typing import Optional
+
+from services.point_storage import point_storage_service_pb2 as point_storage_proto
+
+
+class Watcher:
+  """The queued changes of the points one client watches."""
+
+  def __init__(self, prefix: str, max_queued: int):
+    """Initializes the watcher.
+
+    Args:
+      prefix: Only changes of points whose names start with it are queued.
+      max_queued: The number of changes after which the watcher overflows.
+    """
+    self.prefix = prefix
+    self._queue = queue.Queue(max_queued)
+    self._overflowed = threading.Event()
+
+  @property
+  def overflowed(self) -> bool:
+    """Whether changes were dropped since the last reset()."""
+    return self._overflowed.is_set()
+
+  def offer(self, change: point_storage_proto.PointChange) -> None:
+    """Queues the change if it is watched, without blocking."""
+    if not change.name.startswith(self.prefix) or self.overflowed:
+      return
+    try:
+      self._queue.put_nowait(change)
+    except queue.Full:
+      self._overflowed.set()
+
+  def reset(self) -> None:
+    """Drops the queued changes, once the client is sent a new snapshot."""
+    while True:
+      try:
+        self._queue.get_nowait()
+      except queue.Empty:
+        break
+    self._overflowed.clear()
+
+  def next_change(
+      self, timeout_seconds: float
+  ) -> Optional[point_storage_proto.PointChange]:
+    """Returns the next queued change, or None if none came in time."""
+    try:
+      return self._queue.get(timeout=timeout_seconds)
+    except queue.Empty:
+      return None
@@ -128,7 +128,6 @@ class PointsCrud(skill_interface.Skill):
       case "update":
         pt_name = params.update.point_name
         offset = params.update.offset
-        pt = self.get_point_by_name(stub, pt_name)
         try:
           logging.info(
               "Moving point %s by (%f, %f, %f)",
@@ -137,25 +136,22 @@ class PointsCrud(skill_interface.Skill):
               offset.y,
               offset.z,
           )
-          self.put(
-              stub,
-              pt_name,
-              pt.x + offset.x,
-              pt.y + offset.y,
-              pt.z + offset.z,
+          request = point_storage_proto.UpdateRequest(
+              name=pt_name, offset=offset
           )
+          response = stub.Update(request)
         except grpc.RpcError as e:
           self.log_rpc_error(e)
-          raise RuntimeError(f"Failed to store updated point {pt_name}") from e
+          raise RuntimeError(f"Failed to update point {pt_name}") from e
 
+        pt = response.point
         logging.info(
-            "Fetching point %s to confirm that it has been updated", pt_name
+            "Point %s is now at (%f, %f, %f)", pt_name, pt.x, pt.y, pt.z
         )
         result = points_crud_pb2.PointsCrudResult(
             update=points_crud_pb2.UpdateResult(
                 updated_point=point_storage_proto.NamedPoint(
-                    name=pt_name,
-                    point=self.get_point_by_name(stub, pt_name),
+                    name=pt_name, point=pt
                 )
             )
         )
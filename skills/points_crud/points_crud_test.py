@@ -47,6 +47,19 @@ class SuccessfulFakePointStorageServicer(
   ) -> point_storage_proto.GetResponse:
     return point_storage_proto.GetResponse(point=self._data[request.name])
 
+  def Update(
+      self,
+      request: point_storage_proto.UpdateRequest,
+      context: grpc.ServicerContext,
+  ) -> point_storage_proto.UpdateResponse:
+    pt = self._data[request.name]
+    self._data[request.name] = point_storage_proto.Point(
+        x=pt.x + request.offset.x,
+        y=pt.y + request.offset.y,
+        z=pt.z + request.offset.z,
+    )
+    return point_storage_proto.UpdateResponse(point=self._data[request.name])
+
   def GetAll(
       self,
       request: point_storage_proto.GetAllRequest,
@@ -88,6 +101,15 @@ class FailingFakePointStorageServicer(
   ) -> point_storage_proto.GetResponse:
     context.abort(grpc.StatusCode.NOT_FOUND, f"Point {request.name} not found")
 
+  def Update(
+      self,
+      request: point_storage_proto.UpdateRequest,
+      context: grpc.ServicerContext,
+  ) -> point_storage_proto.UpdateResponse:
+    context.abort(
+        grpc.StatusCode.INTERNAL, f"Failed to update point {request.name}"
+    )
+
   def GetAll(
       self,
       request: point_storage_proto.GetAllRequest,
@@ -225,7 +247,7 @@ class PointsCrudTest(unittest.TestCase):
         initial_state=_INITIAL_STATE,
         params=params,
         expected_result=expected_result,
-        failure_message="Failed to read point",
+        failure_message="Failed to update point A",
     )
 
   def test_delete(self):